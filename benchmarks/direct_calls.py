@@ -0,0 +1,153 @@
+"""
+Client-side overhead of the generated functions, with and without `direct_calls`:
+
+    python benchmarks/direct_calls.py postgresql://postgres@localhost/postgres
+
+The queries are generated against the database both ways, and then called with a connection stub,
+which returns the rows fetched beforehand at once, so that only the python side of a call is timed.
+Pass `--live` to time the round trips to the database as well.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+import asyncpg
+
+
+SCHEMA_SQL = """
+CREATE TEMP TABLE bench_account (
+    id serial PRIMARY KEY,
+    username text NOT NULL,
+    balance bigint NOT NULL
+);
+INSERT INTO bench_account (username, balance)
+SELECT 'user_' || i, i * 10 FROM generate_series(1, 100) AS i;
+"""
+
+QUERKY_SOURCE = """
+import os
+from querky.presets.asyncpg import use_preset
+
+qrk = use_preset(os.path.dirname(__file__), type_factory='dataclass+slots', direct_calls={direct})
+"""
+
+QUERIES_SOURCE = """
+from {package}.querky_def import qrk
+
+
+@qrk.query(shape='value', optional=False)
+def get_balance(account_id):
+    return f"SELECT balance FROM bench_account WHERE id = {{+account_id}}"
+
+
+@qrk.query('BenchAccount', shape='one')
+def get_account(account_id):
+    return f"SELECT id, username, balance FROM bench_account WHERE id = {{+account_id}}"
+
+
+@qrk.query('BenchAccount', shape='many')
+def select_accounts(limit):
+    return f"SELECT id, username, balance FROM bench_account ORDER BY id LIMIT {{+limit}}"
+"""
+
+# generated function -> (driver method, the SQL it runs, arguments)
+CALLS = {
+    'get_balance': ('fetchval', "SELECT balance FROM bench_account WHERE id = $1", (1, )),
+    'get_account': ('fetchrow', "SELECT id, username, balance FROM bench_account WHERE id = $1", (1, )),
+    'select_accounts': ('fetch', "SELECT id, username, balance FROM bench_account ORDER BY id LIMIT $1", (10, )),
+}
+
+
+class StubConnection:
+    def __init__(self, results: dict):
+        self.results = results
+
+    async def fetchval(self, sql, *args):
+        return self.results['fetchval']
+
+    async def fetchrow(self, sql, *args):
+        return self.results['fetchrow']
+
+    async def fetch(self, sql, *args):
+        return self.results['fetch']
+
+
+def write_package(root: str, package: str, direct: bool) -> None:
+    directory = os.path.join(root, package)
+    os.makedirs(directory)
+    with open(os.path.join(directory, '__init__.py'), 'w') as f:
+        f.write('')
+    with open(os.path.join(directory, 'querky_def.py'), 'w') as f:
+        f.write(QUERKY_SOURCE.format(direct=direct))
+    with open(os.path.join(directory, 'example.py'), 'w') as f:
+        f.write(QUERIES_SOURCE.format(package=package))
+
+
+async def generate(conn, package: str):
+    base_module = importlib.import_module(package)
+    qrk = importlib.import_module(f"{package}.querky_def").qrk
+    await qrk.generate(conn, base_modules=(base_module, ))
+    return importlib.import_module(f"{package}.queries.example")
+
+
+async def time_calls(func, conn, args: tuple, calls: int, repeat: int) -> float:
+    """
+    :return: best nanoseconds per call out of `repeat` runs.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            await func(conn, *args)
+        elapsed = (time.perf_counter() - start) / calls * 1e9
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def main(dsn: str, calls: int, repeat: int, live: bool) -> None:
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(SCHEMA_SQL)
+        # the stub hands out real records, so that the row factories do the same work
+        results = {
+            method: await getattr(conn, method)(sql, *args)
+            for method, sql, args in CALLS.values()
+        }
+
+        with tempfile.TemporaryDirectory() as root:
+            sys.path.insert(0, root)
+            write_package(root, 'bench_proxy', direct=False)
+            write_package(root, 'bench_direct', direct=True)
+            proxy = await generate(conn, 'bench_proxy')
+            direct = await generate(conn, 'bench_direct')
+
+            targets = [('stub', StubConnection(results), calls)]
+            if live:
+                # round trips are orders of magnitude slower
+                targets.append(('live', conn, max(1, calls // 100)))
+
+            print(f"{'query':<16} {'connection':<11} {'proxy, ns':>10} {'direct, ns':>11} {'saved':>7}")
+            for target, target_conn, n in targets:
+                for name, (_, _, args) in CALLS.items():
+                    proxy_ns = await time_calls(getattr(proxy, name), target_conn, args, n, repeat)
+                    direct_ns = await time_calls(getattr(direct, name), target_conn, args, n, repeat)
+                    saved = (proxy_ns - direct_ns) / proxy_ns * 100
+                    print(f"{name:<16} {target:<11} {proxy_ns:>10.0f} {direct_ns:>11.0f} {saved:>6.1f}%")
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dsn', help="database to generate the queries against")
+    parser.add_argument('--calls', type=int, default=100_000, help="calls per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs to take the best of")
+    parser.add_argument('--live', action='store_true', help="time the calls against the database as well")
+    args = parser.parse_args()
+    asyncio.run(main(args.dsn, args.calls, args.repeat, args.live))
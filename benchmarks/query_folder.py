@@ -0,0 +1,114 @@
+"""
+Folding a large input into batches with `querky.tools.query_folder`:
+
+    python benchmarks/query_folder.py --tuples 1000000
+
+No database is needed: only building the SQL texts and the arguments of the batches is timed.
+`sliced` is how `FoldArgs.args` used to split the input, copying the rest of it after every batch.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from querky.tools.query_folder import FoldArgs, FoldedQuery, UnnestQuery
+
+
+SQL = "INSERT INTO account (id, username, balance) VALUES {folded}"
+UNNEST_SQL = "INSERT INTO account (id, username, balance) SELECT * FROM {folded}"
+
+
+def make_tuples(n: int) -> list[tuple]:
+    return [(i, f"user_{i}", i * 10) for i in range(n)]
+
+
+def sliced(fold_args: FoldArgs, tuples: list[tuple]) -> list[list]:
+    args = []
+    while tuples:
+        batch, tuples = tuples[:fold_args.tuples_count_per_batch], tuples[fold_args.tuples_count_per_batch:]
+        args.append([value for t in batch for value in t])
+    return args
+
+
+def consume(batches) -> tuple[int, int]:
+    """
+    :return: number of batches and of distinct SQL texts.
+    """
+    count = 0
+    texts = set()
+    for sql, _ in batches:
+        count += 1
+        texts.add(sql)
+    return count, len(texts)
+
+
+async def aconsume(batches) -> tuple[int, int]:
+    count = 0
+    texts = set()
+    async for sql, _ in batches:
+        count += 1
+        texts.add(sql)
+    return count, len(texts)
+
+
+async def agenerate(tuples: list[tuple]):
+    for t in tuples:
+        yield t
+
+
+def report(label: str, seconds: float, batches: int | None = None, texts: int | None = None) -> None:
+    details = f"{batches} batches, {texts} SQL texts" if batches is not None else ''
+    print(f"{label:<32} {seconds * 1000:>9.1f} ms  {details}")
+
+
+def main(n: int, batch_length: int) -> None:
+    tuples = make_tuples(n)
+    print(f"{n} tuples, at most {batch_length} arguments per batch")
+
+    folded = FoldedQuery(SQL, tuple_len=3, batch_length=batch_length, enable_cache=True)
+    start = time.perf_counter()
+    sliced(folded.fold_args, tuples)
+    report('sliced (before)', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batches, texts = consume(folded.batches(tuples))
+    report('FoldedQuery.batches', time.perf_counter() - start, batches, texts)
+
+    start = time.perf_counter()
+    batches, texts = consume(folded.batches(iter(tuples)))
+    report('FoldedQuery.batches, iterator', time.perf_counter() - start, batches, texts)
+
+    start = time.perf_counter()
+    batches, texts = asyncio.run(aconsume(folded.abatches(agenerate(tuples))))
+    report('FoldedQuery.abatches', time.perf_counter() - start, batches, texts)
+
+    # odd sizes of the last batch: every one of them is a distinct SQL text, unless bucketed
+    sizes = range(n // 100, n // 100 + 200)
+    for pow2_buckets in (False, True):
+        query = FoldedQuery(SQL, tuple_len=3, batch_length=batch_length, enable_cache=True, pow2_buckets=pow2_buckets)
+        start = time.perf_counter()
+        texts = set()
+        count = 0
+        for size in sizes:
+            for sql, _ in query.batches(tuples[:size]):
+                count += 1
+                texts.add(sql)
+        report(f"{len(sizes)} sizes, pow2_buckets={pow2_buckets}", time.perf_counter() - start, count, len(texts))
+
+    unnest = UnnestQuery(
+        UNNEST_SQL,
+        types=('int8', 'text', 'int8'),
+        batch_size=folded.fold_args.tuples_count_per_batch
+    )
+    start = time.perf_counter()
+    batches, texts = consume(unnest.batches(tuples))
+    report('UnnestQuery.batches', time.perf_counter() - start, batches, texts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tuples', type=int, default=1_000_000, help="number of tuples to fold")
+    parser.add_argument('--batch-length', type=int, default=32767, help="maximum number of arguments per batch")
+    args = parser.parse_args()
+    main(args.tuples, args.batch_length)
@@ -1,9 +1,12 @@
+__version__ = "0.1.1"
+
 from .querky import Querky
 from .query import Query
 from .attr import attr
 from .subquery import subquery
 
 __all__ = [
+    "__version__",
     "Querky",
     "Query",
     "attr",
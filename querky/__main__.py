@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import typing
+
+from querky.querky import Querky
+
+
+def load_querky(target: str) -> Querky:
+    """
+    :param target: `module:attribute` of the `Querky` object, e.g. `querky_def:qrk`.
+    """
+    module_name, _, attribute = target.partition(':')
+    module = importlib.import_module(module_name)
+    qrk = getattr(module, attribute or 'qrk')
+    if not isinstance(qrk, Querky):
+        raise TypeError(f"{target} is not a Querky object")
+    return qrk
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='querky')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command, description in (
+            ('generate', "generate the code once"),
+            ('watch', "generate the code, then regenerate the modules affected by each change"),
+    ):
+        subparser = subparsers.add_parser(command, help=description)
+        subparser.add_argument('querky', help="`module:attribute` of the Querky object, e.g. `querky_def:qrk`")
+        subparser.add_argument('base_modules', nargs='+', help="packages containing the query modules, e.g. `sql`")
+        subparser.add_argument(
+            '--dsn',
+            default=os.environ.get('QUERKY_DSN', None),
+            help="database connection string, `QUERKY_DSN` environment variable by default"
+        )
+        subparser.add_argument('--concurrency', type=int, default=1, help="number of connections to prepare queries with")
+        if command == 'generate':
+            subparser.add_argument(
+                '--prefetch-workers',
+                type=int,
+                default=0,
+                help="number of processes rendering the SQL of the modules, so that it's prepared during the import"
+            )
+            subparser.add_argument(
+                '--check-plans',
+                action='store_true',
+                help="fail, if any of the query plans have regressed compared with the stored snapshots"
+            )
+        else:
+            subparser.add_argument('--interval', type=float, default=0.2, help="seconds between two directory scans")
+
+    return parser
+
+
+def main(argv: typing.Sequence[str] | None = None) -> None:
+    args = create_parser().parse_args(argv)
+    if args.dsn is None:
+        raise SystemExit("No connection string: pass --dsn or set QUERKY_DSN")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    # the project is imported the same way the generation script would
+    sys.path.insert(0, os.getcwd())
+
+    qrk = load_querky(args.querky)
+    if getattr(args, 'check_plans', False):
+        from querky.plan_snapshots import PlanSnapshots
+
+        if qrk.plan_snapshots is None:
+            qrk.plan_snapshots = PlanSnapshots()
+        qrk.plan_snapshots.check = True
+    base_modules = tuple([importlib.import_module(name) for name in args.base_modules])
+
+    # asyncpg is the only backend so far
+    from querky.presets import asyncpg as preset
+
+    if args.command == 'watch':
+        coro = preset.watch(
+            qrk,
+            args.dsn,
+            base_modules=base_modules,
+            concurrency=args.concurrency,
+            interval=args.interval
+        )
+    else:
+        coro = preset.generate(
+            qrk,
+            args.dsn,
+            base_modules=base_modules,
+            concurrency=args.concurrency,
+            prefetch_workers=args.prefetch_workers
+        )
+
+    try:
+        asyncio.run(coro)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
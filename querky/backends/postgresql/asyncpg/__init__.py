@@ -1,6 +1,9 @@
 from .contract import AsyncpgContract
+from .statement_cache import PreparedStatementCache, StatementCacheStats
 
 
 __all__ = [
     "AsyncpgContract",
+    "PreparedStatementCache",
+    "StatementCacheStats",
 ]
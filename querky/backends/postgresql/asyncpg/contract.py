@@ -1,16 +1,90 @@
 from __future__ import annotations
 
+import json
 import typing
+from contextlib import aclosing, asynccontextmanager
 
-from asyncpg import Connection
+from asyncpg import Connection, Pool, Record
+from asyncpg.exceptions import InterfaceError
 from asyncpg.types import Attribute, Type
 
-from querky.backends.postgresql.contract import PostgresqlContract
-from querky.base_types import TypeMetaData, ResultAttribute, QuerySignature
+from querky.backends.postgresql.contract import PostgresqlContract, quote_ident
+from querky.base_types import TypeMetaData, ResultAttribute, QuerySignature, QueryDescription
 from querky.backends.postgresql.dollar_sign_param_mapper import DollarSignParamMapper
 from querky.backends.postgresql.type_mapper import PostgresqlTypeMapper
+from querky.backends.postgresql.asyncpg.statement_cache import PreparedStatementCache
 if typing.TYPE_CHECKING:
     from querky.query import Query
+    from querky.result_shape import Prefetch
+    from querky.upsert import Upsert
+
+
+DIRECT_CALL_METHODS = {
+    'value': 'fetchval',
+    'one': 'fetchrow',
+    'all': 'fetch',
+    'status': 'execute',
+}
+
+
+# name of the statement generic plans are explained with
+GENERIC_PLAN_STATEMENT = "querky_generic_plan"
+
+
+# estimated number of rows of each table, -1 (never analyzed) is 0
+RELATION_ROWS_SQL_QUERY = """
+SELECT
+    name,
+    greatest(c.reltuples, 0)::float8
+FROM
+    unnest($1::text[]) AS name
+    JOIN pg_class c ON c.oid = to_regclass(name)
+"""
+
+
+# every user-defined relation column, type and function: if none of them changed, neither did query signatures
+SCHEMA_FINGERPRINT_SQL_QUERY = """
+WITH user_namespace AS (
+    SELECT
+        oid
+    FROM
+        pg_namespace
+    WHERE
+        nspname NOT IN ('pg_catalog', 'information_schema')
+        AND nspname NOT LIKE 'pg\\_toast%'
+        AND nspname NOT LIKE 'pg\\_temp%'
+)
+SELECT
+    md5(current_setting('server_version_num') || string_agg(item, ';' ORDER BY item))
+FROM (
+    SELECT
+        'a:' || attrelid::regclass::TEXT || '.' || attname || ':' || format_type(atttypid, atttypmod) || ':' || attnotnull
+    FROM
+        pg_attribute
+    INNER JOIN
+        pg_class
+    ON
+        pg_class.oid = pg_attribute.attrelid
+    WHERE
+        pg_class.relnamespace IN (SELECT oid FROM user_namespace)
+        AND attnum > 0
+        AND NOT attisdropped
+    UNION ALL
+    SELECT
+        't:' || oid::regtype::TEXT || ':' || typtype || ':' || typbasetype::regtype::TEXT
+    FROM
+        pg_type
+    WHERE
+        typnamespace IN (SELECT oid FROM user_namespace)
+    UNION ALL
+    SELECT
+        'f:' || oid::regprocedure::TEXT || ':' || prorettype::regtype::TEXT || ':' || proretset
+    FROM
+        pg_proc
+    WHERE
+        pronamespace IN (SELECT oid FROM user_namespace)
+) AS schema_items(item)
+"""
 
 
 def _sync_not_implemented():
@@ -18,8 +92,9 @@ def _sync_not_implemented():
 
 
 class AsyncpgContract(PostgresqlContract):
-    def __init__(self, type_mapper: PostgresqlTypeMapper):
+    def __init__(self, type_mapper: PostgresqlTypeMapper, statement_cache: PreparedStatementCache | None = None):
         self.type_mapper = type_mapper
+        self.statement_cache = statement_cache
 
     def create_param_mapper(self, query: Query) -> DollarSignParamMapper:
         return DollarSignParamMapper(query)
@@ -58,29 +133,71 @@ class AsyncpgContract(PostgresqlContract):
             "from asyncpg import Connection"
         })
 
-    async def get_query_signature(self, db: Connection, query: Query) -> QuerySignature:
-        prepared_stmt = await db.prepare(query.sql)
+    async def describe_query(self, db: Connection, query: Query) -> QueryDescription:
+        return await self.describe_sql(db, query.sql)
+
+    async def describe_sql(self, db: Connection, sql: str) -> QueryDescription:
+        prepared_stmt = await db.prepare(sql)
         raw_params: typing.Tuple[Type, ...] = prepared_stmt.get_parameters()
         raw_attributes: typing.Tuple[Attribute, ...] = prepared_stmt.get_attributes()
         del prepared_stmt
 
+        await self.type_mapper.resolve_pg_types(
+            self,
+            db,
+            {
+                *[param.oid for param in raw_params],
+                *[attrib.type.oid for attrib in raw_attributes]
+            }
+        )
+
         params = tuple(
             [
-                await self.type_mapper.get_type_knowledge(self, db, param.oid)
+                await self.type_mapper.describe_type(self, db, param.oid)
                 for param in raw_params
             ]
         )
 
         attributes = tuple(
             [
-                ResultAttribute(index, attrib.name, await self.type_mapper.get_type_knowledge(self, db, attrib.type.oid))
-                for attrib, index in zip(raw_attributes, range(len(raw_attributes)))
+                (attrib.name, await self.type_mapper.describe_type(self, db, attrib.type.oid))
+                for attrib in raw_attributes
+            ]
+        )
+
+        return QueryDescription(parameters=params, attributes=attributes)
+
+    def describe_query_sync(self, db, query: Query) -> QueryDescription:
+        _sync_not_implemented()
+
+    def get_query_signature_from_description(self, description: QueryDescription) -> QuerySignature:
+        params = tuple(
+            [
+                self.type_mapper.get_type_knowledge_from_description(raw_type)
+                for raw_type in description.parameters
+            ]
+        )
+
+        attributes = tuple(
+            [
+                ResultAttribute(index, name, self.type_mapper.get_type_knowledge_from_description(raw_type))
+                for index, (name, raw_type) in enumerate(description.attributes)
             ]
         )
 
-        qs = QuerySignature(parameters=params, attributes=attributes)
+        return QuerySignature(parameters=params, attributes=attributes)
+
+    async def get_query_signature(self, db: Connection, query: Query) -> QuerySignature:
+        return self.get_query_signature_from_description(await self.describe_query(db, query))
+
+    async def prepare_generate(self, db: Connection | Pool) -> None:
+        self.type_mapper.reset_catalog()
 
-        return qs
+    async def get_schema_fingerprint(self, db: Connection) -> str:
+        return await db.fetchval(SCHEMA_FINGERPRINT_SQL_QUERY)
+
+    def get_schema_fingerprint_sync(self, db) -> str:
+        _sync_not_implemented()
 
     def get_query_signature_sync(self, db, query: Query) -> QuerySignature:
         _sync_not_implemented()
@@ -88,22 +205,190 @@ class AsyncpgContract(PostgresqlContract):
     def is_async(self) -> bool:
         return True
 
+    def is_pool(self, db) -> bool:
+        return isinstance(db, Pool)
+
+    def get_immutable_types(self) -> typing.Tuple[type, ...]:
+        return (Record, )
+
+    def is_in_transaction(self, conn: Connection) -> bool:
+        try:
+            return conn.is_in_transaction()
+        except InterfaceError:
+            # released back to the pool, which has ended whatever transaction it had open
+            return False
+
+    async def explain(self, conn: Connection, sql: str, bound_params: typing.List) -> typing.Any:
+        plan = await conn.fetchval(self.generate_explain_sql(sql), *bound_params)
+        # unless a codec for json has been set on the connection
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan
+
+    async def explain_generic(self, conn: Connection, sql: str, param_count: int) -> typing.Any:
+        prepared = False
+        try:
+            async with conn.transaction():
+                await conn.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+                await conn.execute(f"PREPARE {GENERIC_PLAN_STATEMENT} AS {sql}")
+                prepared = True
+                plan = await conn.fetchval(self.generate_explain_generic_sql(GENERIC_PLAN_STATEMENT, param_count))
+        finally:
+            # prepared statements outlive transactions
+            if prepared:
+                await conn.execute(f"DEALLOCATE {GENERIC_PLAN_STATEMENT}")
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan
+
+    async def get_relation_rows(self, conn: Connection, relations: typing.Sequence[typing.Tuple[str, str]]) -> dict[str, float]:
+        rows = await conn.fetch(
+            RELATION_ROWS_SQL_QUERY,
+            [f"{quote_ident(schema)}.{quote_ident(name)}" for schema, name in relations]
+        )
+        rows_by_name = {row[0]: row[1] for row in rows}
+        return {
+            f"{schema}.{name}": rows_by_name.get(f"{quote_ident(schema)}.{quote_ident(name)}", 0)
+            for schema, name in relations
+        }
+
+    def acquire_connection(self, db: Connection | Pool, transaction: bool = False) -> typing.AsyncContextManager[Connection]:
+        if transaction:
+            return self._acquire_in_transaction(db)
+        if isinstance(db, Pool):
+            return db.acquire()
+        return super().acquire_connection(db)
+
+    @asynccontextmanager
+    async def _acquire_in_transaction(self, db: Connection | Pool) -> typing.AsyncIterator[Connection]:
+        async with self.acquire_connection(db) as conn, conn.transaction():
+            yield conn
+
+    def generate_direct_call(self, method: str, conn: str, sql: str, args: str) -> str:
+        call_args = f"{sql}, {args}" if args else sql
+        return f"await {conn}.{DIRECT_CALL_METHODS[method]}({call_args})"
+
+    def can_call_directly(self) -> bool:
+        # direct calls would go around the statement cache
+        return self.statement_cache is None
+
     async def fetch_value(self, conn: Connection, query: Query, bound_params: typing.List):
+        if self.statement_cache is not None:
+            return await self.statement_cache.run(conn, query, 'fetchval', bound_params)
         return await conn.fetchval(query.sql, *bound_params)
 
     async def fetch_one(self, conn: Connection, query: Query, bound_params: typing.List):
+        if self.statement_cache is not None:
+            return await self.statement_cache.run(conn, query, 'fetchrow', bound_params)
         return await conn.fetchrow(query.sql, *bound_params)
 
     async def fetch_all(self, conn: Connection, query: Query, bound_params: typing.List):
+        if self.statement_cache is not None:
+            return await self.statement_cache.run(conn, query, 'fetch', bound_params)
         return await conn.fetch(query.sql, *bound_params)
 
     async def fetch_column(self, conn: Connection, query: Query, bound_params: typing.List):
-        rows = await conn.fetch(query.sql, *bound_params)
+        rows = await self.fetch_all(conn, query, bound_params)
         return [row[0] for row in rows]
 
     async def fetch_status(self, conn: Connection, query: Query, bound_params: typing.List):
+        if self.statement_cache is not None:
+            return await self.statement_cache.execute(conn, query, bound_params)
         return await conn.execute(query.sql, *bound_params)
 
+    async def execute_many(self, conn: Connection, query: Query, bound_params_seq: typing.Sequence[typing.List]) -> None:
+        if self.statement_cache is not None:
+            await self.statement_cache.run(conn, query, 'executemany', (bound_params_seq, ))
+        else:
+            await conn.executemany(query.sql, bound_params_seq)
+
+    async def fetch_many(self, conn: Connection, query: Query, bound_params_seq: typing.Sequence[typing.List]):
+        if self.statement_cache is not None:
+            return await self.statement_cache.run(conn, query, 'fetchmany', (bound_params_seq, ))
+        return await conn.fetchmany(query.sql, bound_params_seq)
+
+    async def copy_records(
+            self,
+            conn: Connection,
+            query: Query,
+            table: str,
+            columns: typing.Sequence[str],
+            records: typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence]
+    ) -> int:
+        schema_name, _, table_name = table.rpartition('.')
+        # binary COPY, records are streamed to the server as they are iterated over
+        status = await conn.copy_records_to_table(
+            table_name,
+            records=records,
+            columns=columns,
+            schema_name=schema_name or None
+        )
+        return int(status.rpartition(' ')[2])
+
+    async def upsert_records(
+            self,
+            conn: Connection,
+            query: Query,
+            table: str,
+            columns: typing.Sequence[str],
+            upsert: Upsert,
+            chunks: typing.AsyncIterable[typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence]]
+    ) -> typing.List | int:
+        stage = self.get_staging_table_name(table, columns)
+        merge_sql = self.generate_merge_staging_table_sql(table, columns, upsert)
+        truncate_sql = self.generate_truncate_staging_table_sql(table, columns)
+        single_key = len(upsert.conflict) == 1
+
+        keys = []
+        count = 0
+        async with conn.transaction():
+            await conn.execute(self.generate_create_staging_table_sql(table, columns))
+            async for chunk in chunks:
+                await conn.copy_records_to_table(stage, records=chunk, columns=columns)
+                if upsert.returning:
+                    rows = await conn.fetch(merge_sql)
+                    if single_key:
+                        keys.extend([row[0] for row in rows])
+                    else:
+                        keys.extend([tuple(row) for row in rows])
+                else:
+                    status = await conn.execute(merge_sql)
+                    count += int(status.rpartition(' ')[2])
+                # the staging table is left empty, so it can be reused later in the same transaction
+                await conn.execute(truncate_sql)
+
+        if upsert.returning:
+            return keys
+        return count
+
+    async def fetch_chunks(self, conn: Connection, query: Query, bound_params: typing.List, prefetch: Prefetch):
+        # the cursor is closed before the transaction, as soon as this generator is closed
+        chunks = self._fetch_chunks(conn, query, bound_params, prefetch.start())
+        # server-side cursors only live inside of a transaction
+        if conn.is_in_transaction():
+            async with aclosing(chunks):
+                async for rows in chunks:
+                    yield rows
+        else:
+            async with conn.transaction(), aclosing(chunks):
+                async for rows in chunks:
+                    yield rows
+
+    async def _fetch_chunks(self, conn: Connection, query: Query, bound_params: typing.List, prefetch: Prefetch):
+        if self.statement_cache is not None:
+            stmt = await self.statement_cache.get(conn, query)
+            cursor = await stmt.cursor(*bound_params)
+        else:
+            cursor = await conn.cursor(query.sql, *bound_params)
+        while True:
+            size = prefetch.next_size()
+            rows = await cursor.fetch(size)
+            if rows:
+                prefetch.observe(rows)
+                yield rows
+            if len(rows) < size:
+                return
+
     def fetch_value_sync(self, conn, query: Query, bound_params):
         _sync_not_implemented()
 
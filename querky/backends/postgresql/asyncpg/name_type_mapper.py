@@ -151,7 +151,7 @@ DEFAULT_TYPEMAP = {
 
 
 class AsyncpgNameTypeMapper(PostgresqlNameTypeMapper):
-    def __init__(self, typemap: dict[str, dict[str, TypeMetaData]] | None = None):
+    def __init__(self, typemap: dict[str, dict[str, TypeMetaData]] | None = None, preload_catalog: bool = False):
         if typemap is None:
             typemap = DEFAULT_TYPEMAP
-        super().__init__(typemap)
+        super().__init__(typemap, preload_catalog=preload_catalog)
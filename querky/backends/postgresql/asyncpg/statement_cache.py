@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import inspect
+import typing
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from asyncpg import Connection
+from asyncpg.exceptions import InvalidCachedStatementError
+from asyncpg.pool import PoolConnectionProxy
+from asyncpg.prepared_stmt import PreparedStatement
+
+if typing.TYPE_CHECKING:
+    from querky.query import Query
+
+
+@dataclass(slots=True)
+class StatementCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class _ConnectionStatements:
+    __slots__ = ('lru', 'pinned')
+
+    def __init__(self) -> None:
+        self.lru: OrderedDict[Query, PreparedStatement] = OrderedDict()
+        self.pinned: dict[Query, PreparedStatement] = dict()
+
+
+def _can_rewrap() -> bool:
+    # a statement prepared on a pooled connection can't be used after the connection is released back to the pool,
+    # even though the server-side statement is still there: reusing it on the next acquisition relies on
+    # asyncpg internals, so it's only done if they are as expected (see the upper bound of the `asyncpg` extra)
+    try:
+        params = list(inspect.signature(PreparedStatement.__init__).parameters)
+    except (TypeError, ValueError):
+        return False
+    return (
+        params == ['self', 'connection', 'query', 'state']
+        and all(hasattr(PreparedStatement, name) for name in ('_query', '_state', '_con_release_ctr'))
+        and hasattr(Connection, '_pool_release_ctr')
+        and hasattr(PoolConnectionProxy, '_con')
+    )
+
+
+CAN_REWRAP = _can_rewrap()
+
+
+def _unwrap(conn: Connection | PoolConnectionProxy) -> Connection | None:
+    """
+    :return: the connection the statements are kept for, None if they can't be kept.
+    """
+    if isinstance(conn, PoolConnectionProxy):
+        if not CAN_REWRAP:
+            return None
+        # proxies are created anew on each `pool.acquire()`, statements live as long as the underlying connection
+        return conn._con
+    return conn
+
+
+def _rewrap(conn: Connection, stmt: PreparedStatement) -> PreparedStatement:
+    # the connection has been released back to the pool and acquired again since the statement was prepared
+    if CAN_REWRAP and stmt._con_release_ctr != conn._pool_release_ctr:
+        stmt = PreparedStatement(conn, stmt._query, stmt._state)
+    return stmt
+
+
+class PreparedStatementCache:
+    def __init__(self, max_size: int = 1024):
+        """
+        Explicit per-connection prepared statement cache, keyed on `Query`.
+        Statements are prepared with the public `Connection.prepare`. They are kept across the acquisitions
+        of a pooled connection only if the asyncpg internals this takes are there (`CAN_REWRAP`),
+        otherwise the statements of pooled connections are prepared anew every time.
+
+        :param max_size: maximum number of unpinned statements per connection.
+                         Least recently used ones are evicted first.
+        """
+        if max_size < 0:
+            raise ValueError("max_size must be non-negative")
+        self.max_size = max_size
+        self.stats = StatementCacheStats()
+        self.pinned: set[Query] = set()
+        self._connections: weakref.WeakKeyDictionary[Connection, _ConnectionStatements] = weakref.WeakKeyDictionary()
+
+    def pin(self, query: Query) -> None:
+        """
+        Pinned queries are never evicted and do not count towards `max_size`.
+        """
+        self.pinned.add(query)
+        for statements in self._connections.values():
+            if (stmt := statements.lru.pop(query, None)) is not None:
+                statements.pinned[query] = stmt
+
+    def unpin(self, query: Query) -> None:
+        self.pinned.discard(query)
+        for statements in self._connections.values():
+            if (stmt := statements.pinned.pop(query, None)) is not None:
+                statements.lru[query] = stmt
+                self._evict(statements)
+
+    def _evict(self, statements: _ConnectionStatements) -> None:
+        while len(statements.lru) > self.max_size:
+            statements.lru.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _statements(self, conn: Connection) -> _ConnectionStatements:
+        if (statements := self._connections.get(conn, None)) is None:
+            statements = _ConnectionStatements()
+            self._connections[conn] = statements
+        return statements
+
+    async def get(self, conn: Connection | PoolConnectionProxy, query: Query) -> PreparedStatement:
+        if (unwrapped := _unwrap(conn)) is None:
+            self.stats.misses += 1
+            return await conn.prepare(query.sql)
+        conn = unwrapped
+        statements = self._statements(conn)
+
+        if query in self.pinned:
+            storage = statements.pinned
+            stmt = storage.get(query, None)
+        else:
+            storage = statements.lru
+            if (stmt := storage.get(query, None)) is not None:
+                storage.move_to_end(query)
+
+        if stmt is not None:
+            self.stats.hits += 1
+            stmt = _rewrap(conn, stmt)
+            storage[query] = stmt
+            return stmt
+
+        self.stats.misses += 1
+        stmt = await conn.prepare(query.sql)
+        storage[query] = stmt
+        if storage is statements.lru:
+            self._evict(statements)
+        return stmt
+
+    def invalidate(self, conn: Connection | PoolConnectionProxy, query: Query) -> None:
+        if (unwrapped := _unwrap(conn)) is None:
+            return
+        if (statements := self._connections.get(unwrapped, None)) is not None:
+            statements.lru.pop(query, None)
+            statements.pinned.pop(query, None)
+
+    def clear(self) -> None:
+        self._connections.clear()
+
+    def size(self, conn: Connection | PoolConnectionProxy) -> int:
+        if (unwrapped := _unwrap(conn)) is None:
+            return 0
+        if (statements := self._connections.get(unwrapped, None)) is None:
+            return 0
+        return len(statements.lru) + len(statements.pinned)
+
+    async def _run(
+            self,
+            conn: Connection | PoolConnectionProxy,
+            query: Query,
+            call: typing.Callable[[PreparedStatement], typing.Awaitable]
+    ):
+        stmt = await self.get(conn, query)
+        try:
+            return await call(stmt)
+        except InvalidCachedStatementError:
+            # schema has changed: the statement is re-prepared once,
+            # unless we're inside a transaction, which is aborted by now anyway
+            self.invalidate(conn, query)
+            if conn.is_in_transaction():
+                raise
+        stmt = await self.get(conn, query)
+        return await call(stmt)
+
+    async def run(self, conn: Connection | PoolConnectionProxy, query: Query, method: str, params: typing.Sequence):
+        """
+        Runs `PreparedStatement.<method>(*params)` of the query's statement on this connection.
+        """
+        return await self._run(conn, query, lambda stmt: getattr(stmt, method)(*params))
+
+    async def execute(self, conn: Connection | PoolConnectionProxy, query: Query, params: typing.Sequence) -> str:
+        async def call(stmt: PreparedStatement) -> str:
+            await stmt.fetch(*params)
+            return stmt.get_statusmsg()
+
+        return await self._run(conn, query, call)
+
+
+__all__ = [
+    "CAN_REWRAP",
+    "PreparedStatementCache",
+    "StatementCacheStats",
+]
@@ -1,7 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import typing
 from abc import ABC
 
 from querky.contract import Contract
+if typing.TYPE_CHECKING:
+    from querky.upsert import Upsert
+
+
+# longer identifiers are silently truncated by the server
+MAX_IDENTIFIER_BYTES = 63
+STAGING_TABLE_PREFIX = "_querky_stage_"
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_qualified_ident(name: str) -> str:
+    return '.'.join([quote_ident(part) for part in name.split('.')])
 
 
 class PostgresqlContract(Contract, ABC):
-    pass
+    def generate_explain_sql(self, sql: str) -> str:
+        return f"EXPLAIN (ANALYZE false, FORMAT JSON) {sql}"
+
+    def generate_explain_generic_sql(self, statement: str, param_count: int) -> str:
+        """
+        `EXPLAIN` of a statement prepared with `plan_cache_mode = force_generic_plan`:
+        the values of the parameters don't matter then, so they are all NULL.
+        Unlike `EXPLAIN (GENERIC_PLAN)`, it doesn't require PostgreSQL 16.
+        """
+        args = f"({', '.join(['NULL'] * param_count)})" if param_count else ''
+        return f"EXPLAIN (VERBOSE, FORMAT JSON) EXECUTE {statement}{args}"
+
+    def get_staging_table_name(self, table: str, columns: typing.Sequence[str]) -> str:
+        """
+        The staging table lives until the end of the outer transaction, which might upsert into the same table again,
+        so the name depends on the columns as well: another set of them gets its own staging table.
+        """
+        key = f"{table}({','.join(columns)})"
+        suffix = '_' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+        encoded = (STAGING_TABLE_PREFIX + table.replace('.', '_')).encode('utf-8')
+        # truncated by the byte, and not in the middle of a character
+        head = encoded[:MAX_IDENTIFIER_BYTES - len(suffix)].decode('utf-8', errors='ignore')
+        return head + suffix
+
+    def generate_create_staging_table_sql(self, table: str, columns: typing.Sequence[str]) -> str:
+        # the staging table copies column types from the target table and is dropped along with the transaction
+        return (
+            f"CREATE TEMP TABLE IF NOT EXISTS {quote_ident(self.get_staging_table_name(table, columns))} "
+            f"ON COMMIT DROP AS "
+            f"SELECT {', '.join([quote_ident(c) for c in columns])} "
+            f"FROM {quote_qualified_ident(table)} "
+            f"WITH NO DATA"
+        )
+
+    def generate_merge_staging_table_sql(self, table: str, columns: typing.Sequence[str], upsert: Upsert) -> str:
+        cols = ', '.join([quote_ident(c) for c in columns])
+        conflict = ', '.join([quote_ident(c) for c in upsert.conflict])
+        update = upsert.get_update_columns(columns)
+        if update:
+            action = "DO UPDATE SET " + ', '.join([
+                f"{quote_ident(c)} = EXCLUDED.{quote_ident(c)}"
+                for c in update
+            ])
+        else:
+            action = "DO NOTHING"
+        # a row can't be affected twice by the same statement: the last one of the duplicates in the chunk wins,
+        # the staging table being filled in the order of the rows and emptied after every chunk
+        sql = (
+            f"INSERT INTO {quote_qualified_ident(table)} ({cols}) "
+            f"SELECT DISTINCT ON ({conflict}) {cols} FROM {quote_ident(self.get_staging_table_name(table, columns))} "
+            f"ORDER BY {conflict}, ctid DESC "
+            f"ON CONFLICT ({conflict}) {action}"
+        )
+        if upsert.returning:
+            sql += f" RETURNING {conflict}"
+        return sql
+
+    def generate_truncate_staging_table_sql(self, table: str, columns: typing.Sequence[str]) -> str:
+        return f"TRUNCATE {quote_ident(self.get_staging_table_name(table, columns))}"
@@ -31,11 +31,7 @@ class DollarSignParamMapper(ParamMapper[DollarSignMappedParam]):
                 ) from ex
 
     def map_params(self, *args, **kwargs):
-        bound = self.query.sig.bind(*args, **kwargs)
-        return [
-            bound.arguments[param.name]
-            for param in self.params
-        ]
+        return self.binder(*args, **kwargs)
 
     def create_param(self, index: int, name: str, param: Parameter) -> M:
         return DollarSignMappedParam(self, index, name, param)
@@ -1,22 +1,51 @@
-from querky.base_types import TypeKnowledge, TypeMetaData
+import asyncio
+import typing
+
+from querky.base_types import TypeKnowledge, TypeMetaData, RawType
 from querky.contract import Contract
 from querky.backends.postgresql.type_mapper import PostgresqlTypeMapper
 
 
-GET_PG_TYPE_SQL_QUERY = """
-SELECT 
-    oid::regtype::TEXT AS type_string, 
-    typnamespace::regnamespace::TEXT AS namespace_string
-FROM   
+PG_TYPE_COLUMNS = """
+    oid,
+    oid::regtype::TEXT AS type_string,
+    typnamespace::regnamespace::TEXT AS namespace_string,
+    typbasetype AS base_oid,
+    typelem AS elem_oid
+"""
+
+
+GET_PG_TYPES_SQL_QUERY = f"""
+SELECT
+    {PG_TYPE_COLUMNS}
+FROM
+    pg_type
+WHERE
+    oid = ANY($1::OID[])
+"""
+
+
+GET_ALL_PG_TYPES_SQL_QUERY = f"""
+SELECT
+    {PG_TYPE_COLUMNS}
+FROM
     pg_type
-WHERE  
-    oid = $1
 """
 
 
 class PostgresqlNameTypeMapper(PostgresqlTypeMapper):
-    def __init__(self, typemap: dict[str, dict[str, TypeMetaData]]):
+    def __init__(self, typemap: dict[str, dict[str, TypeMetaData]], preload_catalog: bool = False):
+        """
+        :param typemap: schema name -> type name -> python type.
+        :param preload_catalog: fetch the whole `pg_type` catalog with a single query
+                                the first time a type is needed during a `generate` run,
+                                instead of fetching the types of each query as they come.
+        """
+        # oid -> pg_type row, shared by all the queries and `generate` runs
         self.type_cache = dict()
+        self.preload_catalog = preload_catalog
+        self._catalog_loaded = False
+        self._catalog_lock: asyncio.Lock | None = None
         # копируем
         self.typemap = {
             schema_name: {
@@ -32,18 +61,96 @@ class PostgresqlNameTypeMapper(PostgresqlTypeMapper):
         s = self.typemap[schema]
         s[type_name] = metadata
 
+    def clear_cache(self) -> None:
+        """
+        OIDs of user-defined types differ between databases:
+        call it before generating against another database with the same mapper.
+        """
+        self.type_cache.clear()
+        self._catalog_loaded = False
+
+    def reset_catalog(self) -> None:
+        # the snapshot is taken once per `generate` run
+        self._catalog_loaded = False
+
+    def _cache_pg_types(self, pg_types: typing.Iterable) -> None:
+        for pg_type in pg_types:
+            self.type_cache[pg_type['oid']] = pg_type
+
+    def _get_missing_oids(self, oids: typing.Iterable[int]) -> set[int]:
+        return {oid for oid in oids if oid not in self.type_cache}
+
+    def _get_dependency_oids(self, oids: typing.Iterable[int]) -> set[int]:
+        # domains need their base types, arrays need their element types
+        dependencies = set()
+        for oid in oids:
+            pg_type = self.type_cache.get(oid, None)
+            if pg_type is None:
+                continue
+            if pg_type['base_oid']:
+                dependencies.add(pg_type['base_oid'])
+            if pg_type['type_string'].endswith('[]') and pg_type['elem_oid']:
+                dependencies.add(pg_type['elem_oid'])
+        return self._get_missing_oids(dependencies)
+
+    async def _ensure_catalog(self, contract: Contract, conn) -> None:
+        if self._catalog_lock is None:
+            self._catalog_lock = asyncio.Lock()
+        async with self._catalog_lock:
+            if not self._catalog_loaded:
+                self._cache_pg_types(await contract.raw_fetch(conn, GET_ALL_PG_TYPES_SQL_QUERY, ()))
+                self._catalog_loaded = True
+
+    async def resolve_pg_types(self, contract: Contract, conn, oids: typing.Iterable[int]) -> None:
+        """
+        Fetches every type not cached yet with a single query, along with the types they depend on.
+        """
+        if self.preload_catalog and not self._catalog_loaded:
+            await self._ensure_catalog(contract, conn)
+        missing = self._get_missing_oids(oids)
+        while missing:
+            self._cache_pg_types(await contract.raw_fetch(conn, GET_PG_TYPES_SQL_QUERY, (list(missing), )))
+            missing = self._get_dependency_oids(missing)
+
+    def resolve_pg_types_sync(self, contract: Contract, conn, oids: typing.Iterable[int]) -> None:
+        if self.preload_catalog and not self._catalog_loaded:
+            self._cache_pg_types(contract.raw_fetch_sync(conn, GET_ALL_PG_TYPES_SQL_QUERY, ()))
+            self._catalog_loaded = True
+        missing = self._get_missing_oids(oids)
+        while missing:
+            self._cache_pg_types(contract.raw_fetch_sync(conn, GET_PG_TYPES_SQL_QUERY, (list(missing), )))
+            missing = self._get_dependency_oids(missing)
+
     async def get_pg_type(self, contract: Contract, conn, oid: int):
         if (pg_type := self.type_cache.get(oid, None)) is None:
-            pg_type = await contract.raw_fetchone(conn, GET_PG_TYPE_SQL_QUERY, (oid, ))
-            self.type_cache[pg_type] = pg_type
+            await self.resolve_pg_types(contract, conn, (oid, ))
+            pg_type = self.type_cache[oid]
         return pg_type
 
     def get_pg_type_sync(self, contract: Contract, conn, oid: int):
         if (pg_type := self.type_cache.get(oid, None)) is None:
-            pg_type = contract.raw_fetchone_sync(conn, GET_PG_TYPE_SQL_QUERY, (oid, ))
-            self.type_cache[pg_type] = pg_type
+            self.resolve_pg_types_sync(contract, conn, (oid, ))
+            pg_type = self.type_cache[oid]
+        return pg_type
+
+    def _get_domain_base(self, pg_type):
+        # domains over domains are followed down to the first type which is not a domain
+        while pg_type['base_oid']:
+            pg_type = self.type_cache[pg_type['base_oid']]
         return pg_type
 
+    def _describe_pg_type(self, pg_type) -> RawType:
+        raw_type = (pg_type['namespace_string'], pg_type['type_string'])
+        if pg_type['base_oid']:
+            base = self._get_domain_base(pg_type)
+            return *raw_type, base['namespace_string'], base['type_string']
+        if pg_type['type_string'].endswith('[]') and pg_type['elem_oid']:
+            elem = self.type_cache[pg_type['elem_oid']]
+            if elem['base_oid']:
+                base = self._get_domain_base(elem)
+                return *raw_type, base['namespace_string'], f"{base['type_string']}[]"
+        return raw_type
+
     def get_type_knowledge_impl(self, pg_type) -> TypeKnowledge:
         basename: str = pg_type['type_string']
         schema: str = pg_type['namespace_string']
@@ -68,7 +175,30 @@ class PostgresqlNameTypeMapper(PostgresqlTypeMapper):
         )
 
     async def get_type_knowledge(self, contract: Contract, conn, oid: int) -> TypeKnowledge:
-        return self.get_type_knowledge_impl(await self.get_pg_type(contract, conn, oid))
+        return self.get_type_knowledge_from_description(await self.describe_type(contract, conn, oid))
 
     def get_type_knowledge_sync(self, contract: Contract, conn, oid: int) -> TypeKnowledge:
-        return self.get_type_knowledge_impl(self.get_pg_type_sync(contract, conn, oid))
+        return self.get_type_knowledge_from_description(self.describe_type_sync(contract, conn, oid))
+
+    async def describe_type(self, contract: Contract, conn, oid: int) -> RawType:
+        return self._describe_pg_type(await self.get_pg_type(contract, conn, oid))
+
+    def describe_type_sync(self, contract: Contract, conn, oid: int) -> RawType:
+        return self._describe_pg_type(self.get_pg_type_sync(contract, conn, oid))
+
+    def get_type_knowledge_from_description(self, raw_type: RawType) -> TypeKnowledge:
+        schema, type_string, *base = raw_type
+        try:
+            return self.get_type_knowledge_impl({
+                'type_string': type_string,
+                'namespace_string': schema
+            })
+        except KeyError:
+            if not base:
+                raise
+        # a domain without its own mapping is treated as its base type
+        base_schema, base_type_string = base
+        return self.get_type_knowledge_impl({
+            'type_string': base_type_string,
+            'namespace_string': base_schema
+        })
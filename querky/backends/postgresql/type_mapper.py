@@ -1,7 +1,12 @@
+from __future__ import annotations
+
+import typing
 from abc import ABC, abstractmethod
 
 from querky.contract import Contract
 from querky.base_types import TypeKnowledge
+if typing.TYPE_CHECKING:
+    from querky.base_types import RawType
 
 
 class PostgresqlTypeMapper(ABC):
@@ -12,3 +17,25 @@ class PostgresqlTypeMapper(ABC):
     @abstractmethod
     def get_type_knowledge_sync(self, contract: Contract, conn, oid: int) -> TypeKnowledge:
         ...
+
+    async def resolve_pg_types(self, contract: Contract, conn, oids: typing.Iterable[int]) -> None:
+        """
+        A hint that these types are about to be needed, so they can be fetched all at once.
+        """
+
+    def resolve_pg_types_sync(self, contract: Contract, conn, oids: typing.Iterable[int]) -> None:
+        ...
+
+    def reset_catalog(self) -> None:
+        """
+        Called at the start of every `generate` run.
+        """
+
+    async def describe_type(self, contract: Contract, conn, oid: int) -> RawType:
+        raise NotImplementedError(f"{type(self).__name__} cannot describe types")
+
+    def describe_type_sync(self, contract: Contract, conn, oid: int) -> RawType:
+        raise NotImplementedError(f"{type(self).__name__} cannot describe types")
+
+    def get_type_knowledge_from_description(self, raw_type: RawType) -> TypeKnowledge:
+        raise NotImplementedError(f"{type(self).__name__} cannot describe types")
@@ -97,3 +97,18 @@ class QuerySignature:
     def __init__(self, parameters: typing.Tuple[TypeKnowledge, ...], attributes: typing.Tuple[ResultAttribute, ...]):
         self.parameters = parameters
         self.attributes = attributes
+
+
+# (schema, type name), e.g. ('pg_catalog', 'bigint'),
+# followed by (base schema, base type name) for domains: ('public', 'email', 'pg_catalog', 'text')
+RawType = typing.Tuple[str, ...]
+
+
+@dataclass(slots=True, frozen=True)
+class QueryDescription:
+    """
+    Query signature as reported by the database, before the type names are mapped onto python types.
+    Unlike `QuerySignature`, it does not depend on the configuration, so it can be stored between runs.
+    """
+    parameters: typing.Tuple[RawType, ...]
+    attributes: typing.Tuple[typing.Tuple[str, RawType], ...]
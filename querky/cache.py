@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import copy
+import dataclasses
+import datetime
+import decimal
+import re
+import time
+import typing
+import uuid
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, fields, is_dataclass
+if typing.TYPE_CHECKING:
+    from querky.contract import Contract
+
+
+# results of these types can be handed out as they are
+IMMUTABLE_TYPES: typing.Tuple[type, ...] = (
+    type(None),
+    bool,
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    decimal.Decimal,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+    uuid.UUID,
+    frozenset,
+)
+
+
+@dataclass(slots=True, frozen=True, kw_only=True)
+class CachePolicy:
+    """
+    Memoizes the results of a `value`, `column`, `one` or `many` query in-process, keyed on its bound arguments.
+
+    :param ttl: seconds a result stays fresh, forever if None.
+    :param maxsize: number of results kept, least recently used ones are evicted first.
+    :param tags: tables (or any other names) the results depend on, the tables the query reads by default.
+                 Invalidating a tag drops the results, which is done automatically
+                 by the queries writing into a table of the same name.
+    :param copy: hand out copies of the cached results, so that they can't be mutated by the caller.
+                 Pass False if the rows are never mutated (e.g. frozen dataclasses) to skip copying.
+    """
+    ttl: float | None = None
+    maxsize: int = 1024
+    tags: typing.Sequence[str] | None = None
+    copy: bool = True
+
+
+@dataclass(slots=True)
+class ResultCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+_MISSING = object()
+
+
+# dataclass -> names of its fields
+_DATACLASS_FIELDS: dict[type, typing.Tuple[str, ...]] = dict()
+
+
+def _get_dataclass_fields(cls: type) -> typing.Tuple[str, ...] | None:
+    if (names := _DATACLASS_FIELDS.get(cls, None)) is None:
+        if not is_dataclass(cls):
+            return None
+        names = tuple([field.name for field in fields(cls)])
+        _DATACLASS_FIELDS[cls] = names
+    return names
+
+
+def copy_result(value: typing.Any, immutable_types: typing.Tuple[type, ...] = IMMUTABLE_TYPES) -> typing.Any:
+    if isinstance(value, immutable_types):
+        return value
+    cls = type(value)
+    if cls is list:
+        return [copy_result(item, immutable_types) for item in value]
+    if cls is tuple:
+        return tuple([copy_result(item, immutable_types) for item in value])
+    if cls is dict:
+        return {key: copy_result(item, immutable_types) for key, item in value.items()}
+    if (names := _get_dataclass_fields(cls)) is not None:
+        # generated row types: an order of magnitude faster than `deepcopy`, frozen ones included
+        copied = object.__new__(cls)
+        for name in names:
+            object.__setattr__(copied, name, copy_result(getattr(value, name), immutable_types))
+        return copied
+    return copy.deepcopy(value)
+
+
+class ResultCache:
+    __slots__ = ('name', 'policy', 'stats', 'generation', 'registry', '_copy', '_entries')
+
+    def __init__(
+            self,
+            name: str,
+            policy: CachePolicy,
+            immutable_types: typing.Tuple[type, ...] = (),
+            registry: ResultCacheRegistry | None = None
+    ):
+        """
+        LRU of the results of a single query.
+
+        :param immutable_types: types of the database driver, which don't need to be copied (e.g. records).
+        :param registry: the registry the cache belongs to, which tells the connections inside of a transaction apart.
+        """
+        if policy.maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        if policy.ttl is not None and policy.ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.name = name
+        self.policy = policy
+        self.stats = ResultCacheStats()
+        # bumped on every invalidation, so that a result fetched before it is not stored after it
+        self.generation = 0
+        self.registry = registry
+        if policy.copy:
+            immutable_types = (*IMMUTABLE_TYPES, *immutable_types)
+            self._copy = lambda value: copy_result(value, immutable_types)
+        else:
+            self._copy = None
+        # bound arguments -> (expiration time, result)
+        self._entries: OrderedDict[tuple, typing.Tuple[float | None, typing.Any]] = OrderedDict()
+
+    def get(self, params: tuple) -> typing.Any:
+        """
+        :return: the cached result, or `_MISSING`.
+        """
+        try:
+            entry = self._entries.get(params, None)
+        except TypeError:
+            # unhashable arguments (e.g. lists for arrays) are never cached
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return _MISSING
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[params]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return _MISSING
+        self._entries.move_to_end(params)
+        self.stats.hits += 1
+        if self._copy is not None:
+            return self._copy(value)
+        return value
+
+    def put(self, params: tuple, value: typing.Any, generation: int) -> typing.Any:
+        """
+        Stores the result, unless the cache was invalidated since `generation`.
+        :return: the result to be handed out to the caller.
+        """
+        if generation != self.generation:
+            return value
+        ttl = self.policy.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        stored = self._copy(value) if self._copy is not None else value
+        try:
+            self._entries[params] = (expires_at, stored)
+        except TypeError:
+            return value
+        self._entries.move_to_end(params)
+        while len(self._entries) > self.policy.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        return value
+
+    def bypasses(self, conn) -> bool:
+        """
+        Whether the call on `conn` neither reads nor stores a result:
+        a transaction sees its own uncommitted writes, which nobody else is to see, and might be rolled back.
+        """
+        if (registry := self.registry) is None:
+            return False
+        return registry.bypasses(conn)
+
+    async def fetch(self, fetch: typing.Callable[[typing.Any, tuple], typing.Awaitable], conn, params: tuple):
+        if self.bypasses(conn):
+            return await fetch(conn, params)
+        if (value := self.get(params)) is not _MISSING:
+            return value
+        generation = self.generation
+        return self.put(params, await fetch(conn, params), generation)
+
+    def fetch_sync(self, fetch: typing.Callable[[typing.Any, tuple], typing.Any], conn, params: tuple):
+        if self.bypasses(conn):
+            return fetch(conn, params)
+        if (value := self.get(params)) is not _MISSING:
+            return value
+        generation = self.generation
+        return self.put(params, fetch(conn, params), generation)
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self.stats.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResultCacheRegistry:
+    def __init__(self, contract: Contract | None = None):
+        """
+        Every result cache of a `Querky` object, by tag.
+
+        :param contract: tells whether a connection is inside of a transaction. Without it, none ever is.
+        """
+        self.contract = contract
+        self.caches: dict[str, ResultCache] = dict()
+        self._by_tag: defaultdict[str, list[ResultCache]] = defaultdict(list)
+        # connection inside of a transaction -> tags it has written into, invalidated again once it's over
+        self._pending: dict[typing.Any, set[str]] = dict()
+
+    def is_in_transaction(self, conn) -> bool:
+        return conn is not None and self.contract is not None and self.contract.is_in_transaction(conn)
+
+    def bypasses(self, conn) -> bool:
+        """
+        Same as `ResultCache.bypasses`. Settles the transactions finished since the last call beforehand,
+        so that the results read by others while one was open don't outlive its commit.
+        """
+        if self._pending:
+            self.settle()
+        return self.is_in_transaction(conn)
+
+    def create(self, name: str, policy: CachePolicy, immutable_types: typing.Tuple[type, ...] = ()) -> ResultCache:
+        if (old := self.caches.get(name, None)) is not None:
+            # the module was reloaded: the old query is gone
+            for tag in old.policy.tags or ():
+                self._by_tag[tag].remove(old)
+        cache = ResultCache(name, policy, immutable_types, self)
+        self.caches[name] = cache
+        for tag in policy.tags or ():
+            self._by_tag[tag].append(cache)
+        return cache
+
+    def invalidate(self, tags: typing.Iterable[str], conn=None) -> None:
+        """
+        Drops the results of every cache tagged with any of the `tags`.
+
+        :param conn: the connection the tables were written on. Inside of a transaction, the writes are not visible
+                     to anyone else until it commits, and the results of the old data may be cached meanwhile,
+                     so they are dropped once again as soon as the transaction is found to be over.
+        """
+        tags = [tag for tag in tags if self._by_tag.get(tag, None)]
+        if tags and self.is_in_transaction(conn):
+            self._pending.setdefault(conn, set()).update(tags)
+        self._invalidate(tags)
+
+    def _invalidate(self, tags: typing.Iterable[str]) -> None:
+        for tag in tags:
+            if caches := self._by_tag.get(tag, None):
+                for cache in caches:
+                    cache.invalidate()
+
+    def settle(self) -> None:
+        """
+        Invalidates the tags written inside of the transactions, which have been committed or rolled back since.
+        """
+        for conn in [conn for conn in self._pending if not self.is_in_transaction(conn)]:
+            self._invalidate(self._pending.pop(conn))
+
+    def clear(self) -> None:
+        for cache in self.caches.values():
+            cache.invalidate()
+
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+# not `SELECT ... FOR [NO KEY] UPDATE` or `ON CONFLICT ... DO UPDATE`
+_WRITE = re.compile(
+    r"\b(?:INSERT INTO|(?<!FOR )(?<!KEY )(?<!DO )UPDATE|DELETE FROM|TRUNCATE(?: TABLE)?|MERGE INTO|COPY)"
+    r"(?: ONLY)? ((?:\"[^\"]+\"|\w+)(?:\.(?:\"[^\"]+\"|\w+))?)",
+    re.IGNORECASE
+)
+# a table, not a function call (e.g. `FROM generate_series(...)`) or a subquery
+_TABLE = (
+    r"(?:ONLY )?(?!LATERAL\b)((?:\"[^\"]+\"|\w+\b)(?:\.(?:\"[^\"]+\"|\w+\b))?)(?! ?[(.])"
+)
+_READ = re.compile(r"\b(?:FROM|JOIN) " + _TABLE, re.IGNORECASE)
+# the rest of `FROM a x, b y`: an alias is anything but the keywords, which may follow the table
+_NEXT_READ = re.compile(
+    r"(?: (?:AS )?(?!(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|FETCH|FOR|HAVING|WINDOW|UNION|INTERSECT|EXCEPT|RETURNING"
+    r"|ON|USING|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|TABLESAMPLE)\b)\w+)? ?, ?" + _TABLE,
+    re.IGNORECASE
+)
+
+
+def _normalize_identifier(identifier: str) -> str:
+    if identifier.startswith('"'):
+        return identifier[1:-1]
+    return identifier.lower()
+
+
+def _normalize_sql(sql: str) -> str:
+    return ' '.join(_STRING.sub("''", _COMMENT.sub(' ', sql)).split())
+
+
+def _add_table(tables: typing.List[str], name: str) -> None:
+    parts = [_normalize_identifier(part) for part in re.findall(r'"[^"]+"|\w+', name)]
+    for table in ('.'.join(parts), parts[-1]):
+        if table not in tables:
+            tables.append(table)
+
+
+def get_written_tables(sql: str) -> typing.Tuple[str, ...]:
+    """
+    Tables an SQL statement writes into, both qualified with the schema (if it is) and not.
+    Just a best-effort guess: pass `invalidates` to the query, if it writes in some other way (e.g. a function).
+    """
+    tables = []
+    for match in _WRITE.finditer(_normalize_sql(sql)):
+        _add_table(tables, match.group(1))
+    return tuple(tables)
+
+
+def get_table_tags(table: str) -> typing.Tuple[str, ...]:
+    """
+    Tags of a table named as it is by the `copy` of a query, e.g. `public.account`: with the schema and without.
+    """
+    parts = table.split('.')
+    return tuple(dict.fromkeys(['.'.join(parts), parts[-1]]))
+
+
+def get_read_tables(sql: str) -> typing.Tuple[str, ...]:
+    """
+    Tables an SQL statement reads from, the same way as `get_written_tables`.
+    Names of CTEs and the like may turn up too, which only costs a tag nothing writes into.
+    Pass `tags` to the `CachePolicy`, if the query reads in some other way (e.g. a view or a function).
+    """
+    sql = _normalize_sql(sql)
+    tables = []
+    for match in _READ.finditer(sql):
+        _add_table(tables, match.group(1))
+        end = match.end()
+        while (following := _NEXT_READ.match(sql, end)) is not None:
+            _add_table(tables, following.group(1))
+            end = following.end()
+    return tuple(tables)
+
+
+def resolve_cache_policy(policy: CachePolicy, sql: str) -> CachePolicy:
+    """
+    :return: the policy with its tags spelled out: the tables `sql` reads, unless they are given.
+    """
+    if policy.tags is None:
+        tags = get_read_tables(sql)
+    elif isinstance(policy.tags, str):
+        # a single tag is not to be iterated over by characters
+        tags = (policy.tags, )
+    else:
+        tags = tuple(policy.tags)
+    return dataclasses.replace(policy, tags=tags)
+
+
+__all__ = [
+    "CachePolicy",
+    "resolve_cache_policy",
+    "ResultCache",
+    "ResultCacheStats",
+    "ResultCacheRegistry",
+    "copy_result",
+    "get_written_tables",
+    "get_read_tables",
+    "get_table_tags",
+    "IMMUTABLE_TYPES"
+]
@@ -7,7 +7,22 @@ from querky.base_types import TypeMetaData
 if typing.TYPE_CHECKING:
     from querky.query import Query
     from querky.param_mapper import ParamMapper
-    from querky.base_types import QuerySignature
+    from querky.base_types import QuerySignature, QueryDescription
+    from querky.result_shape import Prefetch
+    from querky.upsert import Upsert
+
+
+class _Connection:
+    __slots__ = ('conn', )
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+
+    async def __aenter__(self):
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
 
 
 class Contract(ABC):
@@ -107,3 +122,154 @@ class Contract(ABC):
     def raw_fetch_sync(self, conn, sql: str, params):
         ...
 
+    async def describe_query(self, db, query: Query) -> QueryDescription:
+        """
+        Fetches the raw query signature, which can be cached and later turned into `QuerySignature`
+        with `get_query_signature_from_description` without the database.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    def describe_query_sync(self, db, query: Query) -> QueryDescription:
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    async def describe_sql(self, db, sql: str) -> QueryDescription:
+        """
+        Same as `describe_query`, but needs nothing but the SQL, e.g. rendered in another process.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    def get_query_signature_from_description(self, description: QueryDescription) -> QuerySignature:
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    async def get_schema_fingerprint(self, db) -> str:
+        """
+        A digest of everything in the database schema a query signature may depend on.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    def get_schema_fingerprint_sync(self, db) -> str:
+        raise NotImplementedError(f"{type(self).__name__} does not support signature caching")
+
+    async def prepare_generate(self, db) -> None:
+        """
+        Called once at the start of every `Querky.generate` run.
+        """
+
+    def prepare_generate_sync(self, db) -> None:
+        ...
+
+    def is_pool(self, db) -> bool:
+        """
+        Whether `db` is a connection pool, which can hand out several connections to be used concurrently.
+        """
+        return False
+
+    def get_immutable_types(self) -> typing.Tuple[type, ...]:
+        """
+        Types of the values returned by the driver, which can't be mutated, so cached results of them are not copied.
+        """
+        return ()
+
+    def is_in_transaction(self, conn) -> bool:
+        """
+        Whether the connection is inside of an explicit transaction, so its results are not to be shared.
+        """
+        return False
+
+    async def explain(self, conn, sql: str, bound_params) -> typing.Any:
+        """
+        Plan of the query with these exact parameters, without running it.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support EXPLAIN")
+
+    async def explain_generic(self, conn, sql: str, param_count: int) -> typing.Any:
+        """
+        Generic plan of the query, the one which doesn't depend on the parameter values,
+        in the format of `EXPLAIN (VERBOSE, FORMAT JSON)`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support plan snapshots")
+
+    async def get_relation_rows(self, conn, relations: typing.Sequence[typing.Tuple[str, str]]) -> dict[str, float]:
+        """
+        :param relations: `(schema, name)` of the tables.
+        :return: estimated number of rows of each table by `schema.name`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support plan snapshots")
+
+    def acquire_connection(self, db, transaction: bool = False) -> typing.AsyncContextManager:
+        """
+        Acquires a connection from the pool, or, if `db` is a connection itself, simply returns it.
+
+        :param transaction: the connection is inside of a transaction for the duration of the block,
+                            committed at its end (a nested one, if it already was).
+        """
+        if transaction:
+            raise NotImplementedError(f"{type(self).__name__} does not support transactions")
+        return _Connection(db)
+
+    def generate_direct_call(
+            self,
+            method: typing.Literal['value', 'one', 'all', 'status'],
+            conn: str,
+            sql: str,
+            args: str
+    ) -> str:
+        """
+        Returns a python expression which runs `sql` straight on the driver's connection object.
+        Used to generate functions which skip the `Query.execute` dispatch chain (`Querky(direct_calls=True)`).
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support direct calls")
+
+    def can_call_directly(self) -> bool:
+        """
+        Whether the generated direct calls would do the same as the contract does,
+        e.g. not if it runs the queries through a prepared statement cache. Queries are generated as such only then.
+        """
+        return True
+
+    def fetch_chunks(self, conn, query: Query, bound_params, prefetch: Prefetch) -> typing.AsyncIterator[typing.Sequence]:
+        """
+        Iterates over the result set in chunks of `prefetch.next_size()` rows, without materializing all of it.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support streaming")
+
+    async def execute_many(self, conn, query: Query, bound_params_seq: typing.Sequence) -> None:
+        """
+        Executes the query once per set of bound parameters, in as few round trips as the driver allows.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
+
+    async def fetch_many(self, conn, query: Query, bound_params_seq: typing.Sequence) -> typing.List:
+        """
+        Same as `execute_many`, but collects the rows returned by every execution.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
+
+    async def copy_records(
+            self,
+            conn,
+            query: Query,
+            table: str,
+            columns: typing.Sequence[str],
+            records: typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence]
+    ) -> int:
+        """
+        Bulk loads the records into the table with the fastest method the driver has.
+        :return: number of rows copied.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support bulk loading")
+
+    async def upsert_records(
+            self,
+            conn,
+            query: Query,
+            table: str,
+            columns: typing.Sequence[str],
+            upsert: Upsert,
+            chunks: typing.AsyncIterable[typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence]]
+    ) -> typing.List | int:
+        """
+        Bulk loads every chunk of records into a staging table and merges it into the target table.
+        :return: keys of the affected rows if `upsert.returning`, number of affected rows otherwise.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support bulk upserts")
@@ -3,6 +3,7 @@ import typing
 
 if typing.TYPE_CHECKING:
     from querky.query import Query
+    from querky.plan_snapshots import PlanRegression
 
 
 class QueryInitializationError(Exception):
@@ -12,3 +13,25 @@ class QueryInitializationError(Exception):
             self.message += f"\n{additional_hint}"
         super().__init__(self.message)
 
+
+class GenerationError(Exception):
+    def __init__(self, errors: typing.Sequence[QueryInitializationError]) -> None:
+        self.errors = list(errors)
+        self.message = f"Queries failed to initialize: {len(self.errors)}\n\n" + "\n\n".join([
+            f"{error.message}\n{type(error.__cause__).__name__}: {error.__cause__}"
+            if error.__cause__ is not None else
+            error.message
+            for error in self.errors
+        ])
+        super().__init__(self.message)
+
+
+class PlanRegressionError(GenerationError):
+    def __init__(self, regressions: typing.Sequence[PlanRegression]) -> None:
+        self.errors = []
+        self.regressions = list(regressions)
+        self.message = f"Query plans regressed: {len(self.regressions)}\n\n" + "\n\n".join([
+            f"{regression.unique_name}:\n" + "\n".join([f"  {reason}" for reason in regression.reasons])
+            for regression in self.regressions
+        ])
+        Exception.__init__(self, self.message)
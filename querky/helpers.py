@@ -1,3 +1,10 @@
+import ast
+import typing
+
+
+def to_camel_case(snake_str):
+    return "".join(x.capitalize() for x in snake_str.lower().split("_"))
+
 
 class ReprHelper:
     def __init__(self, name: str):
@@ -15,7 +22,20 @@ class DictGetAttr:
         return self.__d[item]
 
 
+def is_literal(value: typing.Any) -> bool:
+    """
+    Whether `repr(value)` evaluates back to an equal value of the same type, so that it can be written into the code.
+    """
+    try:
+        evaluated = ast.literal_eval(repr(value))
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return False
+    return type(evaluated) is type(value) and evaluated == value
+
+
 __all__ = [
+    "to_camel_case",
+    "is_literal",
     "ReprHelper",
     "DictGetAttr"
 ]
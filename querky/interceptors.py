@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import typing
+import weakref
+
+from querky.logger import logger
+from querky.mixins import AsyncCallbacksMixin
+
+
+InterceptorEvent = typing.Literal['before', 'after', 'error']
+
+
+class Interceptors(AsyncCallbacksMixin):
+    def __init__(self):
+        """
+        Hooks around the execution of every query of a `Querky` object:
+
+        - `before(query, params)` - right before the query is run, with the bound parameters;
+        - `after(query, params, result)` - once it has returned the result;
+        - `error(query, params, exception)` - once it has raised, the exception is re-raised afterwards.
+
+        Callbacks are run highest priority first, and may be coroutine functions, unless the contract is synchronous.
+        An exception raised by a callback is logged and swallowed, unless the callback is `critical`.
+
+        Each query composes the callbacks into its execution path whenever they change,
+        so that a query pays nothing for them, while there are none.
+        """
+        super().__init__('before', 'after', 'error')
+        self._subscribers: weakref.WeakSet = weakref.WeakSet()
+        self._warned_direct = False
+
+    def subscribe(self, query) -> None:
+        """
+        `query.compose()` is to be called each time the callbacks change.
+        """
+        self._subscribers.add(query)
+
+    def on(self, when: InterceptorEvent, key: str, execute, **kwargs):
+        result = super().on(when, key, execute, **kwargs)
+        self._warn_direct()
+        return result
+
+    def _warn_direct(self) -> None:
+        """
+        Functions generated as direct calls never get to the queries, so the callbacks are not run for them.
+        """
+        if self._warned_direct:
+            return
+        if direct := sorted([query.unique_name for query in list(self._subscribers) if query.is_direct()]):
+            self._warned_direct = True
+            logger.warning(
+                "Interceptors are not run by the functions generated with direct calls: %s",
+                ', '.join(direct)
+            )
+
+    def has_callbacks(self, when: InterceptorEvent) -> bool:
+        return bool(self._callbacks[when])
+
+    def is_empty(self) -> bool:
+        return not any([self._callbacks[when] for when in self._callbacks])
+
+    def _on_callbacks_changed(self, when: str) -> None:
+        super()._on_callbacks_changed(when)
+        for query in list(self._subscribers):
+            query.compose()
+
+
+__all__ = [
+    "Interceptors",
+    "InterceptorEvent"
+]
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import types
+import typing
+from os import path
+
+
+MANIFEST_VERSION = 2
+DEFAULT_MANIFEST_FILENAME = ".querky_manifest.json"
+
+
+def hash_file(filepath: str) -> str | None:
+    try:
+        with open(filepath, mode='rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def hash_config(config: dict) -> str:
+    """
+    :param config: everything, besides the sources and the schema, the generated code depends on. JSON-serializable.
+    """
+    from querky import __version__
+
+    content = json.dumps({'querky': __version__, 'config': config}, sort_keys=True, default=repr)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_imported_module_names(filepath: str, package: str) -> typing.Set[str]:
+    """
+    Names of all the modules imported by the source file, relative imports resolved against `package`.
+    """
+    with open(filepath, encoding='utf-8', mode='r') as f:
+        tree = ast.parse(f.read(), filename=filepath)
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update([alias.name for alias in node.names])
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = importlib.util.resolve_name('.' * node.level + (node.module or ''), package)
+            else:
+                base = node.module
+            names.add(base)
+            # `from package import module`
+            names.update([f"{base}.{alias.name}" for alias in node.names])
+    return names
+
+
+class GenerationManifest:
+    def __init__(self, filepath: str, basedir: str | None = None):
+        """
+        Records every generated module along with everything it was generated from:
+        the source module, the project modules it imports (transitively), the schema fingerprint
+        and the hash of the code generation config, querky version included.
+        Source modules, none of which have changed since, are neither imported nor prepared again.
+
+        :param filepath: path to the manifest file.
+        :param basedir: only the modules inside this directory are tracked as dependencies.
+        """
+        self.filepath = filepath
+        self.basedir = path.abspath(basedir or path.dirname(filepath) or '.')
+        self.modules: dict[str, dict] = dict()
+        self.fingerprint: str | None = None
+        self.config_hash: str | None = None
+        self._hashes: dict[str, str | None] = dict()
+
+    def _relpath(self, filepath: str) -> str:
+        return path.relpath(path.abspath(filepath), self.basedir).replace(os.sep, '/')
+
+    def _abspath(self, relpath: str) -> str:
+        return path.join(self.basedir, *relpath.split('/'))
+
+    def _hash(self, relpath: str) -> str | None:
+        # files are hashed once per run
+        if relpath not in self._hashes:
+            self._hashes[relpath] = hash_file(self._abspath(relpath))
+        return self._hashes[relpath]
+
+    def _is_tracked(self, filepath: str | None) -> bool:
+        if not filepath:
+            return False
+        filepath = path.abspath(filepath)
+        return path.commonpath([filepath, self.basedir]) == self.basedir
+
+    def invalidate(self) -> None:
+        """
+        Forgets the file hashes computed so far: call it before recording files changed since.
+        """
+        self._hashes = dict()
+
+    def load(self, fingerprint: str | None, config_hash: str | None = None) -> None:
+        """
+        :param fingerprint: schema fingerprint of this run. Without it, nothing is considered fresh.
+        :param config_hash: `hash_config` of the code generation config of this run.
+        """
+        self.fingerprint = fingerprint
+        self.config_hash = config_hash
+        self.modules = dict()
+        self._hashes = dict()
+        if not path.isfile(self.filepath):
+            return
+        with open(self.filepath, encoding='utf-8', mode='r') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                return
+        if isinstance(data, dict) and data.get('version', None) == MANIFEST_VERSION:
+            self.modules = data['modules']
+
+    def is_fresh(self, source_filepath: str) -> bool:
+        if self.fingerprint is None:
+            return False
+        if (entry := self.modules.get(self._relpath(source_filepath), None)) is None:
+            return False
+        if entry['fingerprint'] != self.fingerprint or entry['config'] != self.config_hash:
+            return False
+        if entry['hash'] != self._hash(self._relpath(source_filepath)):
+            return False
+        if entry['output_hash'] != self._hash(entry['output']):
+            return False
+        return all([
+            self._hash(dependency) == dependency_hash
+            for dependency, dependency_hash in entry['dependencies'].items()
+        ])
+
+    def get_dependencies(self, module: types.ModuleType) -> typing.List[str]:
+        """
+        Project modules imported by `module`, directly or not.
+        """
+        seen = {module.__name__}
+        dependencies = set()
+        stack = [module]
+        while stack:
+            current = stack.pop()
+            for name in get_imported_module_names(current.__file__, current.__package__ or ''):
+                if name in seen:
+                    continue
+                seen.add(name)
+                if (imported := sys.modules.get(name, None)) is None:
+                    continue
+                filepath = getattr(imported, '__file__', None)
+                if not self._is_tracked(filepath) or not filepath.endswith('.py'):
+                    continue
+                dependencies.add(self._relpath(filepath))
+                stack.append(imported)
+        dependencies.discard(self._relpath(module.__file__))
+        return sorted(dependencies)
+
+    def record(self, module: types.ModuleType, output_filepath: str) -> None:
+        """
+        Call it once the output is on the disk.
+        """
+        source = self._relpath(module.__file__)
+        output_relpath = self._relpath(output_filepath)
+        self._hashes[output_relpath] = hash_file(output_filepath)
+        self.modules[source] = {
+            'hash': self._hash(source),
+            'fingerprint': self.fingerprint,
+            'config': self.config_hash,
+            'dependencies': {
+                dependency: self._hash(dependency)
+                for dependency in self.get_dependencies(module)
+            },
+            'output': output_relpath,
+            'output_hash': self._hashes[output_relpath]
+        }
+
+    def save(self) -> None:
+        # modules deleted since are forgotten
+        modules = {
+            source: entry
+            for source, entry in sorted(self.modules.items())
+            if self._hash(source) is not None
+        }
+        data = {
+            'version': MANIFEST_VERSION,
+            'modules': modules
+        }
+        dirname = path.dirname(self.filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        content = json.dumps(data, indent=1) + '\n'
+        if path.isfile(self.filepath):
+            with open(self.filepath, encoding='utf-8', mode='r') as f:
+                if f.read() == content:
+                    return
+        tmp_filepath = f"{self.filepath}.tmp"
+        with open(tmp_filepath, encoding='utf-8', mode='w') as f:
+            f.write(content)
+        os.replace(tmp_filepath, self.filepath)
+
+
+__all__ = [
+    "GenerationManifest",
+    "get_imported_module_names",
+    "hash_config",
+    "DEFAULT_MANIFEST_FILENAME"
+]
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import typing
+from bisect import bisect_left
+from contextlib import aclosing
+from dataclasses import dataclass
+
+from querky.cache import _get_dataclass_fields
+
+
+# seconds, same as the defaults of the prometheus clients
+DEFAULT_BUCKETS: typing.Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _estimate_value_size(value: typing.Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum([_estimate_value_size(item) for item in value])
+    if isinstance(value, dict):
+        return sum([_estimate_value_size(item) for item in value.values()])
+    # numbers, dates, UUIDs and the like
+    return 8
+
+
+def estimate_row_size(row: typing.Any) -> int:
+    """
+    Approximate size of the data in a row (or a single value) in bytes, not of the python objects holding it.
+    """
+    if (names := _get_dataclass_fields(type(row))) is not None:
+        return sum([_estimate_value_size(getattr(row, name)) for name in names])
+    if hasattr(row, 'values') and not isinstance(row, dict):
+        # database records
+        return sum([_estimate_value_size(item) for item in row.values()])
+    return _estimate_value_size(row)
+
+
+def measure_result(shape: str, result: typing.Any) -> typing.Tuple[int, int]:
+    """
+    :return: number of rows and their approximate size in bytes.
+             Only the first row of a list is measured: the rest are assumed to be alike.
+    """
+    if shape == 'status' or result is None:
+        return 0, 0
+    if shape in ('value', 'one'):
+        return 1, estimate_row_size(result)
+    if not result:
+        return 0, 0
+    return len(result), len(result) * estimate_row_size(result[0])
+
+
+@dataclass(slots=True)
+class QueryStats:
+    shape: str
+    calls: int = 0
+    errors: int = 0
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # calls per bucket of `QueryMetrics.buckets`, not cumulative, the last one being +Inf
+    buckets: typing.List[int] | None = None
+
+
+class _Accumulator:
+    __slots__ = ('shape', 'buckets', 'seconds', 'calls', 'errors', 'rows', 'bytes')
+
+    def __init__(self, shape: str, bucket_count: int):
+        self.shape = shape
+        self.buckets = [0] * (bucket_count + 1)
+        self.seconds = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.bytes = 0
+
+
+class QueryMetrics:
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Latency histograms, call, error, row and byte counters of every query by its `unique_name`.
+        Each thread records into its own accumulators without any locking, they are summed up on read.
+
+        :param buckets: upper bounds of the latency histogram buckets in seconds.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # accumulators of every thread that has ever recorded anything: unique_name -> accumulator
+        self._threads: typing.List[dict[str, _Accumulator]] = []
+
+    def _get_accumulator(self, name: str, shape: str) -> _Accumulator:
+        try:
+            accumulators = self._local.accumulators
+        except AttributeError:
+            accumulators = self._local.accumulators = dict()
+            with self._lock:
+                self._threads.append(accumulators)
+        if (accumulator := accumulators.get(name, None)) is None:
+            accumulator = accumulators[name] = _Accumulator(shape, len(self.buckets))
+        return accumulator
+
+    def record(self, name: str, shape: str, seconds: float, rows: int = 0, size: int = 0) -> None:
+        accumulator = self._get_accumulator(name, shape)
+        accumulator.buckets[bisect_left(self.buckets, seconds)] += 1
+        accumulator.seconds += seconds
+        accumulator.calls += 1
+        accumulator.rows += rows
+        accumulator.bytes += size
+
+    def record_error(self, name: str, shape: str, seconds: float) -> None:
+        accumulator = self._get_accumulator(name, shape)
+        accumulator.buckets[bisect_left(self.buckets, seconds)] += 1
+        accumulator.seconds += seconds
+        accumulator.calls += 1
+        accumulator.errors += 1
+
+    def snapshot(self) -> dict[str, QueryStats]:
+        """
+        :return: totals of every thread by `unique_name`.
+        """
+        with self._lock:
+            threads = list(self._threads)
+        stats: dict[str, QueryStats] = dict()
+        for accumulators in threads:
+            for name, accumulator in list(accumulators.items()):
+                if (total := stats.get(name, None)) is None:
+                    total = stats[name] = QueryStats(accumulator.shape, buckets=[0] * (len(self.buckets) + 1))
+                total.calls += accumulator.calls
+                total.errors += accumulator.errors
+                total.rows += accumulator.rows
+                total.bytes += accumulator.bytes
+                total.seconds += accumulator.seconds
+                for index, count in enumerate(accumulator.buckets):
+                    total.buckets[index] += count
+        return stats
+
+    def reset(self) -> None:
+        with self._lock:
+            for accumulators in self._threads:
+                accumulators.clear()
+
+    def to_prometheus(self, prefix: str = "querky") -> str:
+        """
+        :return: every metric in the Prometheus text exposition format.
+        """
+        stats = sorted(self.snapshot().items())
+        lines = [
+            f"# HELP {prefix}_query_duration_seconds Query execution time.",
+            f"# TYPE {prefix}_query_duration_seconds histogram",
+        ]
+        for name, stat in stats:
+            labels = f'query="{_escape_label(name)}",shape="{stat.shape}"'
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), stat.buckets):
+                cumulative += count
+                lines.append(f'{prefix}_query_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_query_duration_seconds_sum{{{labels}}} {stat.seconds!r}')
+            lines.append(f'{prefix}_query_duration_seconds_count{{{labels}}} {stat.calls}')
+
+        for metric, help_text, attribute in (
+            ("query_calls_total", "Query calls.", "calls"),
+            ("query_errors_total", "Query calls which raised an exception.", "errors"),
+            ("query_rows_total", "Rows returned.", "rows"),
+            ("query_result_bytes_total", "Approximate size of the returned data.", "bytes"),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, stat in stats:
+                labels = f'query="{_escape_label(name)}",shape="{stat.shape}"'
+                lines.append(f'{prefix}_{metric}{{{labels}}} {getattr(stat, attribute)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write_prometheus(self, filename: str, prefix: str = "querky") -> None:
+        """
+        Writes the metrics to a file, atomically, so that it can be picked up by the textfile collector.
+        """
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, encoding='utf-8', mode='w') as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp, filename)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+async def measure_stream(
+        metrics: QueryMetrics,
+        name: str,
+        rows: typing.AsyncGenerator
+) -> typing.AsyncIterator:
+    """
+    Records the whole iteration over a stream as a single call.
+    """
+    start = time.perf_counter()
+    count = 0
+    size = 0
+    try:
+        # closed along with the stream, so that the cursor doesn't outlive it
+        async with aclosing(rows):
+            async for row in rows:
+                if count == 0:
+                    size = estimate_row_size(row)
+                count += 1
+                yield row
+    except GeneratorExit:
+        # the caller has stopped iterating early
+        metrics.record(name, 'stream', time.perf_counter() - start, count, count * size)
+        raise
+    except Exception:
+        metrics.record_error(name, 'stream', time.perf_counter() - start)
+        raise
+    metrics.record(name, 'stream', time.perf_counter() - start, count, count * size)
+
+
+__all__ = [
+    "QueryMetrics",
+    "QueryStats",
+    "DEFAULT_BUCKETS",
+    "estimate_row_size",
+    "measure_result",
+    "measure_stream"
+]
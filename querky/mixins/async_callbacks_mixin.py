@@ -11,6 +11,8 @@ logger = getLogger("querky")
 
 MaybeAsyncCallback = typing.Callable[[...], typing.Any | typing.Awaitable]
 CallbackTuple = tuple[MaybeAsyncCallback, int, bool]
+# key, callback, critical
+SortedCallbackTuple = tuple[str, MaybeAsyncCallback, bool]
 
 
 class CallbackContext:
@@ -56,16 +58,30 @@ class AsyncCallbacksMixin:
             }
         else:
             self._callbacks: dict[str, dict[str, CallbackTuple]] = defaultdict(lambda: dict())
+        # sorted once on change, not on every trigger
+        self._sorted_callbacks: dict[str, tuple[SortedCallbackTuple, ...]] = dict()
+
+    def get_sorted_callbacks(self, when: str) -> tuple[SortedCallbackTuple, ...]:
+        """
+        :return: callbacks of the event, highest priority first.
+        """
+        try:
+            return self._sorted_callbacks[when]
+        except KeyError:
+            pass
+        callbacks = sorted(self._callbacks[when].items(), key=(lambda x: x[1][1]), reverse=True)
+        sorted_callbacks = tuple([
+            (key, callback, critical)
+            for key, (callback, priority, critical) in callbacks
+        ])
+        self._sorted_callbacks[when] = sorted_callbacks
+        return sorted_callbacks
+
+    def _on_callbacks_changed(self, when: str) -> None:
+        self._sorted_callbacks.pop(when, None)
 
     async def trigger(self, __when: str, *args, **kwargs) -> None:
-        when = self._callbacks[__when]
-        callbacks = [
-            (k, v[0], v[1], v[2])
-            for k, v in when.items()
-        ]
-        # highest priority first
-        callbacks.sort(key=(lambda x: x[2]), reverse=True)
-        for key, callback, priority, critical in callbacks:
+        for key, callback, critical in self.get_sorted_callbacks(__when):
             try:
                 val = callback(*args, **kwargs)
                 if inspect.iscoroutine(val):
@@ -78,12 +94,32 @@ class AsyncCallbacksMixin:
                 if critical:
                     raise ex
 
+    def trigger_sync(self, __when: str, *args, **kwargs) -> None:
+        """
+        Same as `trigger`, for the callbacks which are not coroutine functions.
+        """
+        for key, callback, critical in self.get_sorted_callbacks(__when):
+            try:
+                val = callback(*args, **kwargs)
+                if inspect.iscoroutine(val):
+                    val.close()
+                    raise TypeError(f"{key}: a coroutine function can't be a callback of a synchronous call")
+            except Exception as ex:
+                logger.exception(
+                    "Exception occurred while handling %s callback (%s).",
+                    __when, key
+                )
+                if critical:
+                    raise ex
+
     def off(self, when: str, key: str) -> MaybeAsyncCallback | None:
         callbacks = self._callbacks[when]
         try:
-            return callbacks.pop(key)[0]
+            callback = callbacks.pop(key)[0]
         except KeyError:
             return None
+        self._on_callbacks_changed(when)
+        return callback
 
     def has(self, when: str, key: str) -> bool:
         return key in self._callbacks[when]
@@ -108,6 +144,7 @@ class AsyncCallbacksMixin:
         if self.has(when, key):
             if on_conflict == 'replace':
                 self._callbacks[when][key] = (execute, priority, critical)
+                self._on_callbacks_changed(when)
                 if context:
                     return CallbackContext(self, when, key, execute, remove=True, replaced=True)
                 return True
@@ -119,6 +156,7 @@ class AsyncCallbacksMixin:
                 return False
         else:
             self._callbacks[when][key] = (execute, priority, critical)
+            self._on_callbacks_changed(when)
             if context:
                 return CallbackContext(self, when, key, execute, remove=True, replaced=False)
             return True
@@ -51,16 +51,15 @@ class ModuleConstructor:
         for query in self.queries_list:
             self.exports.update(query.get_exports())
 
-        # Create import lines
+        # Create import lines: sorted, so that the output doesn't depend on set ordering
         imports = [
             *getattr(self.module, '__imports__', []),
-            *self.imports
+            *sorted(self.imports)
         ]
 
         for query in self.queries_list:
-            imports.append(
-                f"from {self.module.__name__} import {query.query.__name__} as {query.local_name}"
-            )
+            if (import_code := query.generate_import_code()) is not None:
+                imports.append(import_code)
 
         # Imports + Code
         code = [
@@ -72,7 +71,7 @@ class ModuleConstructor:
         if self.exports:
             code.append('')
             code.append('__all__ = [')
-            for export in self.exports:
+            for export in sorted(self.exports):
                 code.append(f'{self.indent(1)}"{export}",')
             code.append(']')
             code.append('')
@@ -86,19 +85,13 @@ class ModuleConstructor:
         if file_exists:
             # check, if we can overwrite the contents
             self.querky.check_file_is_mine(self.fullpath)
+            # an untouched file keeps its mtime, so that caches depending on it stay valid
+            with open(self.fullpath, encoding='utf-8', mode='r') as f:
+                if f.read() == code:
+                    return
 
         if self.querky.subdir:
             os.makedirs(self.filedir, exist_ok=True)
 
         with open(self.fullpath, encoding='utf-8', mode='w') as f:
             f.write(code)
-
-    async def generate_module(self, db):
-        for query in self.queries_list:
-            await query.fetch_types(db)
-        self._post_init()
-
-    def generate_module_sync(self, db):
-        for query in self.queries_list:
-            query.fetch_types_sync(db)
-        self._post_init()
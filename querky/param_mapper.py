@@ -5,6 +5,7 @@ from inspect import Parameter
 import typing
 from abc import ABC, abstractmethod
 from querky.exceptions import QueryInitializationError
+from querky.helpers import ReprHelper
 
 if typing.TYPE_CHECKING:
     from querky.base_types import TypeKnowledge
@@ -82,6 +83,8 @@ class ParamMapper(typing.Generic[M]):
             if param.default is not inspect._empty:
                 self.defaults[name] = param.default
 
+        self.binder: typing.Callable[..., tuple] = self.compile_binder()
+
     @abstractmethod
     def assign_type_knowledge(self, t: typing.Tuple[TypeKnowledge, ...]):
         """
@@ -99,6 +102,50 @@ class ParamMapper(typing.Generic[M]):
 
         return ', '.join(arr)
 
+    def bound_arguments(self) -> str:
+        """
+        Arguments in the order the database driver expects them, as they would be written inside the generated function.
+        """
+        return ', '.join([param.name for param in self.params])
+
+    def generate_binder_code(self, name: str, default: typing.Callable[[str], str]) -> typing.List[str]:
+        """
+        Code of a function with the exact signature of the query, which returns the arguments in bind order.
+        :param name: name of the function.
+        :param default: maps parameter name to the expression of its default value.
+        """
+        sig = inspect.Signature([
+            param.param.replace(
+                annotation=inspect._empty,
+                default=(
+                    ReprHelper(default(param.name))
+                    if param.param.default is not inspect._empty
+                    else inspect._empty
+                )
+            )
+            for param in self.params
+        ])
+        args = self.bound_arguments()
+        if len(self.params) == 1:
+            args += ','
+        return [
+            f"def {name}{sig}:",
+            f"{self.query.querky.get_indent(1)}return ({args})"
+        ]
+
+    def compile_binder(self) -> typing.Callable[..., tuple]:
+        """
+        Compiles the binder once, so that every call doesn't go through `inspect.Signature.bind`.
+        Wrong arguments raise the same `TypeError` as calling the query function itself would.
+        """
+        namespace = {'__defaults': self.defaults}
+        code = self.generate_binder_code(
+            self.query.query.__name__,
+            lambda name: f"__defaults[{name!r}]"
+        )
+        exec('\n'.join(code), namespace)
+        return namespace[self.query.query.__name__]
+
     def parametrize_query(self) -> str:
         sql = self.query.query(*self.positional, **self.keyword)
         return sql
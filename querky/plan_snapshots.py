@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hashlib
+import json
+import os
+import typing
+from dataclasses import dataclass
+from os import path
+
+from querky.logger import logger
+from querky.exceptions import PlanRegressionError
+if typing.TYPE_CHECKING:
+    from querky.contract import Contract
+    from querky.module_constructor import ModuleConstructor
+    from querky.query import Query
+
+
+PLAN_SNAPSHOT_VERSION = 1
+DEFAULT_PLAN_SNAPSHOT_SUFFIX = ".plans.json"
+
+
+@dataclass(slots=True)
+class PlanSummary:
+    # digest of the SQL the plan is of: plans of a changed query are not compared
+    sql: str
+    total_cost: float
+    rows: float
+    # node types, depth first, e.g. `Index Scan on public.account`
+    nodes: typing.List[str]
+    # sequentially scanned tables, which are large enough to matter
+    seq_scans: typing.List[str]
+
+
+@dataclass(slots=True)
+class PlanRegression:
+    unique_name: str
+    reasons: typing.List[str]
+
+
+def hash_sql(sql: str) -> str:
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()[:16]
+
+
+def iter_plan_nodes(node: dict) -> typing.Iterator[dict]:
+    yield node
+    for child in node.get('Plans', ()):
+        yield from iter_plan_nodes(child)
+
+
+def get_relation_name(node: dict) -> str | None:
+    if (relation := node.get('Relation Name', None)) is None:
+        return None
+    if (schema := node.get('Schema', None)) is not None:
+        return f"{schema}.{relation}"
+    return relation
+
+
+def get_seq_scanned_relations(plan: typing.Any) -> typing.List[typing.Tuple[str, str]]:
+    """
+    :return: `(schema, relation)` of every sequentially scanned table of `EXPLAIN (VERBOSE, FORMAT JSON)` output.
+    """
+    relations = []
+    for node in iter_plan_nodes(plan[0]['Plan']):
+        if node['Node Type'] == 'Seq Scan' and 'Relation Name' in node:
+            relation = (node.get('Schema', ''), node['Relation Name'])
+            if relation not in relations:
+                relations.append(relation)
+    return relations
+
+
+def summarize_plan(
+        sql: str,
+        plan: typing.Any,
+        relation_rows: typing.Mapping[str, float],
+        *,
+        max_nodes: int,
+        large_table_rows: float
+) -> PlanSummary:
+    """
+    :param plan: `EXPLAIN (VERBOSE, FORMAT JSON)` output.
+    :param relation_rows: estimated number of rows of the sequentially scanned tables by qualified name.
+    """
+    root = plan[0]['Plan']
+    nodes = []
+    seq_scans = []
+    for node in iter_plan_nodes(root):
+        relation = get_relation_name(node)
+        if len(nodes) < max_nodes:
+            nodes.append(node['Node Type'] if relation is None else f"{node['Node Type']} on {relation}")
+        if node['Node Type'] == 'Seq Scan' and relation is not None:
+            if relation_rows.get(relation, 0) >= large_table_rows and relation not in seq_scans:
+                seq_scans.append(relation)
+    return PlanSummary(
+        sql=hash_sql(sql),
+        total_cost=round(root['Total Cost'], 2),
+        rows=root['Plan Rows'],
+        nodes=nodes,
+        seq_scans=sorted(seq_scans)
+    )
+
+
+class PlanSnapshots:
+    def __init__(
+            self,
+            *,
+            check: bool = False,
+            cost_threshold: float = 2.0,
+            large_table_rows: float = 10_000,
+            max_nodes: int = 10,
+            suffix: str = DEFAULT_PLAN_SNAPSHOT_SUFFIX
+    ):
+        """
+        Captures a summary of the generic plan of every query during the generation,
+        and stores them next to each generated module, e.g. `example_queries.plans.json`.
+        Commit them along with the generated code: a migration, which changes the plans, then shows up in the diff.
+
+        :param check: compare the plans with the stored ones instead of storing them,
+                      and fail the generation, if any of them have regressed.
+        :param cost_threshold: a plan regresses, if its estimated total cost grows by more than this factor.
+        :param large_table_rows: a plan regresses, if it scans a table of at least this many rows (as estimated
+                                 by `ANALYZE`) sequentially, while the stored one doesn't.
+        :param max_nodes: number of plan nodes to store in the summary.
+        """
+        if cost_threshold <= 1:
+            raise ValueError("cost_threshold must be greater than 1")
+        self.check = check
+        self.cost_threshold = cost_threshold
+        self.large_table_rows = large_table_rows
+        self.max_nodes = max_nodes
+        self.suffix = suffix
+
+    def get_filepath(self, module_ctor: ModuleConstructor) -> str:
+        return path.splitext(module_ctor.fullpath)[0] + self.suffix
+
+    def load(self, module_ctor: ModuleConstructor) -> dict[str, PlanSummary]:
+        """
+        :return: stored summaries by query name.
+        """
+        filepath = self.get_filepath(module_ctor)
+        if not path.isfile(filepath):
+            return dict()
+        with open(filepath, encoding='utf-8', mode='r') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                return dict()
+        if not isinstance(data, dict) or data.get('version', None) != PLAN_SNAPSHOT_VERSION:
+            return dict()
+        return {
+            name: PlanSummary(**summary)
+            for name, summary in data['queries'].items()
+        }
+
+    def save(self, module_ctor: ModuleConstructor, summaries: typing.Mapping[Query, PlanSummary]) -> None:
+        stored = self.load(module_ctor)
+        queries = dict()
+        for query in module_ctor.queries_list:
+            # queries, which couldn't be explained this time, keep the last plan
+            if (summary := summaries.get(query, stored.get(query.name, None))) is not None:
+                queries[query.name] = dataclasses.asdict(summary)
+        filepath = self.get_filepath(module_ctor)
+        if not queries:
+            if path.isfile(filepath):
+                os.remove(filepath)
+            return
+        content = json.dumps({'version': PLAN_SNAPSHOT_VERSION, 'queries': queries}, indent=1) + '\n'
+        if path.isfile(filepath):
+            with open(filepath, encoding='utf-8', mode='r') as f:
+                if f.read() == content:
+                    return
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, encoding='utf-8', mode='w') as f:
+            f.write(content)
+        os.replace(tmp_filepath, filepath)
+
+    async def capture(
+            self,
+            contract: Contract,
+            db,
+            queries: typing.Sequence[Query],
+            concurrency: int,
+            transaction: bool = False
+    ) -> dict[Query, PlanSummary]:
+        """
+        :param transaction: explain the plans inside of a transaction on every connection taken.
+        :return: summaries of the generic plans of the queries, but those which couldn't be explained.
+        """
+        summaries: dict[Query, PlanSummary] = dict()
+        pending = iter(queries)
+
+        async def worker():
+            async with contract.acquire_connection(db, transaction) as conn:
+                for query in pending:
+                    try:
+                        plan = await contract.explain_generic(conn, query.sql, len(query.param_mapper.params))
+                        relations = get_seq_scanned_relations(plan)
+                        relation_rows = await contract.get_relation_rows(conn, relations) if relations else {}
+                    except NotImplementedError:
+                        raise
+                    except Exception:
+                        # e.g. utility statements can't be explained
+                        logger.warning("Could not capture the plan of %s", query.unique_name, exc_info=True)
+                        continue
+                    summaries[query] = summarize_plan(
+                        query.sql,
+                        plan,
+                        relation_rows,
+                        max_nodes=self.max_nodes,
+                        large_table_rows=self.large_table_rows
+                    )
+
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, len(queries)))])
+        return summaries
+
+    def compare(self, stored: PlanSummary, summary: PlanSummary) -> typing.List[str]:
+        """
+        :return: reasons the plan has regressed for, if any.
+        """
+        if stored.sql != summary.sql:
+            # the query itself has changed
+            return []
+        reasons = []
+        for relation in summary.seq_scans:
+            if relation not in stored.seq_scans:
+                reasons.append(f"sequential scan on {relation}")
+        if stored.total_cost > 0 and summary.total_cost > stored.total_cost * self.cost_threshold:
+            reasons.append(f"estimated cost {stored.total_cost} -> {summary.total_cost}")
+        if reasons:
+            reasons.append(f"plan: {' -> '.join(stored.nodes)}\n    now: {' -> '.join(summary.nodes)}")
+        return reasons
+
+    def find_regressions(
+            self,
+            module_ctors: typing.Sequence[ModuleConstructor],
+            summaries: typing.Mapping[Query, PlanSummary]
+    ) -> typing.List[PlanRegression]:
+        regressions = []
+        for module_ctor in module_ctors:
+            stored = self.load(module_ctor)
+            for query in module_ctor.queries_list:
+                if (summary := summaries.get(query, None)) is None:
+                    continue
+                if (stored_summary := stored.get(query.name, None)) is None:
+                    continue
+                if reasons := self.compare(stored_summary, summary):
+                    regressions.append(PlanRegression(query.unique_name, reasons))
+        return regressions
+
+    async def process(
+            self,
+            contract: Contract,
+            db,
+            module_ctors: typing.Sequence[ModuleConstructor],
+            concurrency: int,
+            transaction: bool = False
+    ) -> dict[Query, PlanSummary] | None:
+        """
+        Captures the plans of the queries of the modules and compares them with the stored ones.
+
+        :raises PlanRegressionError: in `check` mode, if any of the plans have regressed.
+        :return: summaries to `save` once the modules are written, or None in `check` mode.
+        """
+        queries = [query for module_ctor in module_ctors for query in module_ctor.queries_list]
+        try:
+            summaries = await self.capture(contract, db, queries, concurrency, transaction)
+        except NotImplementedError as ex:
+            logger.warning("Plans are not captured: %s", ex)
+            return None
+        regressions = self.find_regressions(module_ctors, summaries)
+        if self.check:
+            if regressions:
+                raise PlanRegressionError(regressions)
+            return None
+        for regression in regressions:
+            logger.warning("Plan of %s has regressed:\n  %s", regression.unique_name, '\n  '.join(regression.reasons))
+        return summaries
+
+
+__all__ = [
+    "PlanSnapshots",
+    "PlanSummary",
+    "PlanRegression",
+    "summarize_plan",
+    "hash_sql",
+    "DEFAULT_PLAN_SNAPSHOT_SUFFIX"
+]
@@ -3,7 +3,7 @@ import typing
 
 from querky import Querky, Query
 from querky.annotation_generators import ClassicAnnotationGenerator
-from querky.backends.postgresql.asyncpg import AsyncpgContract
+from querky.backends.postgresql.asyncpg import AsyncpgContract, PreparedStatementCache
 from querky.backends.postgresql.asyncpg.name_type_mapper import AsyncpgNameTypeMapper
 from querky.type_constructors import DataclassConstructor, TypedDictConstructor
 from querky.type_constructor import TypeConstructor
@@ -22,12 +22,14 @@ def use_preset(
         *,
         type_factory: TypeFactoryPreset | typing.Callable[[Query, str], TypeConstructor] = 'typed_dict',
         new_style_typehints: bool = True,
+        statement_cache: PreparedStatementCache | None = None,
+        preload_catalog: bool = False,
         **kwargs
 ):
     annotation_generator = ClassicAnnotationGenerator(new_style_typehints=new_style_typehints)
 
-    type_mapper = AsyncpgNameTypeMapper()
-    contract = AsyncpgContract(type_mapper=type_mapper)
+    type_mapper = AsyncpgNameTypeMapper(preload_catalog=preload_catalog)
+    contract = AsyncpgContract(type_mapper=type_mapper, statement_cache=statement_cache)
 
     if isinstance(type_factory, str):
         if type_factory.startswith('dataclass'):
@@ -41,6 +43,7 @@ def use_preset(
                     query,
                     typename,
                     row_factory=row_factory,
+                    generate_row_factory=True,
                     slots=slots
                 )
         elif type_factory == 'typed_dict':
@@ -53,6 +56,7 @@ def use_preset(
                     query,
                     typename,
                     row_factory=row_factory,
+                    generate_row_factory=True
                 )
 
         elif type_factory == 'fake_dict':
@@ -63,7 +67,12 @@ def use_preset(
                 else:
                     row_factory = None
 
-                return TypedDictConstructor(query, typename, row_factory)
+                return TypedDictConstructor(
+                    query,
+                    typename,
+                    row_factory,
+                    generate_row_factory=row_factory is not None
+                )
 
         else:
             raise NotImplementedError(type_factory)
@@ -79,18 +88,69 @@ def use_preset(
     return qrk
 
 
-async def generate(qrk: Querky, *args, base_modules: tuple[types.ModuleType, ...] | None = None, **kwargs):
+async def generate(
+        qrk: Querky,
+        *args,
+        base_modules: tuple[types.ModuleType, ...] | None = None,
+        concurrency: int = 1,
+        prefetch_workers: int = 0,
+        **kwargs
+):
+    """
+    Connects with `asyncpg.connect(*args, **kwargs)` and generates the code.
+    With `concurrency` > 1, a pool of that many connections is used to prepare the queries in parallel.
+    With `prefetch_workers` > 0, that many processes render the SQL to be prepared ahead, see `Querky.generate`.
+    The generation runs inside of a transaction, on every pooled connection it takes.
+    """
     import asyncpg
 
+    if concurrency > 1:
+        pool = await asyncpg.create_pool(*args, min_size=concurrency, max_size=concurrency, **kwargs)
+        try:
+            await qrk.generate(
+                pool,
+                base_modules=base_modules,
+                concurrency=concurrency,
+                prefetch_workers=prefetch_workers,
+                transaction=True
+            )
+        finally:
+            await pool.close()
+        return
+
     conn = await asyncpg.connect(*args, **kwargs)
     try:
         async with conn.transaction():
-            await qrk.generate(conn, base_modules=base_modules)
+            await qrk.generate(conn, base_modules=base_modules, prefetch_workers=prefetch_workers)
     finally:
         await conn.close()
 
 
+async def watch(
+        qrk: Querky,
+        *args,
+        base_modules: tuple[types.ModuleType, ...],
+        concurrency: int = 1,
+        interval: float = 0.2,
+        **kwargs
+):
+    """
+    Same as `generate`, but keeps the connection open and regenerates the code on every change, until cancelled.
+    """
+    import asyncpg
+
+    if concurrency > 1:
+        db = await asyncpg.create_pool(*args, min_size=concurrency, max_size=concurrency, **kwargs)
+    else:
+        db = await asyncpg.connect(*args, **kwargs)
+    try:
+        await qrk.watch(db, base_modules, concurrency=concurrency, interval=interval)
+    finally:
+        await db.close()
+
+
 __all__ = [
     "use_preset",
-    "generate"
+    "generate",
+    "watch"
 ]
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import threading
+import time
+import typing
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+
+PHASES = ('bind', 'wait', 'decode', 'row_factory', 'other')
+
+
+class _Sample:
+    __slots__ = ('wait', 'decode', 'row_factory')
+
+    def __init__(self):
+        self.wait = 0.0
+        self.decode = 0.0
+        self.row_factory = 0.0
+
+
+# the sample of the call in progress, if it has been picked
+_current_sample: ContextVar[_Sample | None] = ContextVar('querky_profile_sample', default=None)
+
+
+@dataclass(slots=True)
+class PhaseStats:
+    """
+    Seconds spent in each phase by the sampled calls of a query:
+
+    - `bind` - mapping the arguments of the function to the query parameters;
+    - `wait` - waiting for the database, the network round trip included;
+    - `decode` - CPU time of the thread during the driver call: encoding the parameters and decoding the rows.
+      Under concurrency, it also takes in whatever other tasks have run on the thread meanwhile;
+    - `row_factory` - turning the records into the result type;
+    - `other` - the rest: result cache hits, coalesced calls, interceptors and the like.
+    """
+    name: str
+    shape: str
+    samples: int = 0
+    bind: float = 0.0
+    wait: float = 0.0
+    decode: float = 0.0
+    row_factory: float = 0.0
+    other: float = 0.0
+
+    @property
+    def total(self) -> float:
+        return self.bind + self.wait + self.decode + self.row_factory + self.other
+
+    @property
+    def python(self) -> float:
+        """
+        Seconds spent on the client side.
+        """
+        return self.bind + self.decode + self.row_factory + self.other
+
+    @property
+    def database(self) -> float:
+        return self.wait
+
+    @property
+    def python_share(self) -> float:
+        if (total := self.total) == 0:
+            return 0.0
+        return self.python / total
+
+    def mean(self, phase: str) -> float:
+        """
+        :return: average seconds per sampled call of a phase, or of one of `total`, `python` and `database`.
+        """
+        if self.samples == 0:
+            return 0.0
+        return getattr(self, phase) / self.samples
+
+
+class QueryProfile:
+    __slots__ = ('profiler', 'name', 'shape', 'interval', 'countdown')
+
+    def __init__(self, profiler: QueryProfiler, name: str, shape: str):
+        """
+        Picks every `interval`-th call of a single query for profiling.
+        """
+        self.profiler = profiler
+        self.name = name
+        self.shape = shape
+        self.interval = profiler.interval
+        self.countdown = self.interval
+
+    async def execute(self, fetch: typing.Callable, bind: typing.Callable, conn, args: tuple, kwargs: dict):
+        self.countdown -= 1
+        if self.countdown:
+            return await fetch(conn, bind(*args, **kwargs))
+        self.countdown = self.interval
+
+        start = time.perf_counter()
+        params = bind(*args, **kwargs)
+        bound = time.perf_counter()
+        sample = _Sample()
+        token = _current_sample.set(sample)
+        try:
+            return await fetch(conn, params)
+        finally:
+            _current_sample.reset(token)
+            self.profiler.record(self, bound - start, time.perf_counter() - bound, sample)
+
+    def execute_sync(self, fetch: typing.Callable, bind: typing.Callable, conn, args: tuple, kwargs: dict):
+        self.countdown -= 1
+        if self.countdown:
+            return fetch(conn, bind(*args, **kwargs))
+        self.countdown = self.interval
+
+        start = time.perf_counter()
+        params = bind(*args, **kwargs)
+        bound = time.perf_counter()
+        sample = _Sample()
+        token = _current_sample.set(sample)
+        try:
+            return fetch(conn, params)
+        finally:
+            _current_sample.reset(token)
+            self.profiler.record(self, bound - start, time.perf_counter() - bound, sample)
+
+
+def _split(sample: _Sample, start: float, cpu_start: float, fetched: float, cpu_fetched: float) -> None:
+    driver = fetched - start
+    # CPU time can't exceed the wall time, but the clocks differ in resolution
+    decode = min(cpu_fetched - cpu_start, driver)
+    sample.decode += decode
+    sample.wait += driver - decode
+
+
+def profile_fetch(query, fetch: typing.Callable, convert: typing.Callable | None):
+    """
+    :param fetch: contract method, called with `(conn, query, params)`.
+    :param convert: turns what `fetch` has returned into the result.
+    :return: `fetch(conn, params)`, which times the driver call apart from the conversion of the sampled calls.
+    """
+    async def profiled_fetch(conn, params):
+        if (sample := _current_sample.get()) is None:
+            result = await fetch(conn, query, params)
+            if convert is not None:
+                result = convert(result)
+            return result
+
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        result = await fetch(conn, query, params)
+        fetched = time.perf_counter()
+        _split(sample, start, cpu_start, fetched, time.thread_time())
+        if convert is not None:
+            result = convert(result)
+            sample.row_factory += time.perf_counter() - fetched
+        return result
+    return profiled_fetch
+
+
+def profile_fetch_sync(query, fetch: typing.Callable, convert: typing.Callable | None):
+    """
+    Same as `profile_fetch`.
+    """
+    def profiled_fetch(conn, params):
+        if (sample := _current_sample.get()) is None:
+            result = fetch(conn, query, params)
+            if convert is not None:
+                result = convert(result)
+            return result
+
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        result = fetch(conn, query, params)
+        fetched = time.perf_counter()
+        _split(sample, start, cpu_start, fetched, time.thread_time())
+        if convert is not None:
+            result = convert(result)
+            sample.row_factory += time.perf_counter() - fetched
+        return result
+    return profiled_fetch
+
+
+class QueryProfiler:
+    def __init__(self, sample_rate: float = 0.01):
+        """
+        Times the phases of a sample of the calls of every query by its `unique_name`,
+        to tell the time spent in python apart from the time spent waiting for the database.
+
+        :param sample_rate: share of the calls to profile, from 0 (exclusive) to 1.
+                            Every `round(1 / sample_rate)`-th call of each query is picked.
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be greater than 0 and not greater than 1")
+        self.sample_rate = sample_rate
+        self.interval = max(1, round(1 / sample_rate))
+        self._lock = threading.Lock()
+        self._stats: dict[str, PhaseStats] = dict()
+
+    def profile(self, name: str, shape: str) -> QueryProfile:
+        return QueryProfile(self, name, shape)
+
+    def record(self, profile: QueryProfile, bind: float, elapsed: float, sample: _Sample) -> None:
+        with self._lock:
+            if (stats := self._stats.get(profile.name, None)) is None:
+                stats = self._stats[profile.name] = PhaseStats(profile.name, profile.shape)
+            stats.samples += 1
+            stats.bind += bind
+            stats.wait += sample.wait
+            stats.decode += sample.decode
+            stats.row_factory += sample.row_factory
+            stats.other += max(0.0, elapsed - sample.wait - sample.decode - sample.row_factory)
+
+    def snapshot(self) -> dict[str, PhaseStats]:
+        with self._lock:
+            return {
+                name: PhaseStats(**{
+                    field: getattr(stats, field)
+                    for field in ('name', 'shape', 'samples', *PHASES)
+                })
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def report(
+            self,
+            by: typing.Literal['python', 'database', 'python_share', 'total'] = 'python',
+            limit: int | None = None
+    ) -> typing.List[PhaseStats]:
+        """
+        :param by: what to rank the queries by, per sampled call, the largest first.
+                   `python_share` ranks them by the share of the time spent on the client side.
+        :return: stats of the profiled queries.
+        """
+        stats = list(self.snapshot().values())
+        if by == 'python_share':
+            stats.sort(key=lambda s: s.python_share, reverse=True)
+        else:
+            stats.sort(key=lambda s: s.mean(by), reverse=True)
+        return stats[:limit]
+
+    def format_report(
+            self,
+            by: typing.Literal['python', 'database', 'python_share', 'total'] = 'python',
+            limit: int | None = None
+    ) -> str:
+        """
+        :return: `report` as a table of average milliseconds per sampled call.
+        """
+        header = ('query', 'samples', *PHASES, 'python', 'database', 'python %')
+        rows = [header]
+        for stats in self.report(by, limit):
+            rows.append((
+                stats.name,
+                str(stats.samples),
+                *[f"{stats.mean(phase) * 1000:.3f}" for phase in (*PHASES, 'python', 'database')],
+                f"{stats.python_share * 100:.1f}"
+            ))
+        widths = [max([len(row[i]) for row in rows]) for i in range(len(header))]
+        return '\n'.join([
+            '  '.join([
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            ])
+            for row in rows
+        ])
+
+
+__all__ = [
+    "QueryProfiler",
+    "QueryProfile",
+    "PhaseStats",
+    "PHASES",
+    "profile_fetch",
+    "profile_fetch_sync"
+]
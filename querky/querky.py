@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
 import types
 import typing
@@ -7,31 +8,75 @@ from types import ModuleType
 import inspect
 from os import path
 import os
+import sys
 import logging
+from fnmatch import fnmatchcase
+from concurrent.futures import ProcessPoolExecutor
 
-from querky.result_shape import one_, all_, value_, status_, column_, One, All, ResultShape
+from querky.result_shape import one_, all_, value_, status_, column_, stream_, One, All, ResultShape, Prefetch
 from querky.conn_param_config import ConnParamConfig, First
 from querky.annotation_generator import AnnotationGenerator
 from querky.type_constructor import TypeConstructor
 from querky.module_constructor import ModuleConstructor
-from querky.base_types import TypeMetaData
+from querky.base_types import TypeMetaData, QueryDescription
 from querky.query import Query
 from querky.contract import Contract
+from querky.helpers import to_camel_case
+from querky.signature_cache import SignatureCache
+from querky.manifest import GenerationManifest, hash_config
+from querky.watch import Watcher
+from querky.cache import ResultCacheRegistry
+from querky.metrics import QueryMetrics
+from querky.interceptors import Interceptors
+from querky.profiling import QueryProfiler
+from querky.slow_log import SlowQueryLog
+from querky.plan_snapshots import PlanSnapshots
+from querky.exceptions import QueryInitializationError, GenerationError
 
 
 logger = logging.getLogger("querky")
 
 
-def to_camel_case(snake_str):
-    return "".join(x.capitalize() for x in snake_str.lower().split("_"))
+ShapeStringRepr = typing.Literal["one", "many", "column", "value", "status", "stream"]
 
 
-ShapeStringRepr = typing.Literal["one", "many", "column", "value", "status"]
+def _describe(value: typing.Any) -> str | None:
+    """
+    Stable description of a config value, for the generation manifest.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (type, types.FunctionType, types.MethodType)):
+        return f"{value.__module__}.{value.__qualname__}"
+    if type(value).__repr__ is object.__repr__:
+        # the default repr has the address in it
+        return _describe(type(value))
+    return repr(value)
 
 
 QueryDef = typing.Callable[[typing.Callable[[...], str]], Query]
 
 
+def _init_prefetch_worker(sys_path: typing.List[str]) -> None:
+    sys.path[:] = sys_path
+
+
+def _render_module_sql(module_import_path: str) -> typing.List[str]:
+    """
+    Runs in a worker process: imports the module and returns the SQL of the queries declared in it.
+    """
+    try:
+        module = importlib.import_module(module_import_path)
+    except Exception:
+        # the main process imports it too, and reports the error properly
+        return []
+    return [
+        value.sql
+        for value in vars(module).values()
+        if isinstance(value, Query) and value.module.module is module
+    ]
+
+
 class Querky:
     def __init__(
             self,
@@ -45,9 +90,61 @@ class Querky:
             on_before_type_code_emit: typing.Optional[typing.Callable[[typing.List[str], Query], typing.List[str]]] = None,
             imports: typing.Optional[typing.Set[str]] = None,
             indent: str = '    ',
-            query_class: typing.Type[Query] = Query
+            query_class: typing.Type[Query] = Query,
+            direct_calls: bool = False,
+            standalone: bool = False,
+            runtime_source: str | None = None,
+            signature_cache: SignatureCache | str | None = None,
+            manifest: GenerationManifest | str | None = None,
+            recursive: bool = False,
+            include: typing.Sequence[str] | None = None,
+            exclude: typing.Sequence[str] | None = None,
+            metrics: QueryMetrics | bool = False,
+            profiler: QueryProfiler | bool = False,
+            slow_query_log: SlowQueryLog | float | None = None,
+            plan_snapshots: PlanSnapshots | bool = False
     ):
         self.basedir = basedir
+        self.direct_calls = direct_calls
+        self.standalone = standalone
+        self.runtime_source = runtime_source
+
+        if isinstance(signature_cache, str):
+            if basedir is not None and not path.isabs(signature_cache):
+                signature_cache = path.join(basedir, signature_cache)
+            signature_cache = SignatureCache(signature_cache)
+        self.signature_cache = signature_cache
+
+        if isinstance(manifest, str):
+            if basedir is not None and not path.isabs(manifest):
+                manifest = path.join(basedir, manifest)
+            manifest = GenerationManifest(manifest, basedir)
+        self.manifest = manifest
+
+        # module discovery: globs are matched against the paths relative to the base module directory
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude or ()
+        # SQL -> description fetched ahead of time, while the modules were being imported
+        self.prefetched_descriptions: dict[str, QueryDescription] = dict()
+        # every connection taken by the current `generate` run is inside of a transaction
+        self.generation_transaction = False
+        # results of the queries declared with `cache`
+        self.result_caches = ResultCacheRegistry(contract)
+        if metrics is True:
+            metrics = QueryMetrics()
+        self.metrics: QueryMetrics | None = metrics or None
+        if profiler is True:
+            profiler = QueryProfiler()
+        self.profiler: QueryProfiler | None = profiler or None
+        if isinstance(slow_query_log, (int, float)):
+            slow_query_log = SlowQueryLog(slow_query_log)
+        self.slow_query_log: SlowQueryLog | None = slow_query_log
+        if plan_snapshots is True:
+            plan_snapshots = PlanSnapshots()
+        self.plan_snapshots: PlanSnapshots | None = plan_snapshots or None
+        # hooks around the execution of every query
+        self.interceptors = Interceptors()
 
         self.on_before_func_code_emit = on_before_func_code_emit
         self.on_before_type_code_emit = on_before_type_code_emit
@@ -74,6 +171,60 @@ class Querky:
 
         self.file_signature = "# ~ AUTOGENERATED BY QUERKY ~ #"
 
+    def get_runtime_source(self) -> str:
+        """
+        :return: `module:attribute` of this object, which standalone generated modules import to get the contract.
+        """
+        if self.runtime_source is not None:
+            return self.runtime_source
+        for module_name, module in sorted(sys.modules.items()):
+            # the generation script itself (aliased by multiprocessing too) can't be imported
+            if module_name in ('__main__', '__mp_main__') or getattr(module, '__name__', None) != module_name:
+                continue
+            for attribute, value in list(getattr(module, '__dict__', {}).items()):
+                if value is self:
+                    self.runtime_source = f"{module_name}:{attribute}"
+                    return self.runtime_source
+        raise ValueError(
+            "Could not find the module this Querky object is defined in, "
+            "pass `runtime_source='module:attribute'` for standalone generated modules to import it"
+        )
+
+    def get_config_hash(self) -> str:
+        """
+        :return: hash of everything in this object the generated code depends on.
+        """
+        try:
+            runtime_source = self.get_runtime_source() if self.standalone else self.runtime_source
+        except ValueError:
+            runtime_source = None
+        return hash_config({
+            'annotation_generator': _describe(self.annotation_generator),
+            'contract': _describe(self.contract),
+            'conn_param_config': _describe(self.conn_param_config),
+            'type_factory': _describe(self.type_factory),
+            'subdir': self.subdir,
+            'on_before_func_code_emit': _describe(self.on_before_func_code_emit),
+            'on_before_type_code_emit': _describe(self.on_before_type_code_emit),
+            'imports': sorted(self.imports),
+            'indent': self.indent,
+            'query_class': _describe(self.query_class),
+            'direct_calls': self.direct_calls,
+            'standalone': self.standalone,
+            'runtime_source': runtime_source,
+            # direct calls are not generated for the queries which need the metrics, the profiler or the slow log
+            'metrics': self.metrics is not None,
+            'profiler': self.profiler is not None,
+            'slow_query_log': self.slow_query_log is not None,
+        })
+
+    def invalidate(self, *tags: str) -> None:
+        """
+        Drops the cached results of the queries tagged with any of the `tags`.
+        Queries writing into a table do it for the tag of the same name by themselves.
+        """
+        self.result_caches.invalidate(tags)
+
     def get_indent(self, i: int):
         return self.indent * i
 
@@ -122,15 +273,19 @@ class Querky:
             *,
             shape: ShapeStringRepr = 'status',
             optional: bool | None = None,
+            prefetch: int | Prefetch | None = None,
             **kwargs
     ) -> QueryDef | Query:
         def wrapper(fn: typing.Callable[[...], str]) -> Query:
             nonlocal optional
 
-            if shape in ['many', 'one']:
+            if prefetch is not None and shape != 'stream':
+                raise TypeError("`prefetch` is only supported by STREAM constructor")
+
+            if shape in ['many', 'one', 'stream']:
                 if isinstance(arg, TypeMetaData):
                     raise ValueError(
-                        "TypeMetaData is not supported for `many` or `one` constructors. "
+                        "TypeMetaData is not supported for `many`, `one` or `stream` constructors. "
                         "Use it only for `one` and `column` constructors."
                     )
 
@@ -155,6 +310,13 @@ class Querky:
                             'at least an empty set will always be returned'
                         )
                     created_shape = all_(type_name)
+                elif shape == 'stream':
+                    if optional is not None:
+                        raise TypeError(
+                            'STREAM constructor does not accept `optional` flag -- '
+                            'rows are never None'
+                        )
+                    created_shape = stream_(type_name, prefetch=prefetch)
                 else:
                     if optional is None:
                         optional = True
@@ -210,9 +372,9 @@ class Querky:
                         "Only queries shaped 'one' or 'many' can have their type definitions copied.\n"
                         f"Source query: {arg.unique_name}"
                     )
-                if shape not in ["many", "one"]:
+                if shape not in ["many", "one", "stream"]:
                     raise ValueError(
-                        "Child queries can only have shape of 'one' or 'many' (as do their respective parents).\n"
+                        "Child queries can only have shape of 'one', 'many' or 'stream' (as do their respective parents).\n"
                         f"Source query: {arg.unique_name}"
                     )
 
@@ -239,9 +401,16 @@ class Querky:
                 f"This could be your code, so I won't overwrite this file!"
             )
 
-    def _pre_generate(self, base_module: types.ModuleType):
-        modules = []
+    def _is_included(self, relpath: str) -> bool:
+        if self.include is not None and not any([fnmatchcase(relpath, pattern) for pattern in self.include]):
+            return False
+        return not any([fnmatchcase(relpath, pattern) for pattern in self.exclude])
 
+    def discover_modules(self, base_module: types.ModuleType) -> typing.List[typing.Tuple[str, str]]:
+        """
+        :return: filepath and import path of every query source module inside the `base_module` directory.
+                 With `recursive`, the nested packages are searched too, except for the generated `subdir` ones.
+        """
         if base_module.__file__ is None:
             raise ValueError(
                 f"Module `{base_module.__name__}` does not have __file__ defined. "
@@ -249,33 +418,301 @@ class Querky:
             )
 
         directory = path.dirname(base_module.__file__)
-        for filename in os.listdir(directory):
-            if filename.startswith('__') or not filename.endswith('.py'):
-                continue
+        modules = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            reldir = path.relpath(dirpath, directory)
+            if reldir == '.':
+                package = base_module.__name__
+                reldir = ''
+            else:
+                reldir = reldir.replace(os.sep, '/')
+                package = f"{base_module.__name__}.{reldir.replace('/', '.')}"
+
+            if self.recursive:
+                dirnames[:] = sorted([
+                    dirname
+                    for dirname in dirnames
+                    if dirname != self.subdir
+                    and dirname.isidentifier()
+                    and path.isfile(path.join(dirpath, dirname, '__init__.py'))
+                ])
+            else:
+                dirnames[:] = []
+
+            for filename in sorted(filenames):
+                if filename.startswith('__') or not filename.endswith('.py'):
+                    continue
+                if not self._is_included(f"{reldir}/{filename}" if reldir else filename):
+                    continue
+
+                modulename = path.splitext(filename)[0]
+                modules.append((path.join(dirpath, filename), f'{package}.{modulename}'))
+        return modules
+
+    def _get_modules_to_import(self, base_modules: typing.Collection[types.ModuleType]) -> typing.List[str]:
+        return [
+            module_import_path
+            for base_module in base_modules
+            for filepath, module_import_path in self.discover_modules(base_module)
+            # neither the module nor anything it depends on has changed since the last run
+            if self.manifest is None or not self.manifest.is_fresh(filepath)
+        ]
+
+    def _import_modules(self, module_import_paths: typing.Sequence[str]) -> None:
+        for module_import_path in module_import_paths:
+            importlib.import_module(module_import_path)
+
+    async def _prefetch_signatures(self, db, rendered: typing.Iterable[typing.Awaitable[typing.List[str]]], concurrency: int):
+        pending = iter(rendered)
+
+        async def worker():
+            async with self.contract.acquire_connection(db, self.generation_transaction) as conn:
+                for rendered_sqls in pending:
+                    try:
+                        sqls = await rendered_sqls
+                    except Exception:
+                        # e.g. a worker process has died: the module is imported here anyway
+                        continue
+                    for sql in sqls:
+                        if sql in self.prefetched_descriptions:
+                            continue
+                        if self.signature_cache is not None and sql in self.signature_cache:
+                            continue
+                        try:
+                            self.prefetched_descriptions[sql] = await self.contract.describe_sql(conn, sql)
+                        except NotImplementedError:
+                            return
+                        except Exception:
+                            # the query fetches its signature again later, and reports the error properly
+                            continue
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    async def _import_modules_prefetching(
+            self,
+            db,
+            module_import_paths: typing.Sequence[str],
+            prefetch_workers: int,
+            concurrency: int
+    ) -> None:
+        """
+        Worker processes import the modules and render the SQL of their queries,
+        so that query signatures are fetched while this process imports the same modules to generate the code.
+        The import itself takes just as long: it's the signature round trips that are taken off the critical path.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(prefetch_workers, initializer=_init_prefetch_worker, initargs=(list(sys.path), ))
+        try:
+            rendered = asyncio.as_completed([
+                loop.run_in_executor(executor, _render_module_sql, module_import_path)
+                for module_import_path in module_import_paths
+            ])
+            prefetch = asyncio.ensure_future(self._prefetch_signatures(db, rendered, concurrency))
+            try:
+                await asyncio.to_thread(self._import_modules, module_import_paths)
+            except BaseException:
+                prefetch.cancel()
+                raise
+            await prefetch
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _fetch_signatures(self, db, queries: typing.Sequence[Query], concurrency: int) -> list:
+        # each slot holds either the signature or the error, in the order of `queries`
+        results: list = [None] * len(queries)
+        pending = iter(enumerate(queries))
+
+        async def worker():
+            async with self.contract.acquire_connection(db, self.generation_transaction) as conn:
+                for i, query in pending:
+                    try:
+                        results[i] = await query.fetch_signature(conn)
+                    except QueryInitializationError as ex:
+                        results[i] = ex
+
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, len(queries)))])
+        return results
+
+    async def _get_schema_fingerprint(self, conn) -> str | None:
+        if self.signature_cache is not None:
+            return self.signature_cache.loaded_fingerprint
+        try:
+            return await self.contract.get_schema_fingerprint(conn)
+        except NotImplementedError:
+            return None
+
+    def _get_schema_fingerprint_sync(self, conn) -> str | None:
+        if self.signature_cache is not None:
+            return self.signature_cache.loaded_fingerprint
+        try:
+            return self.contract.get_schema_fingerprint_sync(conn)
+        except NotImplementedError:
+            return None
+
+    def _get_stale_modules(self) -> typing.List[ModuleConstructor]:
+        return [
+            module_ctor
+            for module_ctor in self.module_ctors.values()
+            if self.manifest is None or not self.manifest.is_fresh(module_ctor.module.__file__)
+        ]
+
+    def _get_queries_to_fetch(self, module_ctors: typing.Sequence[ModuleConstructor]) -> typing.List[Query]:
+        queries = []
+        seen = set()
+
+        def add(query: Query) -> None:
+            if query in seen:
+                return
+            # parent queries of fresh modules are still needed: children are checked against them
+            if query.parent_query is not None:
+                add(query.parent_query)
+            seen.add(query)
+            queries.append(query)
+
+        for module_ctor in module_ctors:
+            for q in module_ctor.queries_list:
+                add(q)
+
+        return queries
+
+    def _write_modules(self, module_ctors: typing.Sequence[ModuleConstructor], partial: bool = False) -> None:
+        for module_ctor in module_ctors:
+            module_ctor._post_init()
+            if self.manifest is not None:
+                self.manifest.record(module_ctor.module, module_ctor.fullpath)
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.signature_cache is not None:
+            # queries of the skipped modules haven't been looked up, but they are still there
+            self.signature_cache.save(prune=self.manifest is None and not partial)
+
+    async def generate(
+            self,
+            db,
+            base_modules: typing.Collection[types.ModuleType] | None = None,
+            *,
+            concurrency: int = 1,
+            prefetch_workers: int = 0,
+            transaction: bool = False
+    ):
+        """
+        :param db: a connection or, to fetch query signatures concurrently, a connection pool.
+        :param concurrency: maximum number of connections taken from the pool at once.
+        :param transaction: run everything inside of a transaction on every connection taken from the pool
+                            (or on `db` itself), so that nothing done to the session outlives the generation.
+        :param prefetch_workers: number of processes rendering the SQL of the modules ahead of this one,
+                                 so that query signatures are fetched while this process imports the modules.
+                                 This process still imports every module itself.
+        :raises GenerationError: with the errors of all the failed queries. Nothing is written in this case.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        if not self.contract.is_pool(db):
+            # a single connection can only run one query at a time
+            concurrency = 1
+
+        await self.contract.prepare_generate(db)
+        self.generation_transaction = transaction
+        try:
+            if self.signature_cache is not None or self.manifest is not None:
+                async with self.contract.acquire_connection(db, transaction) as conn:
+                    if self.signature_cache is not None:
+                        await self.signature_cache.load(self.contract, conn)
+                    if self.manifest is not None:
+                        self.manifest.load(await self._get_schema_fingerprint(conn), self.get_config_hash())
+
+            module_import_paths = self._get_modules_to_import(base_modules or ())
+            if prefetch_workers > 0 and module_import_paths:
+                await self._import_modules_prefetching(db, module_import_paths, prefetch_workers, concurrency)
+            else:
+                self._import_modules(module_import_paths)
 
-            filepath = os.path.join(directory, filename)
-            if not os.path.isfile(filepath):
-                continue
+            await self._generate_modules(db, self._get_stale_modules(), concurrency)
+        finally:
+            self.prefetched_descriptions.clear()
+            self.generation_transaction = False
 
-            modulename = os.path.splitext(filename)[0]
+    async def _generate_modules(
+            self,
+            db,
+            module_ctors: typing.Sequence[ModuleConstructor],
+            concurrency: int,
+            partial: bool = False
+    ) -> None:
+        queries = self._get_queries_to_fetch(module_ctors)
+        signatures = await self._fetch_signatures(db, queries, concurrency)
+
+        # signatures are applied in declaration order, no matter the order they were fetched in
+        errors = []
+        for query, signature in zip(queries, signatures):
+            if isinstance(signature, QueryInitializationError):
+                errors.append(signature)
+                continue
+            try:
+                query.apply_signature(signature)
+            except QueryInitializationError as ex:
+                errors.append(ex)
+        if errors:
+            raise GenerationError(errors)
+
+        if not self.contract.can_call_directly():
+            if requested := [
+                query.unique_name
+                for module_ctor in module_ctors
+                for query in module_ctor.queries_list
+                if query.is_direct_requested()
+            ]:
+                logger.warning(
+                    "Direct calls would bypass the statement cache of %s, generating regular ones instead: %s",
+                    type(self.contract).__name__, ', '.join(requested)
+                )
+
+        plans = None
+        if self.plan_snapshots is not None:
+            # in check mode, a regression fails the generation before anything is written
+            plans = await self.plan_snapshots.process(
+                self.contract,
+                db,
+                module_ctors,
+                concurrency,
+                self.generation_transaction
+            )
 
-            module_import_path = f'{base_module.__name__}.{modulename}'
-            module = importlib.import_module(module_import_path)
-            modules.append(module)
+        self._write_modules(module_ctors, partial)
+        if plans is not None:
+            for module_ctor in module_ctors:
+                self.plan_snapshots.save(module_ctor, plans)
 
-    async def generate(self, db, base_modules: typing.Collection[types.ModuleType] | None = None):
-        if base_modules is not None:
-            for base_module in base_modules:
-                self._pre_generate(base_module)
-        for module_ctor in self.module_ctors.values():
-            await module_ctor.generate_module(db)
+    async def watch(
+            self,
+            db,
+            base_modules: typing.Collection[types.ModuleType],
+            *,
+            concurrency: int = 1,
+            interval: float = 0.2
+    ) -> None:
+        """
+        Generates the code, then keeps regenerating the modules affected by each change in `base_modules`
+        directories, until cancelled. See `querky.watch.Watcher`.
+        """
+        if not self.contract.is_pool(db):
+            concurrency = 1
+        await Watcher(self, db, base_modules, concurrency=concurrency, interval=interval).run()
 
     def generate_sync(self, db, base_modules: typing.Collection[types.ModuleType] | None = None):
-        if base_modules is not None:
-            for base_module in base_modules:
-                self._pre_generate(base_module)
-        for module_ctor in self.module_ctors.values():
-            module_ctor.generate_module_sync(db)
+        self.contract.prepare_generate_sync(db)
+        if self.signature_cache is not None:
+            self.signature_cache.load_sync(self.contract, db)
+        if self.manifest is not None:
+            self.manifest.load(self._get_schema_fingerprint_sync(db), self.get_config_hash())
+
+        self._import_modules(self._get_modules_to_import(base_modules or ()))
+
+        module_ctors = self._get_stale_modules()
+        for query in self._get_queries_to_fetch(module_ctors):
+            query.fetch_types_sync(db)
+
+        self._write_modules(module_ctors)
 
     def sign_file_contents(self, lines: list[str]) -> None:
         lines.insert(0, self.file_signature)
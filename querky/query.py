@@ -7,12 +7,18 @@ import typing
 
 from querky.logger import logger
 from querky.exceptions import QueryInitializationError
-from querky.helpers import ReprHelper, DictGetAttr
+from querky.helpers import ReprHelper, DictGetAttr, to_camel_case, is_literal
+from querky.common_imports import TYPING
 from querky.base_types import TypeKnowledge, QuerySignature
 from querky.conn_param_config import ConnParamConfig
 from querky.param_mapper import ParamMapper
 from querky.attr import attr as _attr_, Attr
-from querky.result_shape import Value, Column, Status, All, One, ResultShape
+from querky.result_shape import Value, Column, Status, All, One, Stream, ResultShape, Prefetch, AdaptivePrefetch
+from querky.upsert import Upsert
+from querky.cache import CachePolicy, ResultCache, get_table_tags, get_written_tables, resolve_cache_policy
+from querky.single_flight import SingleFlight
+from querky.profiling import QueryProfile
+from querky.runtime import QueryExecutor, DEFAULT_BATCH_SIZE
 if typing.TYPE_CHECKING:
     from querky.module_constructor import ModuleConstructor
 
@@ -20,7 +26,11 @@ if typing.TYPE_CHECKING:
 RS = typing.TypeVar('RS', bound='ResultShape')
 
 
-class Query(typing.Generic[RS]):
+# name of the `Querky` object inside standalone generated modules
+RUNTIME_QUERKY_IDENT = "_querky"
+
+
+class Query(QueryExecutor, typing.Generic[RS]):
     defaults: dict[str, typing.Any]
 
     def __init__(
@@ -48,6 +58,7 @@ class Query(typing.Generic[RS]):
         self.module.queries_list.append(self)
 
         self.param_mapper: ParamMapper = self.contract.create_param_mapper(self)
+        self.binder = self.param_mapper.binder
         self.sql = self.param_mapper.parametrize_query()
         self.default = DictGetAttr(self.param_mapper.defaults)
         # side effect: attr gets populated, so we flush it
@@ -67,12 +78,46 @@ class Query(typing.Generic[RS]):
 
         self.bound_type = None
         self.shape: ResultShape = shape(self)
+        self.kind: str = self.shape.kind
+        self.prefetch: Prefetch | None = self.shape.prefetch if isinstance(self.shape, Stream) else None
 
         if not isinstance(self.shape, (One, All)) and parent_query:
             raise ValueError("Only One and All queries can have a parent query.")
+
+        self._standalone: bool | None = None
+        self.copy_table: str | None = self.kwargs.get('copy', None)
+        self.copy_columns: typing.Tuple[str, ...] = tuple(self.get_copy_columns())
+        self.upsert: Upsert | None = self.get_upsert()
+
+        self.batch_size: int | None = self.get_batch_size()
+        if self.batch_size is not None and isinstance(self.shape, (Column, Stream)):
+            raise ValueError("Only status, value, one and many queries can be run in batches.")
         if parent_query and not isinstance(parent_query.shape, (One, All)):
             raise ValueError("Parent query must be of either One or All shape.")
 
+        # tags of the cached results, which become stale once this query is run
+        self.invalidates: typing.Tuple[str, ...] = self.get_invalidated_tags()
+        # the same, but of the rows loaded into the `copy` table
+        self.copy_invalidates: typing.Tuple[str, ...] = self.get_copy_invalidated_tags()
+        self.cache_policy: CachePolicy | None = self.get_cache_policy()
+        self.result_cache: ResultCache | None = None
+        if self.cache_policy is not None:
+            self.result_cache = self.querky.result_caches.create(
+                self.unique_name,
+                self.cache_policy,
+                self.contract.get_immutable_types()
+            )
+
+        self.single_flight: SingleFlight | None = self.get_single_flight()
+        self._profile: QueryProfile | None = self.get_profile()
+        self.slow_threshold: float | None = self.get_slow_threshold()
+
+        self._init_execution()
+        # the converters of the shape look the row factories up on each call, they are bound along with the type
+        self._convert, self._convert_many = self.shape.get_converters()
+        self.compose()
+        self.querky.interceptors.subscribe(self)
+
         logger.debug(
             "Query: %s\nSQL: %s",
             self.unique_name, self.sql
@@ -90,16 +135,75 @@ class Query(typing.Generic[RS]):
     def querky(self):
         return self.module.querky
 
-    def bind_type(self, t) -> None:
+    def bind_type(self, t, row_factory=None, rows_factory=None) -> None:
         self.bound_type = t
+        # specialized converters generated along with the type
+        if row_factory is not None:
+            self.shape.ctor.row_factory = row_factory
+        if rows_factory is not None:
+            self.shape.ctor.rows_factory = rows_factory
+
+    def get_cache_policy(self) -> CachePolicy | None:
+        policy = self.kwargs.get('cache', None)
+        if policy is None or policy is False:
+            return None
+        if policy is True:
+            policy = CachePolicy()
+        # streams are `One` as well, but they are never fetched as a whole
+        if isinstance(self.shape, Stream) or not isinstance(self.shape, (Value, Column, One, All)):
+            raise ValueError("Only value, column, one and many queries can be cached.")
+        if self.invalidates:
+            raise ValueError(
+                f"{self.unique_name}: the query writes into {', '.join(self.invalidates)}, "
+                f"its results can't be cached"
+            )
+        return resolve_cache_policy(policy, self.sql)
+
+    def get_slow_threshold(self) -> float | None:
+        threshold = self.kwargs.get('slow_threshold', None)
+        if threshold is not None and threshold is not False:
+            if isinstance(self.shape, Stream):
+                raise ValueError("Streams can't be logged as slow queries.")
+            if self.querky.slow_query_log is None:
+                raise ValueError(f"{self.unique_name}: slow_threshold needs `Querky(slow_query_log=...)`")
+        if self.querky.slow_query_log is None or isinstance(self.shape, Stream):
+            return None
+        return self.querky.slow_query_log.get_threshold(threshold)
 
-    async def execute(self, conn, *args, **kwargs):
-        params = self.param_mapper.map_params(*args, **kwargs)
-        return await self.shape.fetch(conn, params)
+    def get_profile(self) -> QueryProfile | None:
+        if (profiler := self.querky.profiler) is None or isinstance(self.shape, Stream):
+            return None
+        return profiler.profile(self.unique_name, self.shape.kind)
 
-    def execute_sync(self, conn, *args, **kwargs):
-        params = self.param_mapper.map_params(*args, **kwargs)
-        return self.shape.fetch_sync(conn, params)
+    def get_single_flight(self) -> SingleFlight | None:
+        if not self.kwargs.get('coalesce', False):
+            return None
+        if isinstance(self.shape, Stream) or not isinstance(self.shape, (Value, Column, One, All)):
+            raise ValueError("Only value, column, one and many queries can be coalesced.")
+        if self.invalidates:
+            raise ValueError(
+                f"{self.unique_name}: the query writes into {', '.join(self.invalidates)}, "
+                f"its calls can't be coalesced"
+            )
+        return SingleFlight(self.contract)
+
+    def get_invalidated_tags(self) -> typing.Tuple[str, ...]:
+        invalidates = self.kwargs.get('invalidates', None)
+        if invalidates is None:
+            return get_written_tables(self.sql)
+        if isinstance(invalidates, str):
+            return (invalidates, )
+        return tuple(invalidates)
+
+    def get_copy_invalidated_tags(self) -> typing.Tuple[str, ...]:
+        if self.copy_table is None:
+            return ()
+        if self.kwargs.get('invalidates', None) is not None:
+            return self.invalidates
+        return get_table_tags(self.copy_table)
+
+    def get_copy_columns(self) -> typing.List[str]:
+        return [param.name for param in self.param_mapper.params]
 
     def _after_types_fetched(self):
         # типы параметров передадим мапперу
@@ -107,18 +211,53 @@ class Query(typing.Generic[RS]):
         # а типы аттрибутов - результату
         self.shape.set_attributes(self.query_signature.attributes)
 
-    async def fetch_types(self, db) -> None:
+    async def _get_query_signature(self, db) -> QuerySignature:
+        cache = self.querky.signature_cache
+        if (description := self.querky.prefetched_descriptions.get(self.sql, None)) is not None:
+            if cache is not None:
+                cache.put(self.sql, description)
+            return self.contract.get_query_signature_from_description(description)
+        if cache is None:
+            return await self.contract.get_query_signature(db, self)
+        if (description := cache.get(self.sql)) is None:
+            description = await self.contract.describe_query(db, self)
+            cache.put(self.sql, description)
+        return self.contract.get_query_signature_from_description(description)
+
+    def _get_query_signature_sync(self, db) -> QuerySignature:
+        if (cache := self.querky.signature_cache) is None:
+            return self.contract.get_query_signature_sync(db, self)
+        if (description := cache.get(self.sql)) is None:
+            description = self.contract.describe_query_sync(db, self)
+            cache.put(self.sql, description)
+        return self.contract.get_query_signature_from_description(description)
+
+    async def fetch_signature(self, db) -> QuerySignature:
+        """
+        Only fetches the signature, without applying it, so that signatures of many queries can be fetched concurrently.
+        """
         try:
-            self.query_signature = await self.contract.get_query_signature(db, self)
+            return await self._get_query_signature(db)
+        except QueryInitializationError:
+            raise
+        except Exception as ex:
+            raise QueryInitializationError(self, additional_hint="fetching types") from ex
+
+    def apply_signature(self, query_signature: QuerySignature) -> None:
+        try:
+            self.query_signature = query_signature
             self._after_types_fetched()
         except QueryInitializationError:
             raise
         except Exception as ex:
             raise QueryInitializationError(self, additional_hint="fetching types") from ex
 
+    async def fetch_types(self, db) -> None:
+        self.apply_signature(await self.fetch_signature(db))
+
     def fetch_types_sync(self, db) -> None:
         try:
-            self.query_signature = self.contract.get_query_signature_sync(db, self)
+            self.query_signature = self._get_query_signature_sync(db)
             self._after_types_fetched()
         except QueryInitializationError:
             raise
@@ -141,7 +280,7 @@ class Query(typing.Generic[RS]):
                 old_param = param.param
 
                 if old_param.default is not inspect._empty:
-                    default = ReprHelper(f"{self.local_name}.default.{name}")
+                    default = ReprHelper(self.get_default_expression(name))
                 else:
                     default = inspect._empty
 
@@ -197,10 +336,26 @@ class Query(typing.Generic[RS]):
             arg_remap_string = self.param_mapper.mirror_arguments()
             arg_string = f"{conn_str}, {arg_remap_string}"
 
+            if isinstance(self.shape, Stream):
+                # returns an async iterator right away, so the function itself is not a coroutine
+                async_ = ''
+                body = [f"return {self.local_name}.iterate({arg_string})"]
+            elif self.is_direct():
+                body = self.shape.generate_direct_call_code(
+                    conn_str,
+                    self.get_sql_ident(),
+                    self.param_mapper.bound_arguments()
+                )
+            else:
+                body = [f"return {await_}{self.local_name}.execute{_sync}({arg_string})"]
+
             try:
                 code = [
                     f"{async_}def {self.name}{self.new_signature}:",
-                    f"{self.querky.get_indent(1)}return {await_}{self.local_name}.execute{_sync}({arg_string})"
+                    *[
+                        f"{self.querky.get_indent(1)}{line}"
+                        for line in body
+                    ]
                 ]
             except Exception as _ex:
                 # for debugging
@@ -212,6 +367,271 @@ class Query(typing.Generic[RS]):
             logger.exception('[BAD] - %s', self.unique_name)
             raise ex
 
+    def is_direct(self) -> bool:
+        return self.is_direct_requested() and self.contract.can_call_directly()
+
+    def is_direct_requested(self) -> bool:
+        """
+        Whether the query would be generated as a direct call, if the contract allowed it.
+        """
+        if isinstance(self.shape, Stream):
+            return False
+        # direct calls skip the cache, the invalidation, the coalescing, the metrics, the profiler,
+        # the slow query log and the interceptors.
+        # Any query writing into a table might invalidate some cache, even one declared in a module skipped this time.
+        if self.result_cache is not None or self.invalidates:
+            return False
+        if self.slow_threshold is not None:
+            return False
+        if self.single_flight is not None or self.querky.metrics is not None or self._profile is not None:
+            return False
+        return self.kwargs.get('direct', self.querky.direct_calls)
+
+    def is_standalone(self) -> bool:
+        """
+        Whether the generated module can do without importing this query at all.
+        """
+        if self._standalone is None:
+            self._standalone = self._check_standalone()
+        return self._standalone
+
+    def _check_standalone(self) -> bool:
+        if not self.kwargs.get('standalone', self.querky.standalone):
+            return False
+        # whatever can't be written down as a constant has to be taken from the query object at import time
+        if not all([is_literal(value) for value in self.param_mapper.defaults.values()]):
+            logger.warning("%s: default values are not literals, the query is imported eagerly", self.unique_name)
+            return False
+        ctor = getattr(self.shape, 'ctor', None)
+        if ctor is not None and ctor.row_factory is not None and not ctor.generate_row_factory:
+            logger.warning("%s: the row factory is not generated, the query is imported eagerly", self.unique_name)
+            return False
+        if isinstance(self.shape, Stream) and type(self.shape.prefetch) not in (Prefetch, AdaptivePrefetch):
+            logger.warning("%s: custom prefetch policy, the query is imported eagerly", self.unique_name)
+            return False
+        return True
+
+    def get_default_expression(self, name: str) -> str:
+        if self.is_standalone():
+            return repr(self.param_mapper.defaults[name])
+        return f"{self.local_name}.default.{name}"
+
+    def get_sql_ident(self) -> str:
+        return f"{self.local_name}_sql"
+
+    def generate_direct_call_constants(self) -> typing.List[str]:
+        sql = repr(self.sql) if self.is_standalone() else f"{self.local_name}.sql"
+        return [
+            f"{self.get_sql_ident()} = {sql}",
+            *self.shape.generate_direct_call_constants()
+        ]
+
+    def generate_import_code(self) -> str | None:
+        """
+        How the generated module gets hold of this query: standalone queries are built in place instead.
+        """
+        if self.is_standalone():
+            return None
+        return f"from {self.module.module.__name__} import {self.query.__name__} as {self.local_name}"
+
+    def get_binder_name(self) -> str:
+        return f"{self.local_name}_bind"
+
+    def generate_runtime_query_code(self) -> typing.List[str]:
+        """
+        Constants and the `RuntimeQuery`, which stand in for this query in a standalone module.
+        """
+        i = self.querky.get_indent(1)
+        if self.is_direct():
+            lines = self.generate_direct_call_constants()
+        else:
+            lines = [f"{self.get_sql_ident()} = {repr(self.sql)}"]
+        lines.extend(['', ''])
+        lines.extend(self.param_mapper.generate_binder_code(
+            self.get_binder_name(),
+            lambda name: repr(self.param_mapper.defaults[name])
+        ))
+        lines.extend(['', ''])
+
+        args = [
+            RUNTIME_QUERKY_IDENT,
+            repr(self.unique_name),
+            self.get_sql_ident(),
+            repr(self.shape.kind),
+            self.get_binder_name(),
+        ]
+        ctor = getattr(self.shape, 'ctor', None)
+        if ctor is not None and ctor.generate_row_factory:
+            row_factory, rows_factory = ctor.get_row_factory_names()
+            args.append(f"row_factory={row_factory}")
+            args.append(f"rows_factory={rows_factory}")
+        if isinstance(self.shape, Stream):
+            args.append(f"prefetch={repr(self.shape.prefetch)}")
+        if self.batch_size is not None:
+            args.append(f"batch_size={self.batch_size}")
+        if self.copy_table is not None:
+            args.append(f"copy_table={repr(self.copy_table)}")
+            args.append(f"copy_columns={repr(tuple(self.get_copy_columns()))}")
+            args.append(f"copy_invalidates={repr(self.copy_invalidates)}")
+        if self.upsert is not None:
+            args.append(f"upsert={repr(self.upsert)}")
+        if self.cache_policy is not None:
+            args.append(f"cache={repr(self.cache_policy)}")
+        if self.single_flight is not None:
+            args.append("coalesce=True")
+        if self.invalidates:
+            args.append(f"invalidates={repr(self.invalidates)}")
+        if (slow_threshold := self.kwargs.get('slow_threshold', None)) is not None:
+            args.append(f"slow_threshold={repr(slow_threshold)}")
+        if self.is_direct():
+            args.append("direct=True")
+
+        lines.append(f"{self.local_name} = RuntimeQuery(")
+        lines.extend([f"{i}{arg}," for arg in args])
+        lines.append(")")
+        return lines
+
+    def get_batch_size(self) -> int | None:
+        batch = self.kwargs.get('batch', False)
+        if batch is None or batch is False:
+            return None
+        if batch is True:
+            return DEFAULT_BATCH_SIZE
+        if batch < 1:
+            raise ValueError("batch size must be positive")
+        return batch
+
+    def get_batch_function_name(self) -> str:
+        return f"{self.name}_many"
+
+    def get_batch_args_typename(self) -> str:
+        return f"{to_camel_case(self.name)}Args"
+
+    def _check_async_contract(self, feature: str) -> None:
+        # batches, `COPY` and upserts are only run by the async methods of the contract
+        if not self.contract.is_async():
+            raise QueryInitializationError(
+                self,
+                f"{feature} requires an asynchronous contract, {type(self.contract).__name__} is synchronous"
+            )
+
+    def _generate_batch_code(self) -> typing.List[str]:
+        self._check_async_contract("`batch`")
+        i = self.querky.get_indent(1)
+        typename = self.get_batch_args_typename()
+        required = [p for p in self.param_mapper.params if p.param.default is inspect._empty]
+        optional = [p for p in self.param_mapper.params if p.param.default is not inspect._empty]
+
+        # defaulted parameters go to a `total=False` subclass
+        lines = []
+        if required and optional:
+            base = f"_{typename}Required"
+            lines.append(f"class {base}(typing.TypedDict):")
+            lines.extend([f"{i}{p.name}: {p.type_knowledge.typehint}" for p in required])
+            lines.extend(['', ''])
+            lines.append(f"class {typename}({base}, total=False):")
+            lines.extend([f"{i}{p.name}: {p.type_knowledge.typehint}" for p in optional])
+        elif required or optional:
+            total = '' if required else ', total=False'
+            lines.append(f"class {typename}(typing.TypedDict{total}):")
+            lines.extend([f"{i}{p.name}: {p.type_knowledge.typehint}" for p in self.param_mapper.params])
+        else:
+            lines.append(f"class {typename}(typing.TypedDict):")
+            lines.append(f"{i}pass")
+        lines.extend(['', ''])
+
+        args_hint = f"typing.Iterable[typing.Union[{self.get_row_tuple_hint()}, {typename}]]"
+
+        conn_str = self.conn_param_config.name
+        conn_hint = self.conn_type_knowledge.typehint
+        conn_annotation = f": {conn_hint}" if conn_hint is not None else ''
+        lines.append(
+            f"async def {self.get_batch_function_name()}("
+            f"{conn_str}{conn_annotation}, args: {args_hint}, /, *, chunk_size: int = {self.batch_size}"
+            f") -> {self.shape.get_batch_annotation()}:"
+        )
+        lines.append(f"{i}return await {self.local_name}.execute_many({conn_str}, args, chunk_size=chunk_size)")
+        return lines
+
+    def get_copy_function_name(self) -> str:
+        return f"copy_{self.name}"
+
+    def get_row_tuple_hint(self) -> str:
+        if not self.param_mapper.params:
+            return "typing.Tuple[()]"
+        return f"typing.Tuple[{', '.join([p.type_knowledge.typehint for p in self.param_mapper.params])}]"
+
+    def _generate_copy_code(self) -> typing.List[str]:
+        self._check_async_contract("`copy`")
+        row_hint = self.get_row_tuple_hint()
+        rows_hint = f"typing.Union[typing.Iterable[{row_hint}], typing.AsyncIterable[{row_hint}]]"
+        conn_str = self.conn_param_config.name
+        conn_hint = self.conn_type_knowledge.typehint
+        conn_annotation = f": {conn_hint}" if conn_hint is not None else ''
+        return [
+            f"async def {self.get_copy_function_name()}("
+            f"{conn_str}{conn_annotation}, rows: {rows_hint}, /, *, chunk_size: int | None = None"
+            f") -> int:",
+            f"{self.querky.get_indent(1)}return await {self.local_name}.copy_records({conn_str}, rows, chunk_size=chunk_size)"
+        ]
+
+    def get_upsert(self) -> Upsert | None:
+        upsert = self.kwargs.get('upsert', None)
+        if upsert is None:
+            return None
+        if not isinstance(upsert, Upsert):
+            # shorthand: just the conflict columns
+            if isinstance(upsert, str):
+                upsert = (upsert, )
+            upsert = Upsert(conflict=tuple(upsert))
+        if self.copy_table is None:
+            raise ValueError(f"{self.unique_name}: `upsert` requires a `copy` table")
+        if not upsert.conflict:
+            raise ValueError(f"{self.unique_name}: `upsert` requires at least one conflict column")
+        columns = self.get_copy_columns()
+        for column in (*upsert.conflict, *(upsert.update or ())):
+            if column not in columns:
+                raise ValueError(f"{self.unique_name}: upsert column `{column}` is not a parameter of the query")
+        return upsert
+
+    def get_upsert_function_name(self) -> str:
+        return f"upsert_{self.name}"
+
+    def get_upsert_annotation(self) -> str:
+        if not self.upsert.returning:
+            return "int"
+        hints = {
+            param.name: param.type_knowledge.typehint
+            for param in self.param_mapper.params
+        }
+        if len(self.upsert.conflict) == 1:
+            return f"typing.List[{hints[self.upsert.conflict[0]]}]"
+        return f"typing.List[typing.Tuple[{', '.join([hints[c] for c in self.upsert.conflict])}]]"
+
+    def _generate_upsert_code(self) -> typing.List[str]:
+        self._check_async_contract("`upsert`")
+        row_hint = self.get_row_tuple_hint()
+        rows_hint = f"typing.Union[typing.Iterable[{row_hint}], typing.AsyncIterable[{row_hint}]]"
+        conn_str = self.conn_param_config.name
+        conn_hint = self.conn_type_knowledge.typehint
+        conn_annotation = f": {conn_hint}" if conn_hint is not None else ''
+        return [
+            f"async def {self.get_upsert_function_name()}("
+            f"{conn_str}{conn_annotation}, rows: {rows_hint}, /, *, chunk_size: int | None = None"
+            f") -> {self.get_upsert_annotation()}:",
+            f"{self.querky.get_indent(1)}return await {self.local_name}.upsert_records({conn_str}, rows, chunk_size=chunk_size)"
+        ]
+
+    def get_bind_args(self) -> typing.List[str]:
+        if (bound_type_ident := self.get_type_bind_ident()) is None:
+            return []
+        bind_args = [bound_type_ident]
+        ctor = self.shape.ctor
+        if ctor.generate_row_factory and ctor.query.module is self.module:
+            # converters were generated along with the type in this very module
+            bind_args.extend(ctor.get_row_factory_names())
+        return bind_args
+
     def get_type_bind_ident(self) -> typing.Optional[str]:
         if isinstance(self.shape, (Value, Column, Status)):
             return None
@@ -231,6 +651,13 @@ class Query(typing.Generic[RS]):
                 raise ValueError("parent shape must be ether One or All")
             shape: typing.Union[One, All] = parent_shape
             exports.add(shape.ctor.typename)
+        if self.batch_size is not None:
+            exports.add(self.get_batch_function_name())
+            exports.add(self.get_batch_args_typename())
+        if self.copy_table is not None:
+            exports.add(self.get_copy_function_name())
+        if self.upsert is not None:
+            exports.add(self.get_upsert_function_name())
         return exports
 
     def get_imports(self):
@@ -241,11 +668,29 @@ class Query(typing.Generic[RS]):
         if self.conn_type_knowledge is not None:
             imports.update(self.conn_type_knowledge.get_imports())
 
+        if self.batch_size is not None or self.copy_table is not None:
+            imports.add(TYPING)
+
+        if self.is_standalone():
+            module_name, _, attribute = self.querky.get_runtime_source().partition(':')
+            imports.add(f"from {module_name} import {attribute} as {RUNTIME_QUERKY_IDENT}")
+            imports.add("from querky.runtime import RuntimeQuery")
+            if isinstance(self.shape, Stream):
+                imports.add(f"from querky.result_shape import {type(self.shape.prefetch).__name__}")
+            if self.upsert is not None:
+                imports.add("from querky.upsert import Upsert")
+            if self.cache_policy is not None:
+                imports.add("from querky.cache import CachePolicy")
+
         if (parent := self.parent_query) and parent.module is not self.module:
             parent_shape = parent.shape
             if isinstance(parent_shape, (One, All)):
+                names = [parent_shape.ctor.typename]
+                if self.is_standalone() and parent_shape.ctor.generate_row_factory:
+                    # the runtime query uses the parent's row factories
+                    names.extend(parent_shape.ctor.get_row_factory_names())
                 imports.add(
-                    f"from {parent.module.module_path} import {parent_shape.ctor.typename}"
+                    f"from {parent.module.module_path} import {', '.join(names)}"
                 )
             else:
                 raise ValueError("you can only use return types from 'one' and 'many' queries")
@@ -271,14 +716,42 @@ class Query(typing.Generic[RS]):
             func_code = cb(func_code, self)
         lines.extend(func_code)
 
-        if bound_type_ident := self.get_type_bind_ident():
+        if self.batch_size is not None:
+            lines.append('')
+            lines.append('')
+            lines.extend(self._generate_batch_code())
+
+        if self.copy_table is not None:
+            lines.append('')
+            lines.append('')
+            lines.extend(self._generate_copy_code())
+
+        if self.upsert is not None:
+            lines.append('')
+            lines.append('')
+            lines.extend(self._generate_upsert_code())
+
+        if self.is_standalone():
+            # built from the constants right here, without the `Query` object
+            lines.append('')
+            lines.extend(self.generate_runtime_query_code())
+            return lines
+
+        if bind_args := self.get_bind_args():
             # binding return type to the underlying query
             lines.append('')
-            lines.append(f'{self.local_name}.bind_type({bound_type_ident})')
+            lines.append(f'{self.local_name}.bind_type({", ".join(bind_args)})')
+
+        if self.is_direct():
+            # direct calls skip the `Query` object, so everything they need is precomputed on the module level
+            lines.append('')
+            lines.extend(self.generate_direct_call_constants())
 
         return lines
 
     def __call__(self, conn, *args, **kwargs):
+        if isinstance(self.shape, Stream):
+            return self.iterate(conn, *args, **kwargs)
         if self.contract.is_async():
             return self.execute(conn, *args, **kwargs)
         else:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 
+import sys
 import typing
 
 from querky.base_types import TypeKnowledge, TypeMetaData
@@ -13,6 +14,9 @@ if typing.TYPE_CHECKING:
 
 
 class ResultShape(ABC, GetImportsMixin):
+    # shape of the `RuntimeQuery` built in place of the query by standalone modules
+    kind: str
+
     def __init__(self, query: Query) -> None:
         self.query: Query = query
         self.return_type: TypeKnowledge | None = None
@@ -35,20 +39,39 @@ class ResultShape(ABC, GetImportsMixin):
     def get_annotation(self) -> str:
         return self.return_type.typehint
 
-    @abstractmethod
-    async def fetch(self, conn, bound_params):
-        ...
-
-    @abstractmethod
-    async def fetch_sync(self, conn, bound_params):
-        ...
+    def get_converters(self) -> typing.Tuple[typing.Callable | None, typing.Callable | None]:
+        """
+        :return: functions, which turn what the contract has returned into the result:
+                 of a call (or a chunk of a stream) and of a batch. None means the result is returned as is.
+        """
+        return None, None
 
     @abstractmethod
     def get_exports(self) -> typing.Sequence[str]:
         ...
 
+    def get_batch_annotation(self) -> str:
+        """
+        Return annotation of the generated `<name>_many` function.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
+
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        """
+        Body of the generated function, which calls the driver directly instead of going through `Query.execute`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support direct calls")
+
+    def generate_direct_call_constants(self) -> typing.List[str]:
+        """
+        Module level names the direct call body relies on.
+        """
+        return []
+
 
 class Value(ResultShape):
+    kind = 'value'
+
     def __init__(self, query: Query, annotation: str | TypeMetaData | None = None, *, optional: bool = False):
         super().__init__(query)
         self.annotation = annotation
@@ -87,13 +110,18 @@ class Value(ResultShape):
     def generate_type_code(self) -> typing.List[str] | None:
         return None
 
-    async def fetch(self, conn, bound_params):
-        contract = self.query.module.querky.contract
-        return await contract.fetch_value(conn, self.query, bound_params)
+    def convert_many(self, rows):
+        return [row[0] for row in rows]
+
+    def get_converters(self) -> typing.Tuple[typing.Callable | None, typing.Callable | None]:
+        return None, self.convert_many
 
-    def fetch_sync(self, conn, bound_params):
-        contract = self.query.module.querky.contract
-        return contract.fetch_value_sync(conn, self.query, bound_params)
+    def get_batch_annotation(self) -> str:
+        return f"typing.List[{self.return_type.typehint}]"
+
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        call = self.query.contract.generate_direct_call('value', conn, sql, args)
+        return [f"return {call}"]
 
     def get_exports(self) -> typing.Sequence[str]:
         return []
@@ -106,6 +134,8 @@ def value_(annotation: str | TypeMetaData | None = None, *, optional: bool = Fal
 
 
 class Column(Value):
+    kind = 'column'
+
     def __init__(self, query: Query, annotation: str | TypeMetaData | None = None, *, elem_optional: bool = True):
         super().__init__(query, annotation, optional=False)
         self.elem_optional = elem_optional
@@ -121,13 +151,15 @@ class Column(Value):
     def annotate(self):
         pass
 
-    async def fetch(self, conn, params):
-        contract = self.query.module.querky.contract
-        return await contract.fetch_column(conn, self.query, params)
+    def get_converters(self) -> typing.Tuple[typing.Callable | None, typing.Callable | None]:
+        return None, None
+
+    def get_batch_annotation(self) -> str:
+        raise NotImplementedError("columns do not support batches")
 
-    def fetch_sync(self, conn, params):
-        contract = self.query.module.querky.contract
-        return contract.fetch_column_sync(conn, self.query, params)
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        call = self.query.contract.generate_direct_call('all', conn, sql, args)
+        return [f"return [__row[0] for __row in {call}]"]
 
 
 def column_(annotation: str | TypeMetaData | None = None, *, elem_optional: bool = False) -> typing.Callable[[Query], ResultShape]:
@@ -137,6 +169,8 @@ def column_(annotation: str | TypeMetaData | None = None, *, elem_optional: bool
 
 
 class One(ResultShape):
+    kind = 'one'
+
     def __init__(self, query: Query, typename: str | None, *, optional: bool = True):
         super().__init__(query)
 
@@ -195,7 +229,10 @@ class One(ResultShape):
 
     def generate_type_code(self) -> typing.List[str] | None:
         if self.ctor is not None and not self.ctor.type_code_generated:
-            return self.ctor.generate_type_code()
+            lines = self.ctor.generate_type_code()
+            if row_factory_code := self.ctor.generate_row_factory_code():
+                lines = [*lines, '', '', *row_factory_code]
+            return lines
         else:
             return None
 
@@ -205,19 +242,62 @@ class One(ResultShape):
             return s.union(self.ctor.get_imports())
         return s
 
-    async def fetch(self, conn, params):
-        contract = self.query.module.querky.contract
-        row = await contract.fetch_one(conn, self.query, params)
+    def convert(self, row):
         if self.ctor.row_factory and row is not None:
             row = self.ctor.row_factory(row)
         return row
 
-    def fetch_sync(self, conn, params):
-        contract = self.query.module.querky.contract
-        row = contract.fetch_one_sync(conn, self.query, params)
-        if self.ctor.row_factory:
-            row = self.ctor.row_factory(row)
-        return row
+    def convert_many(self, rows):
+        if self.ctor is None:
+            return rows
+        if self.ctor.rows_factory:
+            rows = self.ctor.rows_factory(rows)
+        elif self.ctor.row_factory:
+            rows = [
+                self.ctor.row_factory(row)
+                for row in rows
+            ]
+        return rows
+
+    def get_converters(self) -> typing.Tuple[typing.Callable | None, typing.Callable | None]:
+        # the row factories are looked up on each call, since they are bound along with the type
+        return self.convert, self.convert_many
+
+    def get_batch_annotation(self) -> str:
+        if self.ctor is not None:
+            typename = self.ctor.typename
+        else:
+            typename = self.query.contract.get_default_record_type_metadata().counterpart
+        return f"typing.List[{typename}]"
+
+    def get_row_factory_ident(self) -> str | None:
+        if self.ctor is not None and (self.ctor.row_factory or self.ctor.generate_row_factory):
+            return f"{self.query.local_name}_row_factory"
+        return None
+
+    def get_rows_factory_ident(self) -> str | None:
+        if self.ctor is not None and self.ctor.generate_row_factory:
+            return f"{self.query.local_name}_rows_factory"
+        return None
+
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        call = self.query.contract.generate_direct_call('one', conn, sql, args)
+        if (row_factory := self.get_row_factory_ident()) is None:
+            return [f"return {call}"]
+        return [
+            f"__row = {call}",
+            f"if __row is None:",
+            f"{self.querky.get_indent(1)}return None",
+            f"return {row_factory}(__row)"
+        ]
+
+    def generate_direct_call_constants(self) -> typing.List[str]:
+        if (row_factory := self.get_row_factory_ident()) is None:
+            return []
+        if self.query.is_standalone():
+            # standalone queries only ever use generated row factories
+            return [f"{row_factory} = {self.ctor.get_row_factory_names()[0]}"]
+        return [f"{row_factory} = {self.query.local_name}.shape.ctor.row_factory"]
 
     def get_exports(self) -> typing.Sequence[str]:
         if self.ctor is not None:
@@ -233,6 +313,8 @@ def one_(typename: str | None, *, optional: bool = True) -> typing.Callable[[Que
 
 
 class All(One):
+    kind = 'all'
+
     def __init__(self, query: Query, typename: str | None,):
         super().__init__(query, typename, optional=False)
         self.return_type.is_optional = False
@@ -243,25 +325,23 @@ class All(One):
     def annotate(self):
         pass
 
-    async def fetch(self, conn, params):
-        contract = self.query.module.querky.contract
-        rows = await contract.fetch_all(conn, self.query, params)
-        if self.ctor.row_factory:
-            rows = [
-                self.ctor.row_factory(row)
-                for row in rows
-            ]
-        return rows
+    def convert(self, rows):
+        return self.convert_many(rows)
 
-    def fetch_sync(self, conn, params):
-        contract = self.query.module.querky.contract
-        rows = contract.fetch_all_sync(conn, self.query, params)
-        if self.ctor.row_factory:
-            rows = [
-                self.ctor.row_factory(row)
-                for row in rows
-            ]
-        return rows
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        call = self.query.contract.generate_direct_call('all', conn, sql, args)
+        if (rows_factory := self.get_rows_factory_ident()) is not None:
+            return [f"return {rows_factory}({call})"]
+        if (row_factory := self.get_row_factory_ident()) is None:
+            return [f"return {call}"]
+        return [f"return [{row_factory}(__row) for __row in {call}]"]
+
+    def generate_direct_call_constants(self) -> typing.List[str]:
+        if (rows_factory := self.get_rows_factory_ident()) is None:
+            return super().generate_direct_call_constants()
+        if self.query.is_standalone():
+            return [f"{rows_factory} = {self.ctor.get_row_factory_names()[1]}"]
+        return [f"{rows_factory} = {self.query.local_name}.shape.ctor.rows_factory"]
 
 
 def all_(typename: str | None) -> typing.Callable[[Query], ResultShape]:
@@ -270,7 +350,120 @@ def all_(typename: str | None) -> typing.Callable[[Query], ResultShape]:
     return late_binding
 
 
+class Prefetch:
+    def __init__(self, size: int = 1000):
+        """
+        Fixed number of rows fetched from a server-side cursor at once.
+        """
+        if size < 1:
+            raise ValueError("prefetch size must be positive")
+        self.size = size
+
+    def start(self) -> Prefetch:
+        """
+        :return: the policy of a single iteration. Stateful policies return a copy of their own,
+                 so that concurrent iterations over the same query don't tune the chunk size for each other.
+        """
+        return self
+
+    def next_size(self) -> int:
+        return self.size
+
+    def observe(self, rows: typing.Sequence) -> None:
+        pass
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.size})"
+
+
+class AdaptivePrefetch(Prefetch):
+    def __init__(
+            self,
+            target_bytes: int = 4 * 1024 * 1024,
+            *,
+            initial: int = 100,
+            min_size: int = 10,
+            max_size: int = 50_000
+    ):
+        """
+        Picks the number of rows per fetch, so that a single chunk stays around `target_bytes` in memory.
+        Row size is estimated from the first row of every chunk and smoothed across the chunks of an iteration.
+        """
+        super().__init__(initial)
+        if not (1 <= min_size <= initial <= max_size):
+            raise ValueError("expected 1 <= min_size <= initial <= max_size")
+        self.initial = initial
+        self.target_bytes = target_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.row_bytes: float | None = None
+
+    def start(self) -> AdaptivePrefetch:
+        return AdaptivePrefetch(
+            self.target_bytes,
+            initial=self.initial,
+            min_size=self.min_size,
+            max_size=self.max_size
+        )
+
+    def observe(self, rows: typing.Sequence) -> None:
+        row = rows[0]
+        row_bytes = sys.getsizeof(row) + sum([sys.getsizeof(value) for value in row])
+        if self.row_bytes is None:
+            self.row_bytes = row_bytes
+        else:
+            self.row_bytes = 0.75 * self.row_bytes + 0.25 * row_bytes
+        self.size = max(self.min_size, min(self.max_size, int(self.target_bytes // self.row_bytes)))
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}({self.target_bytes}, "
+            f"initial={self.initial}, min_size={self.min_size}, max_size={self.max_size})"
+        )
+
+
+class Stream(One):
+    kind = 'stream'
+
+    def __init__(self, query: Query, typename: str | None, *, prefetch: Prefetch):
+        self.prefetch = prefetch
+        super().__init__(query, typename, optional=False)
+
+    def get_annotation(self) -> str:
+        return f"RowStream[{self.return_type.typehint}]"
+
+    def get_imports(self) -> set[str]:
+        from querky.runtime import ROW_STREAM_IMPORT
+
+        s = super().get_imports()
+        s.add(ROW_STREAM_IMPORT)
+        return s
+
+    def get_converters(self) -> typing.Tuple[typing.Callable | None, typing.Callable | None]:
+        # the contract returns the rows in chunks
+        return self.convert_many, None
+
+    def get_batch_annotation(self) -> str:
+        raise NotImplementedError("streams do not support batches")
+
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        raise NotImplementedError("streams do not support direct calls")
+
+
+def stream_(typename: str | None, *, prefetch: Prefetch | int | None = None) -> typing.Callable[[Query], ResultShape]:
+    if prefetch is None:
+        prefetch = Prefetch()
+    elif isinstance(prefetch, int):
+        prefetch = Prefetch(prefetch)
+
+    def late_binding(query: Query) -> Stream:
+        return Stream(query, typename, prefetch=prefetch)
+    return late_binding
+
+
 class Status(ResultShape):
+    kind = 'status'
+
     def get_annotation(self) -> str:
         return 'str'
 
@@ -280,17 +473,16 @@ class Status(ResultShape):
     def get_imports(self) -> set[str]:
         return set()
 
-    async def fetch(self, conn, bound_params):
-        contract = self.query.module.querky.contract
-        return await contract.fetch_status(conn, self.query, bound_params)
-
-    def fetch_sync(self, conn, bound_params):
-        contract = self.query.module.querky.contract
-        return contract.fetch_status(conn, self.query, bound_params)
-
     def set_attributes(self, attr: typing.Tuple[ResultAttribute, ...]):
         pass
 
+    def get_batch_annotation(self) -> str:
+        return 'None'
+
+    def generate_direct_call_code(self, conn: str, sql: str, args: str) -> typing.List[str]:
+        call = self.query.contract.generate_direct_call('status', conn, sql, args)
+        return [f"return {call}"]
+
     def get_exports(self) -> typing.Sequence[str]:
         return []
 
@@ -311,6 +503,10 @@ __all__ = [
     "one_",
     "All",
     "all_",
+    "Prefetch",
+    "AdaptivePrefetch",
+    "Stream",
+    "stream_",
     "Status",
     "status_",
 ]
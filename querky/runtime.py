@@ -0,0 +1,689 @@
+from __future__ import annotations
+
+import functools
+import itertools
+import time
+import typing
+from contextlib import aclosing
+
+from querky.cache import get_table_tags, resolve_cache_policy
+from querky.single_flight import SingleFlight
+from querky.metrics import measure_result, measure_stream
+from querky.profiling import profile_fetch, profile_fetch_sync
+from querky.slow_log import logging_slow, logging_slow_sync
+
+if typing.TYPE_CHECKING:
+    from querky.querky import Querky
+    from querky.interceptors import Interceptors
+    from querky.result_shape import Prefetch
+    from querky.upsert import Upsert
+    from querky.cache import CachePolicy, ResultCache
+    from querky.metrics import QueryMetrics
+    from querky.slow_log import SlowQueryLog
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+# imported by the generated modules, which annotate streams with it
+ROW_STREAM_IMPORT = "from querky.runtime import RowStream"
+
+T = typing.TypeVar('T')
+
+
+class RowStream(typing.Generic[T]):
+    __slots__ = ('_rows', )
+
+    def __init__(self, rows: typing.AsyncGenerator[T, None]):
+        """
+        Rows of a `stream` query, to be iterated over inside of `async with`:
+
+            async with export_posts(conn) as posts:
+                async for post in posts:
+                    ...
+
+        Leaving the block closes the cursor and the transaction opened for it right away,
+        even if the iteration has been stopped early. Without it, they stay open until the stream is garbage collected,
+        and the connection can't be used meanwhile. Iterating over the whole stream closes them as well.
+        """
+        self._rows = rows
+
+    def __aiter__(self) -> RowStream[T]:
+        return self
+
+    def __anext__(self) -> typing.Awaitable[T]:
+        return self._rows.__anext__()
+
+    async def aclose(self) -> None:
+        await self._rows.aclose()
+
+    async def __aenter__(self) -> RowStream[T]:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._rows.aclose()
+
+
+async def _achunks(
+        rows: typing.Iterable[typing.Any] | typing.AsyncIterable[typing.Any],
+        size: int
+) -> typing.AsyncIterator[typing.List[typing.Any]]:
+    if hasattr(rows, '__aiter__'):
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    else:
+        it = iter(rows)
+        while chunk := list(itertools.islice(it, size)):
+            yield chunk
+
+
+async def _single_chunk(rows: typing.Any) -> typing.AsyncIterator[typing.Any]:
+    yield rows
+
+
+# shape -> contract method
+FETCH_METHODS = {
+    'value': 'fetch_value',
+    'column': 'fetch_column',
+    'one': 'fetch_one',
+    'all': 'fetch_all',
+    'status': 'fetch_status',
+}
+
+
+def _first_column(rows):
+    return [row[0] for row in rows]
+
+
+def _create_rows_converter(row_factory, rows_factory):
+    if rows_factory is not None:
+        return rows_factory
+    if row_factory is not None:
+        def convert_rows(rows):
+            return [row_factory(row) for row in rows]
+        return convert_rows
+    return None
+
+
+def create_batch_binder(
+        binder: typing.Callable[..., tuple]
+) -> typing.Callable[[typing.Sequence | typing.Mapping[str, typing.Any]], tuple]:
+    """
+    Binds an item of a batch: either a tuple of every parameter of the query in order,
+    the way the generated `*_many` functions annotate it, or a dict of them by name.
+    Keyword-only parameters of a tuple are passed by name, positional-only ones of a dict by position.
+    """
+    code = binder.__code__
+    positional = code.co_argcount
+    names = code.co_varnames[:positional + code.co_kwonlyargcount]
+    keywords = names[positional:]
+    positional_only = names[:code.co_posonlyargcount]
+
+    if not keywords and not positional_only:
+        def bind(args):
+            if isinstance(args, dict):
+                return binder(**args)
+            return binder(*args)
+        return bind
+
+    def bind(args):
+        if isinstance(args, dict):
+            args = dict(args)
+            values = []
+            for name in positional_only:
+                if name not in args:
+                    break
+                values.append(args.pop(name))
+            return binder(*values, **args)
+        if len(args) > len(names):
+            raise TypeError(f"{binder.__name__}() takes {len(names)} arguments but {len(args)} were given")
+        return binder(*args[:positional], **dict(zip(keywords, args[positional:])))
+    return bind
+
+
+def _invalidating(fetch, invalidate: typing.Callable[[typing.Any], None]):
+    async def invalidating_fetch(conn, params):
+        try:
+            return await fetch(conn, params)
+        finally:
+            invalidate(conn)
+    return invalidating_fetch
+
+
+def _invalidating_sync(fetch, invalidate: typing.Callable[[typing.Any], None]):
+    def invalidating_fetch(conn, params):
+        try:
+            return fetch(conn, params)
+        finally:
+            invalidate(conn)
+    return invalidating_fetch
+
+
+def _measured(fetch, metrics: QueryMetrics, name: str, shape: str):
+    async def measured_fetch(conn, params):
+        start = time.perf_counter()
+        try:
+            result = await fetch(conn, params)
+        except Exception:
+            metrics.record_error(name, shape, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        rows, size = measure_result(shape, result)
+        metrics.record(name, shape, seconds, rows, size)
+        return result
+    return measured_fetch
+
+
+def _measured_sync(fetch, metrics: QueryMetrics, name: str, shape: str):
+    def measured_fetch(conn, params):
+        start = time.perf_counter()
+        try:
+            result = fetch(conn, params)
+        except Exception:
+            metrics.record_error(name, shape, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        rows, size = measure_result(shape, result)
+        metrics.record(name, shape, seconds, rows, size)
+        return result
+    return measured_fetch
+
+
+def _intercepted(fetch, query, interceptors: Interceptors):
+    trigger = interceptors.trigger
+    before = interceptors.has_callbacks('before')
+    after = interceptors.has_callbacks('after')
+    error = interceptors.has_callbacks('error')
+
+    async def intercepted_fetch(conn, params):
+        if before:
+            await trigger('before', query, params)
+        try:
+            result = await fetch(conn, params)
+        except Exception as ex:
+            if error:
+                await trigger('error', query, params, ex)
+            raise
+        if after:
+            await trigger('after', query, params, result)
+        return result
+    return intercepted_fetch
+
+
+def _intercepted_sync(fetch, query, interceptors: Interceptors):
+    trigger = interceptors.trigger_sync
+    before = interceptors.has_callbacks('before')
+    after = interceptors.has_callbacks('after')
+    error = interceptors.has_callbacks('error')
+
+    def intercepted_fetch(conn, params):
+        if before:
+            trigger('before', query, params)
+        try:
+            result = fetch(conn, params)
+        except Exception as ex:
+            if error:
+                trigger('error', query, params, ex)
+            raise
+        if after:
+            trigger('after', query, params, result)
+        return result
+    return intercepted_fetch
+
+
+def compose_fetch(
+        query,
+        fetch: typing.Callable[[typing.Any, tuple], typing.Awaitable],
+        name: str,
+        shape: str,
+        *,
+        single_flight: SingleFlight | None = None,
+        result_cache: ResultCache | None = None,
+        invalidate: typing.Callable[[typing.Any], None] | None = None,
+        metrics: QueryMetrics | None = None,
+        interceptors: Interceptors | None = None,
+        slow_log: SlowQueryLog | None = None,
+        slow_threshold: float | None = None
+) -> typing.Callable[[typing.Any, tuple], typing.Awaitable]:
+    """
+    Wraps `fetch(conn, params)` into the layers the query is configured with, once,
+    so that a call doesn't check for any of them. Without any, `fetch` itself is returned.
+    """
+    if slow_threshold is not None:
+        # innermost, so that only actual executions are logged, not cache hits or coalesced calls
+        fetch = logging_slow(fetch, query, slow_log, slow_threshold)
+    if single_flight is not None:
+        fetch = functools.partial(single_flight.fetch, fetch)
+    if result_cache is not None:
+        fetch = functools.partial(result_cache.fetch, fetch)
+    if invalidate is not None:
+        fetch = _invalidating(fetch, invalidate)
+    if metrics is not None:
+        fetch = _measured(fetch, metrics, name, shape)
+    if interceptors is not None and not interceptors.is_empty():
+        # outermost, so that the time spent in the callbacks doesn't count as the query's
+        fetch = _intercepted(fetch, query, interceptors)
+    return fetch
+
+
+def compose_fetch_sync(
+        query,
+        fetch: typing.Callable[[typing.Any, tuple], typing.Any],
+        name: str,
+        shape: str,
+        *,
+        result_cache: ResultCache | None = None,
+        invalidate: typing.Callable[[typing.Any], None] | None = None,
+        metrics: QueryMetrics | None = None,
+        interceptors: Interceptors | None = None,
+        slow_log: SlowQueryLog | None = None,
+        slow_threshold: float | None = None
+) -> typing.Callable[[typing.Any, tuple], typing.Any]:
+    """
+    Same as `compose_fetch`, concurrent calls are not coalesced though.
+    """
+    if slow_threshold is not None:
+        fetch = logging_slow_sync(fetch, query, slow_log, slow_threshold)
+    if result_cache is not None:
+        fetch = functools.partial(result_cache.fetch_sync, fetch)
+    if invalidate is not None:
+        fetch = _invalidating_sync(fetch, invalidate)
+    if metrics is not None:
+        fetch = _measured_sync(fetch, metrics, name, shape)
+    if interceptors is not None and not interceptors.is_empty():
+        fetch = _intercepted_sync(fetch, query, interceptors)
+    return fetch
+
+
+class QueryExecutor:
+    """
+    Execution of a query, shared by `Query` and `RuntimeQuery`. Subclasses set, before `compose` is called:
+
+    - `querky`, `contract`, `unique_name`, `sql`,
+    - `kind`: one of `value`, `column`, `one`, `all`, `stream` and `status`,
+    - `binder`: function with the signature of the query, which returns the arguments in bind order,
+    - `prefetch`, `batch_size`, `copy_table`, `copy_columns`, `upsert`, `invalidates`, `copy_invalidates`,
+    - `result_cache`, `single_flight`, `slow_threshold`, `_profile`,
+    - `_convert`: turns what the contract has returned for a call (or a chunk of a stream) into the result,
+    - `_convert_many`: the same for the rows of a batch.
+    """
+    __slots__ = ()
+
+    def _init_execution(self) -> None:
+        # everything is dispatched once, so that a call does no lookups by shape
+        kind = self.kind
+        if kind == 'stream':
+            self._fetch = None
+            self._fetch_sync = None
+        elif kind in FETCH_METHODS:
+            self._fetch = getattr(self.contract, FETCH_METHODS[kind])
+            self._fetch_sync = getattr(self.contract, f"{FETCH_METHODS[kind]}_sync")
+        else:
+            raise ValueError(f"Unknown shape: {kind}")
+        self._bind_batch = create_batch_binder(self.binder)
+        self._execute = None
+        self._execute_sync = None
+
+    def compose(self) -> None:
+        """
+        Composes every layer around the contract call once, so that a plain query just calls it.
+        Unless there are any layers, `_execute` is None and the call is made right away.
+        Called again by `Querky.interceptors` each time the callbacks change.
+        """
+        if self.kind == 'stream':
+            return
+        invalidate = self.invalidate_results if self.invalidates else None
+        interceptors = self.querky.interceptors
+        if (
+                self.single_flight is None and self.result_cache is None and invalidate is None
+                and self.querky.metrics is None and interceptors.is_empty() and self._profile is None
+                and self.slow_threshold is None
+        ):
+            self._execute = None
+            self._execute_sync = None
+            return
+        fetch = self._fetch_converted
+        fetch_sync = self._fetch_converted_sync
+        if self._profile is not None:
+            fetch = profile_fetch(self, self._fetch, self._convert)
+            fetch_sync = profile_fetch_sync(self, self._fetch_sync, self._convert)
+        self._execute = compose_fetch(
+            self,
+            fetch,
+            self.unique_name,
+            self.kind,
+            single_flight=self.single_flight,
+            result_cache=self.result_cache,
+            invalidate=invalidate,
+            metrics=self.querky.metrics,
+            interceptors=interceptors,
+            slow_log=self.querky.slow_query_log,
+            slow_threshold=self.slow_threshold
+        )
+        self._execute_sync = compose_fetch_sync(
+            self,
+            fetch_sync,
+            self.unique_name,
+            self.kind,
+            result_cache=self.result_cache,
+            invalidate=invalidate,
+            metrics=self.querky.metrics,
+            interceptors=interceptors,
+            slow_log=self.querky.slow_query_log,
+            slow_threshold=self.slow_threshold
+        )
+
+    async def _fetch_converted(self, conn, params: tuple):
+        result = await self._fetch(conn, self, params)
+        if self._convert is not None:
+            result = self._convert(result)
+        return result
+
+    def _fetch_converted_sync(self, conn, params: tuple):
+        result = self._fetch_sync(conn, self, params)
+        if self._convert is not None:
+            result = self._convert(result)
+        return result
+
+    async def execute(self, conn, *args, **kwargs):
+        if self._fetch is None:
+            return [row async for row in self.iterate(conn, *args, **kwargs)]
+        if self._profile is not None:
+            return await self._profile.execute(self._execute, self.binder, conn, args, kwargs)
+        params = self.binder(*args, **kwargs)
+        if self._execute is not None:
+            return await self._execute(conn, params)
+        result = await self._fetch(conn, self, params)
+        if self._convert is not None:
+            result = self._convert(result)
+        return result
+
+    def execute_sync(self, conn, *args, **kwargs):
+        if self._fetch_sync is None:
+            raise NotImplementedError("streams are only supported by async contracts")
+        if self._profile is not None:
+            return self._profile.execute_sync(self._execute_sync, self.binder, conn, args, kwargs)
+        params = self.binder(*args, **kwargs)
+        if self._execute_sync is not None:
+            return self._execute_sync(conn, params)
+        return self._fetch_converted_sync(conn, params)
+
+    def invalidate_results(self, conn=None) -> None:
+        """
+        Drops the cached results, which depend on the tables this query writes into.
+        Called even if the query fails, since the server might have run it anyway.
+
+        :param conn: the connection the query was run on: inside of a transaction,
+                     the results are dropped once again after it is over.
+        """
+        self.querky.result_caches.invalidate(self.invalidates, conn)
+
+    def bind_any(self, args: typing.Sequence | typing.Mapping[str, typing.Any]):
+        """
+        Binds an item of a batch: a tuple of every parameter in order, or a dict of them by name.
+        """
+        return self._bind_batch(args)
+
+    async def execute_many(
+            self,
+            conn,
+            args: typing.Iterable[typing.Sequence | typing.Mapping[str, typing.Any]],
+            *,
+            chunk_size: int | None = None
+    ):
+        """
+        Executes the query for every argument tuple (or dict) in chunks of `chunk_size`.
+        Chunks are not atomic together - wrap the call in a transaction if you need them to be.
+        :return: None for status queries, a list of all returned values/rows otherwise.
+        """
+        if self.kind in ('column', 'stream'):
+            raise NotImplementedError(f"{self.kind} queries do not support batches")
+        chunk_size = chunk_size or self.batch_size or DEFAULT_BATCH_SIZE
+        is_status = self.kind == 'status'
+        results = None if is_status else []
+        bind_any = self.bind_any
+        it = iter(args)
+        try:
+            while chunk := [bind_any(a) for a in itertools.islice(it, chunk_size)]:
+                if is_status:
+                    await self.contract.execute_many(conn, self, chunk)
+                    continue
+                rows = await self.contract.fetch_many(conn, self, chunk)
+                if self._convert_many is not None:
+                    rows = self._convert_many(rows)
+                results.extend(rows)
+        finally:
+            if self.invalidates:
+                self.invalidate_results(conn)
+        return results
+
+    def iterate(self, conn, *args, **kwargs) -> RowStream:
+        """
+        :return: rows of a `stream` query, see `RowStream`.
+        """
+        if self.kind != 'stream':
+            raise TypeError(f"{self.unique_name}: only queries shaped 'stream' can be iterated")
+        rows = self._iterate(conn, self.binder(*args, **kwargs))
+        if (metrics := self.querky.metrics) is not None:
+            rows = measure_stream(metrics, self.unique_name, rows)
+        return RowStream(rows)
+
+    async def _iterate(self, conn, params: tuple) -> typing.AsyncIterator:
+        # closed as soon as this generator is, not whenever it's garbage collected
+        async with aclosing(self.contract.fetch_chunks(conn, self, params, self.prefetch)) as chunks:
+            async for rows in chunks:
+                if self._convert is not None:
+                    rows = self._convert(rows)
+                for row in rows:
+                    yield row
+
+    async def copy_records(
+            self,
+            conn,
+            rows: typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence],
+            *,
+            chunk_size: int | None = None
+    ) -> int:
+        """
+        Bulk loads rows into the `copy` table of this query. Rows are tuples of the query's parameters, in order.
+        With `chunk_size`, the rows are sent by several COPY commands, holding at most `chunk_size` rows in memory.
+        :return: number of rows copied.
+        """
+        if self.copy_table is None:
+            raise TypeError(f"{self.unique_name}: query has no `copy` table")
+        try:
+            if chunk_size is None:
+                return await self.contract.copy_records(conn, self, self.copy_table, self.copy_columns, rows)
+            total = 0
+            async for chunk in _achunks(rows, chunk_size):
+                total += await self.contract.copy_records(conn, self, self.copy_table, self.copy_columns, chunk)
+            return total
+        finally:
+            if self.copy_invalidates:
+                self.querky.result_caches.invalidate(self.copy_invalidates, conn)
+
+    async def upsert_records(
+            self,
+            conn,
+            rows: typing.Iterable[typing.Sequence] | typing.AsyncIterable[typing.Sequence],
+            *,
+            chunk_size: int | None = None
+    ) -> typing.List | int:
+        """
+        Bulk upserts rows into the `copy` table of this query: the rows are copied into a temporary staging table,
+        and then merged into the target table, all inside a single transaction.
+        Rows are tuples of the query's parameters, in order.
+        With `chunk_size`, the rows are copied and merged in chunks, holding at most `chunk_size` rows in memory.
+        :return: conflict keys of the affected rows if the upsert is `returning`, their number otherwise.
+        """
+        if self.upsert is None:
+            raise TypeError(f"{self.unique_name}: query has no `upsert` config")
+        if chunk_size is None:
+            # the whole input is streamed by a single COPY
+            chunks = _single_chunk(rows)
+        else:
+            chunks = _achunks(rows, chunk_size)
+        try:
+            return await self.contract.upsert_records(
+                conn,
+                self,
+                self.copy_table,
+                self.copy_columns,
+                self.upsert,
+                chunks
+            )
+        finally:
+            if self.copy_invalidates:
+                self.querky.result_caches.invalidate(self.copy_invalidates, conn)
+
+
+class RuntimeQuery(QueryExecutor):
+    __slots__ = (
+        'querky',
+        'contract',
+        'unique_name',
+        'sql',
+        'kind',
+        'binder',
+        'row_factory',
+        'rows_factory',
+        'prefetch',
+        'batch_size',
+        'copy_table',
+        'copy_columns',
+        'upsert',
+        'invalidates',
+        'copy_invalidates',
+        'slow_threshold',
+        'direct',
+        '_bind_batch',
+        '_profile',
+        'result_cache',
+        'single_flight',
+        '_fetch',
+        '_execute',
+        '_execute_sync',
+        '_fetch_sync',
+        '_convert',
+        '_convert_many',
+        '__weakref__',
+    )
+
+    def __init__(
+            self,
+            querky: Querky,
+            unique_name: str,
+            sql: str,
+            shape: str,
+            binder: typing.Callable[..., tuple],
+            *,
+            row_factory: typing.Callable[[typing.Any], typing.Any] | None = None,
+            rows_factory: typing.Callable[[typing.Sequence[typing.Any]], typing.List[typing.Any]] | None = None,
+            prefetch: Prefetch | None = None,
+            batch_size: int | None = None,
+            copy_table: str | None = None,
+            copy_columns: typing.Sequence[str] = (),
+            upsert: Upsert | None = None,
+            cache: CachePolicy | None = None,
+            coalesce: bool = False,
+            invalidates: typing.Sequence[str] = (),
+            copy_invalidates: typing.Sequence[str] | None = None,
+            slow_threshold: float | bool | None = None,
+            direct: bool = False
+    ):
+        """
+        Everything needed to execute a query and nothing more, built by standalone generated modules
+        instead of `Query`, so that neither the query definitions nor the code generation metadata
+        ever get into the process.
+
+        :param shape: one of `value`, `column`, `one`, `all`, `stream` and `status`.
+        :param binder: function with the signature of the query, which returns the arguments in bind order.
+        :param querky: the `Querky` object the query was declared with, for its contract, caches, metrics and interceptors.
+        :param copy_invalidates: tags dropped by `copy_records` and `upsert_records`, those of `copy_table` by default.
+        :param direct: the generated function calls the driver itself, bypassing this object.
+        """
+        self.querky = querky
+        self.contract = contract = querky.contract
+        self.unique_name = unique_name
+        self.sql = sql
+        self.kind = shape
+        self.binder = binder
+        self.row_factory = row_factory
+        self.rows_factory = rows_factory
+        self.prefetch = prefetch
+        self.batch_size = batch_size
+        self.copy_table = copy_table
+        self.copy_columns = tuple(copy_columns)
+        self.upsert = upsert
+        self.invalidates = tuple(invalidates)
+        self.direct = direct
+        if copy_invalidates is None:
+            copy_invalidates = get_table_tags(copy_table) if copy_table is not None else ()
+        self.copy_invalidates = tuple(copy_invalidates)
+        self.result_cache: ResultCache | None = None
+        if cache is not None:
+            if shape not in ('value', 'column', 'one', 'all'):
+                raise ValueError("Only value, column, one and many queries can be cached.")
+            self.result_cache = querky.result_caches.create(
+                unique_name,
+                resolve_cache_policy(cache, sql),
+                contract.get_immutable_types()
+            )
+        self.single_flight: SingleFlight | None = None
+        if coalesce:
+            if shape not in ('value', 'column', 'one', 'all'):
+                raise ValueError("Only value, column, one and many queries can be coalesced.")
+            self.single_flight = SingleFlight(contract)
+
+        self._init_execution()
+
+        self._convert = None
+        self._convert_many = None
+        if shape == 'one':
+            if row_factory is not None:
+                def convert_row(row):
+                    if row is None:
+                        return None
+                    return row_factory(row)
+                self._convert = convert_row
+            self._convert_many = _create_rows_converter(row_factory, rows_factory)
+        elif shape in ('all', 'stream'):
+            self._convert = _create_rows_converter(row_factory, rows_factory)
+            self._convert_many = self._convert
+        elif shape == 'value':
+            self._convert_many = _first_column
+
+        self.slow_threshold: float | None = None
+        if querky.slow_query_log is not None and shape != 'stream':
+            self.slow_threshold = querky.slow_query_log.get_threshold(slow_threshold)
+        self._profile = None
+        if querky.profiler is not None and shape != 'stream':
+            self._profile = querky.profiler.profile(unique_name, shape)
+        self.compose()
+        querky.interceptors.subscribe(self)
+
+    def is_direct(self) -> bool:
+        return self.direct
+
+    def __call__(self, conn, *args, **kwargs):
+        if self.kind == 'stream':
+            return self.iterate(conn, *args, **kwargs)
+        if self.contract.is_async():
+            return self.execute(conn, *args, **kwargs)
+        return self.execute_sync(conn, *args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"<RuntimeQuery {self.unique_name}>"
+
+
+__all__ = [
+    "QueryExecutor",
+    "RuntimeQuery",
+    "create_batch_binder",
+    "DEFAULT_BATCH_SIZE"
+]
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import typing
+from os import path
+
+from querky.base_types import QueryDescription
+
+
+SIGNATURE_CACHE_VERSION = 1
+DEFAULT_SIGNATURE_CACHE_FILENAME = ".querky_signatures.json"
+
+
+def hash_sql(sql: str) -> str:
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+
+def fingerprint_files(*paths: str) -> str:
+    """
+    A schema fingerprint which does not need the database: a digest of the given files
+    (e.g. migrations) and of every file inside the given directories.
+    """
+    digest = hashlib.sha256()
+    for p in paths:
+        if path.isdir(p):
+            filepaths = sorted([
+                path.join(dirpath, filename)
+                for dirpath, _, filenames in os.walk(p)
+                for filename in filenames
+            ])
+        else:
+            filepaths = [p]
+        for filepath in filepaths:
+            # renaming a migration is a change too
+            digest.update(path.basename(filepath).encode('utf-8'))
+            with open(filepath, mode='rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class SignatureCache:
+    def __init__(self, filepath: str, fingerprint: str | None = None):
+        """
+        Persistent storage of raw query signatures, keyed on the hash of the query's SQL.
+        The whole cache is dropped, once the schema fingerprint changes.
+
+        :param filepath: path to the cache file.
+        :param fingerprint: schema fingerprint, e.g. `fingerprint_files('migrations')`.
+                            If not set, the contract computes it with a single query to the database.
+                            Otherwise, a warm run does not talk to the database at all.
+        """
+        self.filepath = filepath
+        self.fingerprint = fingerprint
+        self.entries: dict[str, QueryDescription] = dict()
+        self.used: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self._loaded_fingerprint: str | None = None
+        self._dirty = False
+
+    @property
+    def loaded_fingerprint(self) -> str | None:
+        return self._loaded_fingerprint
+
+    def _read(self) -> None:
+        self.entries = dict()
+        self.used = set()
+        self._dirty = False
+        if not path.isfile(self.filepath):
+            self._loaded_fingerprint = None
+            return
+
+        with open(self.filepath, encoding='utf-8', mode='r') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = None
+
+        if not isinstance(data, dict) or data.get('version', None) != SIGNATURE_CACHE_VERSION:
+            self._loaded_fingerprint = None
+            return
+
+        self._loaded_fingerprint = data['fingerprint']
+        for key, entry in data['queries'].items():
+            self.entries[key] = QueryDescription(
+                parameters=tuple([tuple(raw_type) for raw_type in entry['parameters']]),
+                attributes=tuple([(name, tuple(raw_type)) for name, raw_type in entry['attributes']])
+            )
+
+    def _apply_fingerprint(self, fingerprint: str) -> None:
+        self._read()
+        if self._loaded_fingerprint != fingerprint:
+            self.entries = dict()
+            self._dirty = True
+        self._loaded_fingerprint = fingerprint
+
+    async def load(self, contract, db) -> None:
+        fingerprint = self.fingerprint
+        if fingerprint is None:
+            fingerprint = await contract.get_schema_fingerprint(db)
+        self._apply_fingerprint(fingerprint)
+
+    def load_sync(self, contract, db) -> None:
+        fingerprint = self.fingerprint
+        if fingerprint is None:
+            fingerprint = contract.get_schema_fingerprint_sync(db)
+        self._apply_fingerprint(fingerprint)
+
+    def __contains__(self, sql: str) -> bool:
+        return hash_sql(sql) in self.entries
+
+    def get(self, sql: str) -> QueryDescription | None:
+        key = hash_sql(sql)
+        if (description := self.entries.get(key, None)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.add(key)
+        return description
+
+    def put(self, sql: str, description: QueryDescription) -> None:
+        key = hash_sql(sql)
+        self.entries[key] = description
+        self.used.add(key)
+        self._dirty = True
+
+    def save(self, prune: bool = True) -> None:
+        """
+        :param prune: keep only the signatures used during this run: the ones of removed or changed queries are dropped.
+        """
+        if not self._dirty and (not prune or self.used == self.entries.keys()):
+            return
+        data = {
+            'version': SIGNATURE_CACHE_VERSION,
+            'fingerprint': self._loaded_fingerprint,
+            'queries': {
+                key: {
+                    'parameters': [list(raw_type) for raw_type in description.parameters],
+                    'attributes': [[name, list(raw_type)] for name, raw_type in description.attributes]
+                }
+                for key, description in sorted(self.entries.items())
+                if not prune or key in self.used
+            }
+        }
+        dirname = path.dirname(self.filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp_filepath = f"{self.filepath}.tmp"
+        with open(tmp_filepath, encoding='utf-8', mode='w') as f:
+            json.dump(data, f, indent=1)
+            f.write('\n')
+        os.replace(tmp_filepath, self.filepath)
+        self._dirty = False
+
+
+__all__ = [
+    "SignatureCache",
+    "fingerprint_files",
+    "hash_sql",
+    "DEFAULT_SIGNATURE_CACHE_FILENAME"
+]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import typing
+from dataclasses import dataclass
+
+from querky.cache import IMMUTABLE_TYPES, copy_result
+if typing.TYPE_CHECKING:
+    from querky.contract import Contract
+
+
+@dataclass(slots=True)
+class SingleFlightStats:
+    executions: int = 0
+    coalesced: int = 0
+
+
+class _LeaderGone(Exception):
+    """
+    The call everyone was waiting for was cancelled: one of the followers has to run the query instead.
+    """
+
+
+class SingleFlight:
+    __slots__ = ('contract', 'stats', '_copy', '_calls')
+
+    def __init__(self, contract: Contract):
+        """
+        Concurrent calls of a query with the same bound arguments await a single execution and share its result.
+        Every follower gets its own copy of the result, so that the callers can't mutate it for each other.
+        """
+        self.contract = contract
+        self.stats = SingleFlightStats()
+        immutable_types = (*IMMUTABLE_TYPES, *contract.get_immutable_types())
+        self._copy = lambda value: copy_result(value, immutable_types)
+        # bound arguments -> result of the call in flight
+        self._calls: dict[tuple, asyncio.Future] = dict()
+
+    async def fetch(self, fetch: typing.Callable[[typing.Any, tuple], typing.Awaitable], conn, params: tuple):
+        # a transaction might see its own uncommitted writes, which nobody else is to see
+        if self.contract.is_in_transaction(conn):
+            return await fetch(conn, params)
+        try:
+            future = self._calls.get(params, None)
+        except TypeError:
+            # unhashable arguments (e.g. lists for arrays) are never coalesced
+            return await fetch(conn, params)
+
+        if future is not None:
+            self.stats.coalesced += 1
+        while future is not None:
+            try:
+                # shielded, so that a cancelled follower doesn't cancel the call for the others
+                return self._copy(await asyncio.shield(future))
+            except _LeaderGone:
+                # maybe another follower has already taken over
+                future = self._calls.get(params, None)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[params] = future
+        self.stats.executions += 1
+        try:
+            result = await fetch(conn, params)
+        except Exception as ex:
+            future.set_exception(ex)
+            raise
+        except BaseException:
+            # cancelled: the followers are not, they run the query themselves
+            future.set_exception(_LeaderGone())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[params]
+            if future.done() and not future.cancelled():
+                # retrieved, so that asyncio doesn't complain about it, if nobody was waiting
+                future.exception()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+__all__ = [
+    "SingleFlight",
+    "SingleFlightStats"
+]
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import typing
+from collections import deque
+from dataclasses import dataclass
+
+from querky.logger import logger
+
+
+@dataclass(slots=True)
+class SlowQuery:
+    unique_name: str
+    sql: str
+    # redacted
+    params: typing.Sequence[typing.Any]
+    seconds: float
+    failed: bool = False
+    # `EXPLAIN (FORMAT JSON)` output, once captured
+    plan: typing.Any = None
+
+
+class SlowQueryLog:
+    def __init__(
+            self,
+            threshold: float | None = None,
+            *,
+            redact: typing.Callable[[typing.Any, tuple], typing.Sequence[typing.Any]] | None = None,
+            explain_db: typing.Any = None,
+            explain_interval: float = 60.0,
+            explain_timeout: float = 5.0,
+            max_explains: int = 1,
+            keep: int = 100
+    ):
+        """
+        Logs the executions of queries, which took longer than the threshold, along with their SQL and parameters,
+        and captures the plans of those exact parameters.
+
+        :param threshold: seconds, may also be set per query with `slow_threshold`.
+        :param redact: `redact(query, params)` returns the parameters as they are to be logged.
+                       The plan is always captured with the real ones.
+        :param explain_db: pool or connection to run `EXPLAIN` on. It must not be the one the queries are run on:
+                           a pool is best. Without it, plans are not captured.
+        :param explain_interval: minimum seconds between two plans of the same query.
+        :param explain_timeout: seconds to wait for a plan.
+        :param max_explains: maximum number of plans being captured at once, slow queries beyond it are only logged.
+        :param keep: number of the latest slow queries to keep in `recent`.
+        """
+        self.threshold = threshold
+        self.redact = redact
+        self.explain_db = explain_db
+        self.explain_interval = explain_interval
+        self.explain_timeout = explain_timeout
+        self.max_explains = max_explains
+        self.recent: deque[SlowQuery] = deque(maxlen=keep)
+        # unique_name -> time.monotonic() of the last plan captured
+        self._explained_at: dict[str, float] = dict()
+        # referenced, so that they are not garbage collected halfway
+        self._explains: set[asyncio.Task] = set()
+
+    def get_threshold(self, threshold: float | bool | None) -> float | None:
+        """
+        :param threshold: the one the query is declared with: `False` turns the log off for it.
+        :return: the threshold the query is logged with, if any.
+        """
+        if threshold is False:
+            return None
+        if threshold is None:
+            return self.threshold
+        return threshold
+
+    def _redact(self, query, params: tuple) -> typing.Sequence[typing.Any]:
+        if self.redact is None:
+            return params
+        try:
+            return self.redact(query, params)
+        except Exception:
+            logger.exception("Failed to redact the parameters of %s", query.unique_name)
+            return ('<redaction failed>', )
+
+    def record(self, query, params: tuple, seconds: float, failed: bool = False, explain: bool = True) -> SlowQuery:
+        entry = SlowQuery(query.unique_name, query.sql, self._redact(query, params), seconds, failed)
+        self.recent.append(entry)
+        logger.warning(
+            "Slow query %s%s: %.3f s\nSQL: %s\nParameters: %r",
+            entry.unique_name, " (failed)" if failed else "", seconds, entry.sql, entry.params
+        )
+        if explain and self._should_explain(entry.unique_name):
+            task = asyncio.get_running_loop().create_task(self.explain(query, params, entry))
+            self._explains.add(task)
+            task.add_done_callback(self._explains.discard)
+        return entry
+
+    def _should_explain(self, unique_name: str) -> bool:
+        if self.explain_db is None or len(self._explains) >= self.max_explains:
+            return False
+        now = time.monotonic()
+        if (explained_at := self._explained_at.get(unique_name, None)) is not None:
+            if now - explained_at < self.explain_interval:
+                return False
+        self._explained_at[unique_name] = now
+        return True
+
+    async def explain(self, query, params: tuple, entry: SlowQuery) -> None:
+        """
+        Captures the plan of the query with the same parameters as `entry.plan`, without running it.
+        """
+        contract = query.contract
+        try:
+            async with contract.acquire_connection(self.explain_db) as conn:
+                entry.plan = await asyncio.wait_for(
+                    contract.explain(conn, query.sql, params),
+                    self.explain_timeout
+                )
+        except Exception:
+            logger.warning("Failed to capture the plan of %s", entry.unique_name, exc_info=True)
+            return
+        logger.warning("Plan of slow query %s:\n%s", entry.unique_name, json.dumps(entry.plan, indent=2))
+
+    async def wait(self) -> None:
+        """
+        Waits for the plans being captured, e.g. before shutdown.
+        """
+        while self._explains:
+            await asyncio.gather(*self._explains, return_exceptions=True)
+
+
+def logging_slow(fetch, query, slow_log: SlowQueryLog, threshold: float):
+    async def logged_fetch(conn, params):
+        start = time.perf_counter()
+        try:
+            result = await fetch(conn, params)
+        except Exception:
+            if (seconds := time.perf_counter() - start) >= threshold:
+                slow_log.record(query, params, seconds, failed=True)
+            raise
+        if (seconds := time.perf_counter() - start) >= threshold:
+            slow_log.record(query, params, seconds)
+        return result
+    return logged_fetch
+
+
+def logging_slow_sync(fetch, query, slow_log: SlowQueryLog, threshold: float):
+    """
+    Same as `logging_slow`. There is no event loop to capture the plans on, so they are not.
+    """
+    def logged_fetch(conn, params):
+        start = time.perf_counter()
+        try:
+            result = fetch(conn, params)
+        except Exception:
+            if (seconds := time.perf_counter() - start) >= threshold:
+                slow_log.record(query, params, seconds, failed=True, explain=False)
+            raise
+        if (seconds := time.perf_counter() - start) >= threshold:
+            slow_log.record(query, params, seconds, explain=False)
+        return result
+    return logged_fetch
+
+
+__all__ = [
+    "SlowQueryLog",
+    "SlowQuery",
+    "logging_slow",
+    "logging_slow_sync"
+]
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import typing
+from operator import itemgetter
 from typing import Tuple, Sequence, List, TypeVar
 
 
@@ -38,6 +41,30 @@ def percent_placeholder() -> PlaceholderGenerator:
     return gen_percent_placeholder()
 
 
+def _pow2_parts(n: int) -> Tuple[int, ...]:
+    # 13 -> (8, 4, 1)
+    parts = []
+    while n > 0:
+        part = 1 << (n.bit_length() - 1)
+        parts.append(part)
+        n -= part
+    return tuple(parts)
+
+
+async def _achunks(
+        tuples: typing.AsyncIterable[T],
+        size: int
+) -> typing.AsyncIterator[List[T]]:
+    chunk = []
+    async for t in tuples:
+        chunk.append(t)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 class FoldArgs:
     def __init__(
             self,
@@ -46,7 +73,9 @@ class FoldArgs:
             delim: str = ',',
             placeholder: typing.Callable[[], PlaceholderGenerator] = dollar_sign,
             batch_length: int = PSQL_QUERY_ALLOWED_MAX_ARGS,
-            enable_cache: bool = False
+            enable_cache: bool = False,
+            cache_size: int = 128,
+            pow2_buckets: bool = False
     ):
         """
         :param tuple_len: length of a single tuple.
@@ -57,13 +86,19 @@ class FoldArgs:
         :param enable_cache:
                      enables cache on all operations.
                      Will boost performance in case there is frequent usage of the same number of tuples per template.
-                     Otherwise, it will clog up the memory, so use carefully.
+        :param cache_size: maximum number of entries per cache, least recently used ones are dropped first.
+        :param pow2_buckets:
+                     splits incomplete batches into batches of power-of-two sizes (13 -> 8 + 4 + 1).
+                     This way, there are only about log2(batch_length / tuple_len) distinct SQL texts,
+                     at the cost of a few more statements.
         """
 
         self.placeholder = placeholder
         self.enable_cache = enable_cache
         if tuple_len < 1:
             raise ValueError()
+        if cache_size < 1:
+            raise ValueError("cache_size must be positive")
         self.tuple_len = tuple_len
         self.delim = delim
         self.tmpl = tmpl
@@ -71,63 +106,91 @@ class FoldArgs:
         self.tuples_count_per_batch = self.batch_length // self.tuple_len
         if self.tuples_count_per_batch < 1:
             raise ValueError(f"cannot fit a single tuple ({self.tuple_len}) with query capacity ({self.batch_length})")
+        self.pow2_buckets = pow2_buckets
         # cache
-        self.args_cache: dict[int, Tuple[int, ...]] = dict()
-        self.fold_cache: dict[int, Tuple[str, ...]] = dict()
-        self.values_cache: dict[int, str] = dict()
+        self.cache_size = cache_size if enable_cache else 1
+        self._full_values: str | None = None
+        self._cached_values = functools.lru_cache(maxsize=self.cache_size)(self._build_values)
+        self.batch_tuples = functools.lru_cache(maxsize=self.cache_size)(self._batch_tuples)
+        self.fold = functools.lru_cache(maxsize=self.cache_size)(self._fold)
+
+    def _build_values(self, n: int) -> str:
+        p = self.placeholder()
+        batch = []
+        for _ in range(n):
+            tuple_repr = self.tmpl.format(
+                *[
+                    next(p)
+                    for _ in range(self.tuple_len)
+                ]
+            )
+            batch.append(tuple_repr)
+        return self.delim.join(batch)
 
     def _create_values(self, n: int) -> str:
-        if (res := self.values_cache.get(n, None)) is None:
-            p = self.placeholder()
-            batch = []
-            for _ in range(n):
-                tuple_repr = self.tmpl.format(
-                    *[
-                        next(p)
-                        for _ in range(self.tuple_len)
-                    ]
-                )
-                batch.append(tuple_repr)
-            res = self.delim.join(batch)
-            if n == self.tuples_count_per_batch or self.enable_cache:
-                self.values_cache[n] = res
-        return res
-
-    def args(self, tuples: Sequence[Sequence[T, ...]]) -> List[List[T]]:
-        args_batches = []
-        for tuples_count in self.batch_tuples(len(tuples)):
-            args = []
-            batch = tuples[:tuples_count]
-            for t in batch:
-                if len(t) != self.tuple_len:
-                    raise ValueError(f"tuples must all have {self.tuple_len} (got: {len(t)}): {t}")
-                args.extend(t)
-            args_batches.append(args)
-            tuples = tuples[tuples_count:]
-        return args_batches
-
-    def batch_tuples(self, n: int) -> Tuple[int, ...]:
-        if (res := self.args_cache.get(n, None)) is None:
-            arr = []
-            while n > 0:
-                tuples_len = min(n, self.tuples_count_per_batch)
-                arr.append(tuples_len)
-                n -= tuples_len
-            res = tuple(arr)
-            if self.enable_cache:
-                self.args_cache[n] = res
-        return res
-
-    def fold(self, n: int) -> Tuple[str, ...]:
-        if (res := self.fold_cache.get(n, None)) is None:
-            arr: List[str] = []
-            for count in self.batch_tuples(n):
-                values = self._create_values(count)
-                arr.append(values)
-            res = tuple(arr)
-            if self.enable_cache:
-                self.fold_cache[n] = res
-        return res
+        if n == self.tuples_count_per_batch:
+            # the full batch is what large inputs consist of, so it is always kept
+            if self._full_values is None:
+                self._full_values = self._build_values(n)
+            return self._full_values
+        return self._cached_values(n)
+
+    def _check(self, batch: Sequence[Sequence[T, ...]]) -> None:
+        if (lengths := set(map(len, batch))) != {self.tuple_len}:
+            raise ValueError(f"tuples must all have {self.tuple_len} (got: {sorted(lengths)})")
+
+    def _split(self, chunk: List[Sequence[T, ...]]) -> typing.Iterator[Tuple[int, List[T]]]:
+        self._check(chunk)
+        if len(chunk) == self.tuples_count_per_batch:
+            yield len(chunk), list(itertools.chain.from_iterable(chunk))
+            return
+        offset = 0
+        for count in self.batch_tuples(len(chunk)):
+            yield count, list(itertools.chain.from_iterable(itertools.islice(chunk, offset, offset + count)))
+            offset += count
+
+    def iter_batches(self, tuples: typing.Iterable[Sequence[T, ...]]) -> typing.Iterator[Tuple[int, List[T]]]:
+        """
+        Lazily splits the tuples into batches, holding at most one batch in memory.
+        :return: an iterator of (number of tuples in the batch, flat list of batch arguments).
+        """
+        it = iter(tuples)
+        while chunk := list(itertools.islice(it, self.tuples_count_per_batch)):
+            yield from self._split(chunk)
+
+    async def aiter_batches(
+            self,
+            tuples: typing.Iterable[Sequence[T, ...]] | typing.AsyncIterable[Sequence[T, ...]]
+    ) -> typing.AsyncIterator[Tuple[int, List[T]]]:
+        """
+        Same as `iter_batches`, but also accepts async iterables.
+        """
+        if not hasattr(tuples, '__aiter__'):
+            for batch in self.iter_batches(tuples):
+                yield batch
+            return
+        async for chunk in _achunks(tuples, self.tuples_count_per_batch):
+            for batch in self._split(chunk):
+                yield batch
+
+    def args(self, tuples: typing.Iterable[Sequence[T, ...]]) -> List[List[T]]:
+        return [args for _, args in self.iter_batches(tuples)]
+
+    def _batch_tuples(self, n: int) -> Tuple[int, ...]:
+        full, rest = divmod(n, self.tuples_count_per_batch)
+        arr = [self.tuples_count_per_batch] * full
+        if rest:
+            if self.pow2_buckets:
+                arr.extend(_pow2_parts(rest))
+            else:
+                arr.append(rest)
+        return tuple(arr)
+
+    def _fold(self, n: int) -> Tuple[str, ...]:
+        return tuple([
+            self._create_values(count)
+            for count in self.batch_tuples(n)
+        ])
 
 
 class FoldedQuery:
@@ -140,7 +203,9 @@ class FoldedQuery:
             placeholder: typing.Callable[[], PlaceholderGenerator] = dollar_sign,
             batch_length: int = PSQL_QUERY_ALLOWED_MAX_ARGS,
             enable_cache: bool = False,
-            sql_format_key: str = 'folded'
+            sql_format_key: str = 'folded',
+            cache_size: int = 128,
+            pow2_buckets: bool = False
     ):
         if tmpl is None:
             tmpl = ','.join(['{}' for _ in range(tuple_len)])
@@ -154,30 +219,158 @@ class FoldedQuery:
             delim=delim,
             enable_cache=enable_cache,
             placeholder=placeholder,
-            batch_length=batch_length
+            batch_length=batch_length,
+            cache_size=cache_size,
+            pow2_buckets=pow2_buckets
         )
-        self.query_cache: dict[int, tuple[str]] = dict()
+        self.create_query = functools.lru_cache(maxsize=self.fold_args.cache_size)(self._create_query)
+
+    def _create_query(self, count: int) -> str:
+        """
+        :param count: number of tuples in a single batch.
+        """
+        return self.sql.format(**{self.sql_format_key: self.fold_args._create_values(count)})
 
     def create_queries(self, tuples_count: int) -> tuple[str]:
-        if not (queries := self.query_cache.get(tuples_count, None)):
-            q = []
-            values = self.fold_args.fold(tuples_count)
-            for v in values:
-                q.append(
-                    self.sql.format(**{self.sql_format_key: v})
-                )
-            queries = tuple(q)
-            if self.enable_cache:
-                self.query_cache[tuples_count] = queries
-        return queries
-
-    def __call__(self, tuples: typing.Sequence[typing.Tuple]) -> typing.Tuple[typing.Tuple[str], typing.List[typing.List]]:
-        queries = self.create_queries(len(tuples))
-        args = self.fold_args.args(tuples)
+        return tuple([
+            self.create_query(count)
+            for count in self.fold_args.batch_tuples(tuples_count)
+        ])
+
+    def batches(self, tuples: typing.Iterable[typing.Tuple]) -> typing.Iterator[typing.Tuple[str, typing.List]]:
+        """
+        Lazily yields (sql, args) for each batch, holding at most one batch in memory.
+        """
+        for count, args in self.fold_args.iter_batches(tuples):
+            yield self.create_query(count), args
+
+    async def abatches(
+            self,
+            tuples: typing.Iterable[typing.Tuple] | typing.AsyncIterable[typing.Tuple]
+    ) -> typing.AsyncIterator[typing.Tuple[str, typing.List]]:
+        async for count, args in self.fold_args.aiter_batches(tuples):
+            yield self.create_query(count), args
+
+    def __call__(self, tuples: typing.Iterable[typing.Tuple]) -> typing.Tuple[typing.Tuple[str], typing.List[typing.List]]:
+        queries = []
+        args = []
+        for sql, batch_args in self.batches(tuples):
+            queries.append(sql)
+            args.append(batch_args)
+        return tuple(queries), args
+
+
+class UnnestArgs:
+    def __init__(
+            self,
+            types: Sequence[str],
+            placeholder: typing.Callable[[], PlaceholderGenerator] = dollar_sign,
+            batch_size: int | None = None
+    ):
+        """
+        Unlike `FoldArgs`, passes each column as a single typed array parameter:
+        `unnest($1::int8[], $2::text[], ...)`.
+        The SQL stays the same for any number of tuples, so the database parses and plans it once,
+        and there is no cap on the number of tuples per query.
+
+        :param types: database type of each tuple element, e.g. `('int8', 'text')`.
+        :param placeholder:
+        :param batch_size: maximum number of tuples per batch. Unlimited by default.
+        """
+        if len(types) < 1:
+            raise ValueError()
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        self.types = tuple(types)
+        self.tuple_len = len(self.types)
+        self.placeholder = placeholder
+        self.batch_size = batch_size
+        p = self.placeholder()
+        self.unnest = f"unnest({', '.join([f'{next(p)}::{t}[]' for t in self.types])})"
+
+    def _transpose(self, tuples: Sequence[Sequence[T, ...]]) -> List[List[T]]:
+        # both the check and the transposition loop in C, no per-tuple Python code
+        # (`zip(*tuples)` would have to juggle one iterator per tuple, which is a lot slower)
+        if (lengths := set(map(len, tuples))) != {self.tuple_len}:
+            raise ValueError(f"tuples must all have {self.tuple_len} (got: {sorted(lengths)})")
+        return [
+            list(map(itemgetter(i), tuples))
+            for i in range(self.tuple_len)
+        ]
+
+    def iter_batches(self, tuples: typing.Iterable[Sequence[T, ...]]) -> typing.Iterator[List[List[T]]]:
+        """
+        Lazily yields the column-wise arguments of each batch, holding at most one batch in memory.
+        """
+        if self.batch_size is None:
+            if tuples := tuples if isinstance(tuples, (list, tuple)) else list(tuples):
+                yield self._transpose(tuples)
+            return
+        it = iter(tuples)
+        while chunk := list(itertools.islice(it, self.batch_size)):
+            yield self._transpose(chunk)
+
+    async def aiter_batches(
+            self,
+            tuples: typing.Iterable[Sequence[T, ...]] | typing.AsyncIterable[Sequence[T, ...]]
+    ) -> typing.AsyncIterator[List[List[T]]]:
+        if not hasattr(tuples, '__aiter__'):
+            for batch in self.iter_batches(tuples):
+                yield batch
+            return
+        if self.batch_size is None:
+            if chunk := [t async for t in tuples]:
+                yield self._transpose(chunk)
+            return
+        async for chunk in _achunks(tuples, self.batch_size):
+            yield self._transpose(chunk)
+
+    def args(self, tuples: typing.Iterable[Sequence[T, ...]]) -> List[List[List[T]]]:
+        return list(self.iter_batches(tuples))
+
+
+class UnnestQuery:
+    def __init__(
+            self,
+            sql: str,
+            types: Sequence[str],
+            placeholder: typing.Callable[[], PlaceholderGenerator] = dollar_sign,
+            batch_size: int | None = None,
+            sql_format_key: str = 'folded'
+    ):
+        """
+        A drop-in alternative to `FoldedQuery`, which binds columns as arrays instead of expanding placeholders:
+
+        `UnnestQuery("INSERT INTO account (id, username) SELECT * FROM {folded}", types=('int8', 'text'))`
+        """
+        self.sql_format_key = sql_format_key
+        self.unnest_args = UnnestArgs(
+            types=types,
+            placeholder=placeholder,
+            batch_size=batch_size
+        )
+        self.sql = sql.format(**{self.sql_format_key: self.unnest_args.unnest})
+
+    def batches(self, tuples: typing.Iterable[typing.Tuple]) -> typing.Iterator[typing.Tuple[str, typing.List]]:
+        for args in self.unnest_args.iter_batches(tuples):
+            yield self.sql, args
+
+    async def abatches(
+            self,
+            tuples: typing.Iterable[typing.Tuple] | typing.AsyncIterable[typing.Tuple]
+    ) -> typing.AsyncIterator[typing.Tuple[str, typing.List]]:
+        async for args in self.unnest_args.aiter_batches(tuples):
+            yield self.sql, args
+
+    def __call__(self, tuples: typing.Iterable[typing.Tuple]) -> typing.Tuple[typing.Tuple[str], typing.List[typing.List]]:
+        args = self.unnest_args.args(tuples)
+        queries = tuple([self.sql for _ in args])
         return queries, args
 
 
 __all__ = [
     "FoldArgs",
-    "FoldedQuery"
+    "FoldedQuery",
+    "UnnestArgs",
+    "UnnestQuery"
 ]
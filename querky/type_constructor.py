@@ -19,8 +19,13 @@ class TypeConstructor(typing.Generic[T], GetImportsMixin):
             query: Query,
             typename: str,
             required_imports: typing.Set[str],
-            row_factory: typing.Callable[[typing.Any], T] | None
+            row_factory: typing.Callable[[typing.Any], T] | None,
+            generate_row_factory: bool = False
     ):
+        """
+        :param generate_row_factory: emit a specialized converter for this type into the generated module,
+                                     which replaces `row_factory` once the module is imported.
+        """
         self.query = query
         self.type_code_generated = False
         self.typename = typename
@@ -28,6 +33,8 @@ class TypeConstructor(typing.Generic[T], GetImportsMixin):
         self.shape: typing.Optional[ResultShape] = None
         self.attributes: typing.Optional[typing.Tuple[ResultAttribute, ...]] = None
         self.row_factory = row_factory
+        self.rows_factory: typing.Callable[[typing.Sequence[typing.Any]], typing.List[T]] | None = None
+        self.generate_row_factory = generate_row_factory
         self.type_code_generated: bool = False
         self.attributes_collected: bool = False
 
@@ -45,3 +52,25 @@ class TypeConstructor(typing.Generic[T], GetImportsMixin):
 
     def indent(self, i: int) -> str:
         return self.shape.query.querky.get_indent(i)
+
+    def get_row_factory_names(self) -> tuple[str, str]:
+        return f"_{self.typename}_from_record", f"_{self.typename}_from_records"
+
+    def generate_row_expression(self, record: str) -> str:
+        """
+        Python expression, which builds an instance of the type out of the `record` variable.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot generate a row factory")
+
+    def generate_row_factory_code(self) -> typing.List[str] | None:
+        if not self.generate_row_factory:
+            return None
+        one, many = self.get_row_factory_names()
+        return [
+            f"def {one}(__record):",
+            f"{self.indent(1)}return {self.generate_row_expression('__record')}",
+            '',
+            '',
+            f"def {many}(__records):",
+            f"{self.indent(1)}return [{self.generate_row_expression('__record')} for __record in __records]",
+        ]
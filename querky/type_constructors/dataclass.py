@@ -15,11 +15,18 @@ class DataclassConstructor(TypeConstructor[typing.Any]):
             query: Query,
             typename: str,
             row_factory: typing.Callable[[typing.Any], typing.Any] | None,
+            generate_row_factory: bool = False,
             **dataclass_kwargs
     ):
         self.dataclass_kwargs = dataclass_kwargs
         self.decorator = self.compile_decorator_string()
-        super().__init__(query, typename, {DATACLASS}, row_factory=row_factory)
+        super().__init__(
+            query,
+            typename,
+            {DATACLASS},
+            row_factory=row_factory,
+            generate_row_factory=generate_row_factory
+        )
 
     def compile_decorator_string(self):
         kwargs = ', '.join([
@@ -39,3 +46,16 @@ class DataclassConstructor(TypeConstructor[typing.Any]):
                 f"{self.indent(1)}{attr.name}: {attr.type_knowledge.typehint}"
             )
         return lines
+
+    def generate_row_expression(self, record: str) -> str:
+        if self.dataclass_kwargs.get('kw_only', False):
+            args = ', '.join([
+                f"{attr.name}={record}[{attr.index}]"
+                for attr in self.attributes
+            ])
+        else:
+            args = ', '.join([
+                f"{record}[{attr.index}]"
+                for attr in self.attributes
+            ])
+        return f"{self.typename}({args})"
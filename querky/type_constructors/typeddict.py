@@ -14,9 +14,10 @@ class TypedDictConstructor(TypeConstructor[dict]):
             self,
             query: Query,
             typename: str,
-            row_factory: typing.Callable[[typing.Any], dict] | None
+            row_factory: typing.Callable[[typing.Any], dict] | None,
+            generate_row_factory: bool = False
     ):
-        super().__init__(query, typename, {TYPING}, row_factory)
+        super().__init__(query, typename, {TYPING}, row_factory, generate_row_factory=generate_row_factory)
 
     def generate_type_code(self) -> typing.Sequence[str] | None:
         self.type_code_generated = True
@@ -29,6 +30,13 @@ class TypedDictConstructor(TypeConstructor[dict]):
             )
         return lines
 
+    def generate_row_expression(self, record: str) -> str:
+        items = ', '.join([
+            f"{attr.name!r}: {record}[{attr.index}]"
+            for attr in self.attributes
+        ])
+        return f"{{{items}}}"
+
 
 __all__ = [
     "TypedDictConstructor"
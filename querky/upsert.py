@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import typing
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Upsert:
+    """
+    Declares a bulk upsert for a query with a `copy` table:
+    rows are copied into a temporary staging table, and then merged into the target table with a single
+    `INSERT ... SELECT ... ON CONFLICT (conflict) DO UPDATE` per chunk, all inside one transaction.
+
+    :param conflict: columns of the unique constraint to resolve conflicts on.
+    :param update: columns to overwrite on conflict, all the other columns by default.
+                   Empty means `DO NOTHING`.
+    :param returning: return the conflict keys of the inserted or updated rows, instead of their count.
+    """
+    conflict: typing.Sequence[str]
+    update: typing.Sequence[str] | None = None
+    returning: bool = False
+
+    def get_update_columns(self, columns: typing.Sequence[str]) -> typing.List[str]:
+        if self.update is not None:
+            return list(self.update)
+        return [
+            column
+            for column in columns
+            if column not in self.conflict
+        ]
+
+
+__all__ = [
+    "Upsert"
+]
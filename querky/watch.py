@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import os
+import sys
+import time
+import types
+import typing
+from os import path
+
+from querky.logger import logger
+from querky.exceptions import GenerationError
+from querky.manifest import get_imported_module_names
+
+if typing.TYPE_CHECKING:
+    from querky.querky import Querky
+    from querky.module_constructor import ModuleConstructor
+
+
+FileState = typing.Tuple[int, int]
+
+
+class Watcher:
+    def __init__(
+            self,
+            querky: Querky,
+            db,
+            base_modules: typing.Collection[types.ModuleType],
+            *,
+            concurrency: int = 1,
+            interval: float = 0.2,
+            on_generated: typing.Callable[[typing.List[str]], typing.Any] | None = None
+    ):
+        """
+        Polls the query source directories and regenerates only the modules affected by a change.
+        The connection (or pool), type cache and signature cache stay warm in between.
+
+        :param interval: seconds between two directory scans.
+        :param on_generated: called with the import paths of the source modules after each regeneration.
+        """
+        self.querky = querky
+        self.db = db
+        self.base_modules = list(base_modules)
+        self.concurrency = concurrency
+        self.interval = interval
+        self.on_generated = on_generated
+        self.files: dict[str, FileState] = dict()
+        self.module_paths: dict[str, str] = dict()
+        # modules which failed to generate are retried along with the next change
+        self.failed: typing.Set[str] = set()
+
+    def get_module_paths(self) -> dict[str, str]:
+        """
+        :return: filepath -> import path of every query source module, the same way `Querky.generate` sees them.
+        """
+        return {
+            filepath: module_import_path
+            for base_module in self.base_modules
+            for filepath, module_import_path in self.querky.discover_modules(base_module)
+        }
+
+    def scan(self) -> typing.Tuple[dict[str, FileState], typing.Set[str], typing.Set[str]]:
+        """
+        :return: new states, changed (or created) files, deleted files.
+        """
+        files = dict()
+        # deleted files keep their import paths, so that their modules can be unloaded
+        self.module_paths.update(self.get_module_paths())
+        for filepath in self.module_paths:
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                continue
+            files[filepath] = (stat.st_mtime_ns, stat.st_size)
+        changed = {
+            filepath
+            for filepath, state in files.items()
+            if self.files.get(filepath, None) != state
+        }
+        deleted = self.files.keys() - files.keys()
+        return files, changed, deleted
+
+    def _get_module_ctor(self, module_name: str) -> ModuleConstructor | None:
+        if (module := sys.modules.get(module_name, None)) is None:
+            return None
+        return self.querky.module_ctors.get(module, None)
+
+    def get_dependents(self, module_names: typing.Set[str]) -> typing.List[str]:
+        """
+        Watched modules, which import the given ones, directly or not.
+        Child queries always import their parents, so they are covered too.
+        """
+        imports = dict()
+        for filepath, module_name in self.module_paths.items():
+            if filepath not in self.files:
+                continue
+            try:
+                imports[module_name] = get_imported_module_names(filepath, module_name.rpartition('.')[0])
+            except (OSError, SyntaxError):
+                imports[module_name] = set()
+
+        affected = set(module_names)
+        dependents = []
+        grew = True
+        while grew:
+            grew = False
+            for module_name, imported in imports.items():
+                if module_name not in affected and imported & affected:
+                    affected.add(module_name)
+                    dependents.append(module_name)
+                    grew = True
+        return dependents
+
+    def _unload(self, module_name: str) -> None:
+        if (module := sys.modules.get(module_name, None)) is not None:
+            self.querky.module_ctors.pop(module, None)
+            del sys.modules[module_name]
+
+    def reload(self, module_names: typing.Sequence[str]) -> typing.List[ModuleConstructor]:
+        """
+        Re-imports the modules from scratch, so that their queries are declared anew.
+        Modules which fail to import are logged and left out until they change again.
+        """
+        for module_name in module_names:
+            self._unload(module_name)
+
+        module_ctors = []
+        for module_name in module_names:
+            try:
+                importlib.import_module(module_name)
+            except Exception:
+                logger.exception("Could not import %s", module_name)
+                self._unload(module_name)
+                continue
+            if (module_ctor := self._get_module_ctor(module_name)) is not None:
+                module_ctors.append(module_ctor)
+        return module_ctors
+
+    async def regenerate(self, changed: typing.Set[str], deleted: typing.Set[str]) -> typing.List[str]:
+        changed_names = {self.module_paths[filepath] for filepath in changed}
+        deleted_names = {self.module_paths.pop(filepath) for filepath in deleted}
+        for module_name in deleted_names:
+            logger.warning("%s was deleted, its generated module is left as is", module_name)
+            self._unload(module_name)
+
+        changed_names |= self.failed - deleted_names
+        module_names = [
+            *sorted(changed_names),
+            *self.get_dependents(changed_names | deleted_names)
+        ]
+        module_ctors = self.reload(module_names)
+        if not module_ctors:
+            return []
+
+        if self.querky.manifest is not None:
+            self.querky.manifest.invalidate()
+        try:
+            # the other modules are untouched, their cached signatures are kept
+            await self.querky._generate_modules(self.db, module_ctors, self.concurrency, partial=True)
+        except GenerationError:
+            self.failed = set(module_names)
+            raise
+        self.failed = set()
+        return [module_ctor.module.__name__ for module_ctor in module_ctors]
+
+    async def run(self) -> None:
+        """
+        Generates everything once, then watches until cancelled.
+        """
+        self.files, _, _ = self.scan()
+        try:
+            await self.querky.generate(self.db, self.base_modules, concurrency=self.concurrency)
+        except GenerationError as ex:
+            logger.error("%s", ex)
+            self.failed = {module.__name__ for module in self.querky.module_ctors}
+        logger.info("Watching %s for changes", ', '.join([m.__name__ for m in self.base_modules]))
+
+        while True:
+            await asyncio.sleep(self.interval)
+            files, changed, deleted = self.scan()
+            self.files = files
+            if not changed and not deleted:
+                continue
+
+            start = time.perf_counter()
+            try:
+                generated = await self.regenerate(changed, deleted)
+            except GenerationError as ex:
+                logger.error("%s", ex)
+                continue
+            if generated:
+                logger.info(
+                    "Regenerated %s in %.0f ms",
+                    ', '.join(generated), (time.perf_counter() - start) * 1000
+                )
+                if self.on_generated is not None:
+                    self.on_generated(generated)
+
+
+__all__ = [
+    "Watcher"
+]
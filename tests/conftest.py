@@ -0,0 +1,139 @@
+import asyncio
+import contextlib
+import importlib
+import re
+import sys
+import textwrap
+import types
+
+import pytest
+
+from querky.base_types import QueryDescription
+
+
+BIGINT = ('pg_catalog', 'bigint')
+TEXT = ('pg_catalog', 'text')
+
+
+class Record(tuple):
+    """
+    Stands in for `asyncpg.Record`: indexed both by position and by name.
+    """
+    def __new__(cls, names, values):
+        record = super().__new__(cls, values)
+        record._names = tuple(names)
+        return record
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._names.index(key)
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return iter(self._names)
+
+    def values(self):
+        return iter(self)
+
+    def items(self):
+        return zip(self._names, self)
+
+
+class Cursor:
+    def __init__(self, conn, records):
+        self.conn = conn
+        self.records = list(records)
+
+    async def fetch(self, n):
+        self.conn.log.append(('cursor.fetch', n))
+        rows, self.records = self.records[:n], self.records[n:]
+        return rows
+
+
+class Conn:
+    def __init__(self, descriptions: dict[str, QueryDescription], rows: dict[str, list] | None = None):
+        """
+        Stands in for `asyncpg.Connection`: `rows` are returned by SQL, `log` records every call.
+        """
+        self.descriptions = descriptions
+        self.rows = rows or dict()
+        self.log = []
+        self.transactions = 0
+
+    def records(self, sql: str) -> list[Record]:
+        names = [name for name, _ in self.descriptions[sql].attributes]
+        return [Record(names, values) for values in self.rows.get(sql, [])]
+
+    def is_in_transaction(self) -> bool:
+        return self.transactions > 0
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self.log.append(('begin', ))
+        self.transactions += 1
+        try:
+            yield
+        finally:
+            self.transactions -= 1
+            self.log.append(('end', ))
+
+    async def fetch(self, sql, *args):
+        self.log.append(('fetch', sql, args))
+        return self.records(sql)
+
+    async def fetchrow(self, sql, *args):
+        self.log.append(('fetchrow', sql, args))
+        records = self.records(sql)
+        return records[0] if records else None
+
+    async def fetchval(self, sql, *args):
+        self.log.append(('fetchval', sql, args))
+        records = self.records(sql)
+        return records[0][0] if records else None
+
+    async def execute(self, sql, *args):
+        self.log.append(('execute', sql, args))
+        return 'UPDATE 1'
+
+    async def executemany(self, sql, args):
+        self.log.append(('executemany', sql, list(args)))
+
+    async def fetchmany(self, sql, args):
+        args = list(args)
+        self.log.append(('fetchmany', sql, args))
+        return [record for _ in args for record in self.records(sql)]
+
+    async def cursor(self, sql, *args):
+        self.log.append(('cursor', sql, args))
+        return Cursor(self, self.records(sql))
+
+
+@pytest.fixture
+def generate(tmp_path, monkeypatch):
+    """
+    Generates the module of queries from `source` (which imports the `Querky` object as `from querky_def import qrk`),
+    with `describe_sql` stubbed to report `descriptions` by SQL. Returns the generated module.
+    """
+    package = re.sub(r'\W', '_', f"querky_test_{tmp_path.name}")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def generate_module(qrk, source: str, descriptions: dict[str, QueryDescription]) -> types.ModuleType:
+        async def describe_sql(db, sql: str) -> QueryDescription:
+            return descriptions[sql]
+
+        monkeypatch.setattr(qrk.contract, 'describe_sql', describe_sql)
+        querky_def = types.ModuleType('querky_def')
+        querky_def.qrk = qrk
+        monkeypatch.setitem(sys.modules, 'querky_def', querky_def)
+
+        (tmp_path / package).mkdir()
+        (tmp_path / package / '__init__.py').write_text('')
+        (tmp_path / package / 'source.py').write_text(textwrap.dedent(source))
+        base_module = importlib.import_module(package)
+        asyncio.run(qrk.generate(Conn(descriptions), base_modules=(base_module, )))
+        return importlib.import_module(f"{package}.{qrk.subdir}.source")
+
+    yield generate_module
+    for name in list(sys.modules):
+        if name == package or name.startswith(f"{package}."):
+            del sys.modules[name]
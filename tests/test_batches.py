@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import pytest
+
+from querky.presets.asyncpg import use_preset
+from querky.runtime import RuntimeQuery, create_batch_binder
+
+
+@pytest.fixture
+def qrk():
+    return use_preset(os.path.dirname(__file__))
+
+
+class Conn:
+    def __init__(self):
+        self.batches = []
+
+    def is_in_transaction(self):
+        return False
+
+    async def executemany(self, sql, args):
+        self.batches.append(list(args))
+
+
+def update_phone(account_id, phone, /, *, note=None):
+    return (account_id, phone, note)
+
+
+@pytest.mark.parametrize('args, bound', [
+    ((3, 'r', 'note'), (3, 'r', 'note')),
+    ((3, 'r'), (3, 'r', None)),
+    ({'account_id': 3, 'phone': 'r', 'note': 'note'}, (3, 'r', 'note')),
+    ({'account_id': 3, 'phone': 'r'}, (3, 'r', None)),
+])
+def test_batch_binder_maps_items_to_parameters(args, bound):
+    assert create_batch_binder(update_phone)(args) == bound
+
+
+@pytest.mark.parametrize('args', [
+    (3, 'r', 'note', 'extra'),
+    (3, ),
+    {'account_id': 3},
+    {'phone': 'r', 'note': 'note'},
+    {'account_id': 3, 'phone': 'r', 'unknown': 1},
+])
+def test_batch_binder_rejects_wrong_items(args):
+    with pytest.raises(TypeError):
+        create_batch_binder(update_phone)(args)
+
+
+def test_batch_binder_of_plain_parameters():
+    def bind(a, b=2):
+        return (a, b)
+
+    batch_bind = create_batch_binder(bind)
+    assert batch_bind((1, )) == (1, 2)
+    assert batch_bind({'b': 3, 'a': 1}) == (1, 3)
+
+
+def test_batches_of_keyword_only_parameters(qrk):
+    @qrk.query(shape='status')
+    def update_phone(account_id, phone, *, note=None):
+        return f"UPDATE account SET phone = {+phone}, note = {+note} WHERE id = {+account_id}"
+
+    runtime = RuntimeQuery(qrk, 'update_phone', update_phone.sql, 'status', update_phone.param_mapper.binder)
+    for query in (update_phone, runtime):
+        conn = Conn()
+        asyncio.run(query.execute_many(conn, [(3, 'r', 'note'), {'account_id': 4, 'phone': 's'}]))
+        assert conn.batches == [[(3, 'r', 'note'), (4, 's', None)]]
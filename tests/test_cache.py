@@ -0,0 +1,231 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from querky import cache as cache_module
+from querky.cache import (
+    CachePolicy, ResultCache, ResultCacheRegistry, get_read_tables, get_written_tables, resolve_cache_policy
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock)
+    return clock
+
+
+@dataclass
+class Row:
+    id: int
+    tags: list
+
+
+def fetch_sync(cache: ResultCache, params: tuple, value):
+    calls = []
+
+    def fetch(conn, fetched_params):
+        calls.append(fetched_params)
+        return value
+
+    return cache.fetch_sync(fetch, None, params), calls
+
+
+def test_result_is_cached_by_arguments():
+    cache = ResultCache('q', CachePolicy())
+    assert fetch_sync(cache, (1, ), 'a') == ('a', [(1, )])
+    assert fetch_sync(cache, (1, ), 'b') == ('a', [])
+    assert fetch_sync(cache, (2, ), 'b') == ('b', [(2, )])
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+
+def test_result_expires_after_ttl(clock):
+    cache = ResultCache('q', CachePolicy(ttl=5))
+    fetch_sync(cache, (1, ), 'a')
+    clock.now += 4.9
+    assert fetch_sync(cache, (1, ), 'b') == ('a', [])
+    clock.now += 0.1
+    assert fetch_sync(cache, (1, ), 'b') == ('b', [(1, )])
+    assert cache.stats.expirations == 1
+
+
+def test_least_recently_used_result_is_evicted():
+    cache = ResultCache('q', CachePolicy(maxsize=2))
+    fetch_sync(cache, (1, ), 'a')
+    fetch_sync(cache, (2, ), 'b')
+    fetch_sync(cache, (1, ), 'a')
+    fetch_sync(cache, (3, ), 'c')
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    assert fetch_sync(cache, (2, ), 'x') == ('x', [(2, )])
+
+
+def test_result_fetched_before_invalidation_is_not_stored():
+    cache = ResultCache('q', CachePolicy())
+
+    async def main():
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def fetch(conn, params):
+            started.set()
+            await finish.wait()
+            return 'stale'
+
+        task = asyncio.create_task(cache.fetch(fetch, None, (1, )))
+        await started.wait()
+        # a write lands while the read is in flight
+        cache.invalidate()
+        finish.set()
+        return await task
+
+    assert asyncio.run(main()) == 'stale'
+    assert len(cache) == 0
+    assert cache.generation == 1
+
+
+def test_unhashable_arguments_are_not_cached():
+    cache = ResultCache('q', CachePolicy())
+    assert fetch_sync(cache, ([1, 2], ), 'a') == ('a', [([1, 2], )])
+    assert fetch_sync(cache, ([1, 2], ), 'b') == ('b', [([1, 2], )])
+    assert len(cache) == 0
+
+
+def test_cached_results_are_copied():
+    cache = ResultCache('q', CachePolicy())
+    row, _ = fetch_sync(cache, (1, ), [Row(1, ['a'])])
+    row[0].tags.append('mutated')
+    cached, _ = fetch_sync(cache, (1, ), None)
+    assert cached == [Row(1, ['a'])]
+    assert cached is not fetch_sync(cache, (1, ), None)[0]
+
+
+def test_registry_invalidates_by_tag():
+    registry = ResultCacheRegistry()
+    accounts = registry.create('accounts', CachePolicy(tags=('account', )))
+    posts = registry.create('posts', CachePolicy(tags=('post', 'account')))
+    comments = registry.create('comments', CachePolicy(tags=('comment', )))
+    for cache in (accounts, posts, comments):
+        fetch_sync(cache, (1, ), 'a')
+
+    registry.invalidate(['account'])
+    assert (len(accounts), len(posts), len(comments)) == (0, 0, 1)
+
+
+def test_recreated_cache_replaces_the_old_one():
+    registry = ResultCacheRegistry()
+    old = registry.create('accounts', CachePolicy(tags=('account', )))
+    new = registry.create('accounts', CachePolicy(tags=('account', )))
+    fetch_sync(old, (1, ), 'a')
+    fetch_sync(new, (1, ), 'a')
+    registry.invalidate(['account'])
+    assert len(new) == 0
+    assert len(old) == 1
+
+
+def test_policy_is_validated():
+    with pytest.raises(ValueError):
+        ResultCache('q', CachePolicy(maxsize=0))
+    with pytest.raises(ValueError):
+        ResultCache('q', CachePolicy(ttl=0))
+
+
+def test_policy_tags_default_to_the_tables_read():
+    sql = "SELECT a.id FROM public.account a JOIN post p ON p.poster_id = a.id"
+    assert resolve_cache_policy(CachePolicy(), sql).tags == ('public.account', 'account', 'post')
+    assert resolve_cache_policy(CachePolicy(tags='account'), sql).tags == ('account', )
+    assert resolve_cache_policy(CachePolicy(tags=()), sql).tags == ()
+
+
+@pytest.mark.parametrize('sql, tables', [
+    ("INSERT INTO account (id) VALUES ($1)", ('account', )),
+    ("insert into Public.Account (id) values ($1)", ('public.account', 'account')),
+    ('UPDATE "Account" SET x = 1', ('Account', )),
+    ("DELETE FROM ONLY post WHERE id = $1", ('post', )),
+    ("TRUNCATE TABLE post", ('post', )),
+    ("MERGE INTO account USING staging ON true WHEN MATCHED THEN DO NOTHING", ('account', )),
+    ("WITH moved AS (DELETE FROM a RETURNING *) INSERT INTO b SELECT * FROM moved", ('a', 'b')),
+    ("SELECT * FROM account FOR UPDATE", ()),
+    ("SELECT * FROM account FOR NO KEY UPDATE", ()),
+    ("INSERT INTO account (id) VALUES ($1) ON CONFLICT (id) DO UPDATE SET id = 1", ('account', )),
+    ("SELECT 'INSERT INTO account' -- UPDATE post\n", ()),
+    ("/* DELETE FROM account */ SELECT 1", ()),
+])
+def test_written_tables(sql, tables):
+    assert get_written_tables(sql) == tables
+
+
+@pytest.mark.parametrize('sql, tables', [
+    ("SELECT * FROM account WHERE id IN (1, 2)", ('account', )),
+    ("SELECT * FROM account a, post AS p, LATERAL f(a.id) WHERE true", ('account', 'post')),
+    ("SELECT * FROM generate_series(1, 3) g JOIN (SELECT 1 FROM comment) c ON true", ('comment', )),
+    ("SELECT * FROM account ORDER BY a, b", ('account', )),
+    ('SELECT * FROM "Post" LEFT JOIN s.comment USING (id)', ('Post', 's.comment', 'comment')),
+    ("SELECT 'FROM account'", ()),
+])
+def test_read_tables(sql, tables):
+    assert get_read_tables(sql) == tables
+
+
+class Conn:
+    def __init__(self, in_transaction: bool = False):
+        self.in_transaction = in_transaction
+
+
+class Contract:
+    def is_in_transaction(self, conn: Conn) -> bool:
+        return conn.in_transaction
+
+
+def test_reads_inside_of_a_transaction_are_not_cached():
+    registry = ResultCacheRegistry(Contract())
+    cache = registry.create('accounts', CachePolicy(tags=('account', )))
+    conn = Conn()
+    transaction = Conn(in_transaction=True)
+
+    assert cache.fetch_sync(lambda c, p: 'committed', conn, (1, )) == 'committed'
+    # neither served the committed result, nor cached its own, maybe rolled back later
+    assert cache.fetch_sync(lambda c, p: 'uncommitted', transaction, (1, )) == 'uncommitted'
+    assert cache.fetch_sync(lambda c, p: 'x', conn, (1, )) == 'committed'
+    cache.invalidate()
+    cache.fetch_sync(lambda c, p: 'uncommitted', transaction, (1, ))
+    assert len(cache) == 0
+
+
+def test_writes_inside_of_a_transaction_are_invalidated_again_after_it():
+    registry = ResultCacheRegistry(Contract())
+    cache = registry.create('accounts', CachePolicy(tags=('account', )))
+    conn = Conn()
+    writer = Conn(in_transaction=True)
+
+    cache.fetch_sync(lambda c, p: 'old', conn, (1, ))
+    registry.invalidate(['account'], writer)
+    assert len(cache) == 0
+    # the write is not committed yet: everyone else still reads the old data, which gets cached
+    assert cache.fetch_sync(lambda c, p: 'old', conn, (1, )) == 'old'
+    assert cache.fetch_sync(lambda c, p: 'x', conn, (1, )) == 'old'
+
+    writer.in_transaction = False
+    assert cache.fetch_sync(lambda c, p: 'new', conn, (1, )) == 'new'
+    assert cache.fetch_sync(lambda c, p: 'x', conn, (1, )) == 'new'
+    assert cache.stats.invalidations == 2
+
+
+def test_writes_outside_of_a_transaction_are_invalidated_once():
+    registry = ResultCacheRegistry(Contract())
+    cache = registry.create('accounts', CachePolicy(tags=('account', )))
+    conn = Conn()
+    cache.fetch_sync(lambda c, p: 'old', conn, (1, ))
+    registry.invalidate(['account'], conn)
+    cache.fetch_sync(lambda c, p: 'new', conn, (1, ))
+    assert cache.fetch_sync(lambda c, p: 'x', conn, (1, )) == 'new'
+    assert cache.stats.invalidations == 1
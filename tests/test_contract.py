@@ -0,0 +1,55 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from querky.backends.postgresql.asyncpg.contract import AsyncpgContract
+from querky.contract import Contract
+
+
+class Conn:
+    def __init__(self):
+        self.log = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self.log.append('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self.log.append('ROLLBACK')
+            raise
+        self.log.append('COMMIT')
+
+
+def test_connection_is_acquired_inside_of_a_transaction():
+    contract = AsyncpgContract(type_mapper=None)
+    conn = Conn()
+
+    async def main():
+        async with contract.acquire_connection(conn, transaction=True) as acquired:
+            assert acquired is conn
+            conn.log.append('query')
+        async with contract.acquire_connection(conn) as acquired:
+            assert acquired is conn
+
+    asyncio.run(main())
+    assert conn.log == ['BEGIN', 'query', 'COMMIT']
+
+
+def test_transaction_is_rolled_back_on_error():
+    contract = AsyncpgContract(type_mapper=None)
+    conn = Conn()
+
+    async def main():
+        async with contract.acquire_connection(conn, transaction=True):
+            raise ValueError()
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    assert conn.log == ['BEGIN', 'ROLLBACK']
+
+
+def test_contracts_without_transactions_refuse_them():
+    with pytest.raises(NotImplementedError):
+        Contract.acquire_connection(AsyncpgContract(type_mapper=None), Conn(), transaction=True)
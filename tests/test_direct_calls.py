@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from querky.backends.postgresql.asyncpg import PreparedStatementCache
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query(shape='value')
+def get_username(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(shape='column')
+def list_usernames():
+    return "SELECT username FROM account"
+
+
+@qrk.query('Account', shape='one')
+def get_account(account_id):
+    return f"SELECT id, username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(get_account, shape='many')
+def list_accounts():
+    return "SELECT id, username FROM account"
+
+
+@qrk.query(shape='value', cache=True)
+def count_accounts():
+    return "SELECT count(*) FROM account"
+
+
+@qrk.query(shape='value', direct=False)
+def get_username_indirectly(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id} "
+'''
+
+DESCRIPTIONS = {
+    "SELECT username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "SELECT username FROM account WHERE id = $1 ": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "SELECT username FROM account": QueryDescription((), (('username', TEXT), )),
+    "SELECT id, username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('id', BIGINT), ('username', TEXT))),
+    "SELECT id, username FROM account": QueryDescription((), (('id', BIGINT), ('username', TEXT))),
+    "SELECT count(*) FROM account": QueryDescription((), (('count', BIGINT), )),
+}
+
+ROWS = {
+    "SELECT username FROM account WHERE id = $1": [('bob', )],
+    "SELECT username FROM account": [('bob', ), ('alice', )],
+    "SELECT id, username FROM account": [(1, 'bob'), (2, 'alice')],
+    "SELECT count(*) FROM account": [(2, )],
+}
+
+
+def call(function, *args, rows=None):
+    conn = Conn(DESCRIPTIONS, ROWS if rows is None else rows)
+    return asyncio.run(function(conn, *args)), conn.log
+
+
+def get_source(module) -> str:
+    with open(module.__file__, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('standalone', [False, True])
+def test_direct_calls_call_the_driver(generate, tmp_path, standalone):
+    qrk = use_preset(str(tmp_path), direct_calls=True, standalone=standalone)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    source = get_source(module)
+
+    assert "return await __conn.fetchval(_q0_sql, account_id)" in source
+    assert "return [__row[0] for __row in await __conn.fetch(_q1_sql)]" in source
+    assert "return _q3_rows_factory(await __conn.fetch(_q3_sql))" in source
+    assert call(module.get_username, 1) == ('bob', [('fetchval', "SELECT username FROM account WHERE id = $1", (1, ))])
+    assert call(module.list_usernames)[0] == ['bob', 'alice']
+    assert call(module.list_accounts)[0] == [{'id': 1, 'username': 'bob'}, {'id': 2, 'username': 'alice'}]
+
+
+@pytest.mark.parametrize('direct_calls', [False, True])
+def test_direct_calls_return_the_same(generate, tmp_path, direct_calls):
+    qrk = use_preset(str(tmp_path), type_factory='dataclass', direct_calls=direct_calls)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    assert ("__conn.fetchrow(" in get_source(module)) is direct_calls
+    rows = {"SELECT id, username FROM account WHERE id = $1": [(1, 'bob')]}
+    account, _ = call(module.get_account, 1, rows=rows)
+    assert (account.id, account.username) == (1, 'bob')
+    # a missing row is not passed to the row factory
+    assert call(module.get_account, 2, rows={}) == (None, [
+        ('fetchrow', "SELECT id, username FROM account WHERE id = $1", (2, ))
+    ])
+    assert [account.username for account in call(module.list_accounts)[0]] == ['bob', 'alice']
+
+
+def test_queries_with_layers_are_not_called_directly(generate, tmp_path):
+    qrk = use_preset(str(tmp_path), direct_calls=True)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    source = get_source(module)
+
+    assert "return await _q4.execute(__conn" in source
+    assert "return await _q5.execute(__conn, account_id)" in source
+    assert call(module.count_accounts)[0] == 2
+    # served from the cache
+    assert call(module.count_accounts) == (2, [])
+
+
+@pytest.mark.parametrize('options', [
+    dict(metrics=True),
+    dict(statement_cache=PreparedStatementCache()),
+])
+def test_direct_calls_are_not_generated(generate, tmp_path, options):
+    qrk = use_preset(str(tmp_path), direct_calls=True, **options)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    assert "__conn.fetch" not in get_source(module)
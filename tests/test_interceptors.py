@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query(shape='value')
+def get_username(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(shape='status')
+def delete_account(account_id):
+    return f"DELETE FROM account WHERE id = {+account_id}"
+'''
+
+DESCRIPTIONS = {
+    "SELECT username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "DELETE FROM account WHERE id = $1": QueryDescription((BIGINT, ), ()),
+}
+
+ROWS = {
+    "SELECT username FROM account WHERE id = $1": [('bob', )],
+}
+
+
+class FailingConn(Conn):
+    async def fetchval(self, sql, *args):
+        raise RuntimeError("connection lost")
+
+
+def test_callbacks_are_composed_in_and_out(generate, tmp_path):
+    qrk = use_preset(str(tmp_path))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    query = module._q0
+
+    # nothing to wrap: the contract is called right away
+    assert query._execute is None
+    # invalidates the cached results of `account`, so it is wrapped anyway
+    invalidating = module._q1._execute
+    qrk.interceptors.on('before', 'log', lambda query, params: None)
+    assert query._execute is not None
+    assert module._q1._execute is not invalidating
+    qrk.interceptors.off('before', 'log')
+    assert query._execute is None
+    assert module._q1._execute.__name__ == invalidating.__name__
+
+
+def test_callbacks_are_run_around_the_query(generate, tmp_path):
+    qrk = use_preset(str(tmp_path))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    events = []
+
+    async def before(query, params):
+        events.append(('before', query.unique_name.rsplit(':', 1)[-1], params))
+
+    qrk.interceptors.on('before', 'first', before, priority=10)
+    qrk.interceptors.on('before', 'second', lambda query, params: events.append(('second', )))
+    qrk.interceptors.on('after', 'log', lambda query, params, result: events.append(('after', result)))
+    qrk.interceptors.on('error', 'log', lambda query, params, ex: events.append(('error', str(ex))))
+
+    conn = Conn(DESCRIPTIONS, ROWS)
+    assert asyncio.run(module.get_username(conn, 1)) == 'bob'
+    # highest priority first
+    assert events == [('before', 'get_username', (1, )), ('second', ), ('after', 'bob')]
+
+    events.clear()
+    with pytest.raises(RuntimeError):
+        asyncio.run(module.get_username(FailingConn(DESCRIPTIONS), 2))
+    assert events == [('before', 'get_username', (2, )), ('second', ), ('error', 'connection lost')]
+
+
+def test_only_critical_callbacks_fail_the_query(generate, tmp_path, caplog):
+    qrk = use_preset(str(tmp_path))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    def broken(query, params, result):
+        raise ValueError("broken callback")
+
+    qrk.interceptors.on('after', 'broken', broken)
+    conn = Conn(DESCRIPTIONS, ROWS)
+    with caplog.at_level(logging.ERROR, logger='querky'):
+        assert asyncio.run(module.get_username(conn, 1)) == 'bob'
+    assert "after callback (broken)" in caplog.text
+
+    qrk.interceptors.on('after', 'broken', broken, on_conflict='replace', critical=True)
+    with pytest.raises(ValueError):
+        asyncio.run(module.get_username(conn, 1))
+
+
+def test_direct_calls_are_warned_about_once(generate, tmp_path, caplog):
+    qrk = use_preset(str(tmp_path), direct_calls=True)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    events = []
+
+    with caplog.at_level(logging.WARNING, logger='querky'):
+        qrk.interceptors.on('before', 'first', lambda query, params: events.append('first'))
+        qrk.interceptors.on('before', 'second', lambda query, params: events.append('second'))
+    warnings = [record for record in caplog.records if "direct calls" in record.getMessage()]
+    assert len(warnings) == 1
+    assert "get_username" in warnings[0].getMessage()
+
+    # the generated function never gets to the query
+    assert asyncio.run(module.get_username(Conn(DESCRIPTIONS, ROWS), 1)) == 'bob'
+    assert events == []
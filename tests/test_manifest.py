@@ -0,0 +1,132 @@
+import sys
+import types
+
+import pytest
+
+import querky
+from querky import Querky
+from querky.manifest import GenerationManifest, get_imported_module_names, hash_config
+
+
+def make_module(name: str, filepath) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__file__ = str(filepath)
+    module.__package__ = ''
+    return module
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """
+    `source.py` imports `dependency.py`, and is generated into `source_queries.py`.
+    """
+    (tmp_path / 'dependency.py').write_text("VALUE = 1\n")
+    (tmp_path / 'source.py').write_text("import dependency\n")
+    (tmp_path / 'source_queries.py').write_text("# generated\n")
+    monkeypatch.setitem(sys.modules, 'dependency', make_module('dependency', tmp_path / 'dependency.py'))
+    return tmp_path
+
+
+def record(project, fingerprint: str = 'schema', config_hash: str = 'config') -> GenerationManifest:
+    manifest = GenerationManifest(str(project / '.querky_manifest.json'))
+    manifest.load(fingerprint, config_hash)
+    manifest.record(make_module('source', project / 'source.py'), str(project / 'source_queries.py'))
+    manifest.save()
+    return manifest
+
+
+def is_fresh(project, fingerprint: str | None = 'schema', config_hash: str = 'config') -> bool:
+    manifest = GenerationManifest(str(project / '.querky_manifest.json'))
+    manifest.load(fingerprint, config_hash)
+    return manifest.is_fresh(str(project / 'source.py'))
+
+
+def test_unchanged_module_is_fresh(project):
+    manifest = record(project)
+    assert manifest.modules['source.py']['dependencies'] == {
+        'dependency.py': manifest._hash('dependency.py')
+    }
+    assert is_fresh(project)
+
+
+def test_unknown_module_is_stale(project):
+    assert not is_fresh(project)
+
+
+def test_nothing_is_fresh_without_a_fingerprint(project):
+    record(project)
+    assert not is_fresh(project, None)
+
+
+def test_changed_schema_makes_module_stale(project):
+    record(project)
+    assert not is_fresh(project, 'another schema')
+
+
+def test_changed_config_makes_module_stale(project):
+    record(project)
+    assert not is_fresh(project, config_hash='another config')
+
+
+def test_config_hash_depends_on_the_querky_version(monkeypatch):
+    config_hash = hash_config({'indent': '    '})
+    assert hash_config({'indent': '    '}) == config_hash
+    assert hash_config({'indent': '\t'}) != config_hash
+    monkeypatch.setattr(querky, '__version__', '0.0.0')
+    assert hash_config({'indent': '    '}) != config_hash
+
+
+def test_querky_config_hash():
+    def type_factory(query, name):
+        pass
+
+    config_hash = Querky(type_factory=type_factory).get_config_hash()
+    # objects are described by what they are, not where they are in memory
+    assert Querky(type_factory=type_factory).get_config_hash() == config_hash
+    assert Querky(type_factory=type_factory, direct_calls=True).get_config_hash() != config_hash
+    assert Querky(type_factory=type_factory, metrics=True).get_config_hash() != config_hash
+    assert Querky(type_factory=type_factory, subdir='generated').get_config_hash() != config_hash
+    assert Querky(type_factory=lambda query, name: None).get_config_hash() != config_hash
+
+
+@pytest.mark.parametrize('filename', ['source.py', 'dependency.py', 'source_queries.py'])
+def test_changed_file_makes_module_stale(project, filename):
+    record(project)
+    with open(project / filename, 'a') as f:
+        f.write("# changed\n")
+    assert not is_fresh(project)
+
+
+def test_deleted_output_makes_module_stale(project):
+    record(project)
+    (project / 'source_queries.py').unlink()
+    assert not is_fresh(project)
+
+
+def test_deleted_source_is_forgotten(project):
+    record(project)
+    (project / 'source.py').unlink()
+    manifest = GenerationManifest(str(project / '.querky_manifest.json'))
+    manifest.load('schema')
+    manifest.save()
+    manifest.load('schema')
+    assert manifest.modules == {}
+
+
+def test_imported_module_names(tmp_path):
+    filepath = tmp_path / 'module.py'
+    filepath.write_text(
+        "import os.path\n"
+        "from . import sibling\n"
+        "from ..parent import thing\n"
+        "from package.sub import name\n"
+    )
+    names = get_imported_module_names(str(filepath), 'package.sub')
+    assert {
+        'os.path',
+        'package.sub',
+        'package.sub.sibling',
+        'package.parent',
+        'package.parent.thing',
+        'package.sub.name'
+    } <= names
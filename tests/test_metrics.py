@@ -0,0 +1,180 @@
+import asyncio
+import threading
+from contextlib import aclosing
+from dataclasses import dataclass
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.metrics import QueryMetrics, estimate_row_size, measure_result
+from querky.presets.asyncpg import use_preset
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query(shape='value')
+def get_username(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query('Account', shape='many')
+def list_accounts():
+    return "SELECT id, username FROM account"
+
+
+@qrk.query(shape='status')
+def delete_account(account_id):
+    return f"DELETE FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(shape='stream')
+def stream_usernames():
+    return "SELECT username FROM account"
+'''
+
+DESCRIPTIONS = {
+    "SELECT username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "SELECT id, username FROM account": QueryDescription((), (('id', BIGINT), ('username', TEXT))),
+    "DELETE FROM account WHERE id = $1": QueryDescription((BIGINT, ), ()),
+    "SELECT username FROM account": QueryDescription((), (('username', TEXT), )),
+}
+
+ROWS = {
+    "SELECT username FROM account WHERE id = $1": [('bob', )],
+    "SELECT id, username FROM account": [(1, 'bob'), (2, 'alice')],
+    "SELECT username FROM account": [('bob', ), ('alice', ), ('carol', )],
+}
+
+
+class FailingConn(Conn):
+    async def fetchval(self, sql, *args):
+        raise RuntimeError("connection lost")
+
+
+@dataclass(slots=True)
+class Account:
+    id: int
+    username: str
+
+
+def test_row_sizes_are_estimated_from_the_data():
+    assert estimate_row_size(None) == 0
+    assert estimate_row_size('bob') == 3
+    assert estimate_row_size(Account(1, 'bob')) == 8 + 3
+    assert estimate_row_size({'id': 1, 'tags': ['a', 'bc']}) == 8 + 3
+    # only the first row of a list is measured
+    assert measure_result('many', [Account(1, 'bob'), Account(2, 'alice')]) == (2, 2 * 11)
+    assert measure_result('one', Account(1, 'bob')) == (1, 11)
+    assert measure_result('one', None) == (0, 0)
+    assert measure_result('status', 'DELETE 1') == (0, 0)
+    assert measure_result('column', []) == (0, 0)
+
+
+def test_calls_are_accumulated_into_histograms():
+    metrics = QueryMetrics(buckets=(0.1, 0.01, 1.0))
+    assert metrics.buckets == (0.01, 0.1, 1.0)
+
+    metrics.record('q', 'many', 0.005, rows=2, size=20)
+    metrics.record('q', 'many', 0.01, rows=3, size=30)
+    metrics.record('q', 'many', 0.5)
+    metrics.record_error('q', 'many', 2.0)
+
+    stat = metrics.snapshot()['q']
+    assert (stat.shape, stat.calls, stat.errors, stat.rows, stat.bytes) == ('many', 4, 1, 5, 50)
+    assert stat.seconds == pytest.approx(2.515)
+    # upper bounds are inclusive, the last bucket is +Inf
+    assert stat.buckets == [2, 0, 1, 1]
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
+
+
+def test_threads_are_summed_up_on_read():
+    metrics = QueryMetrics()
+
+    def work():
+        for _ in range(100):
+            metrics.record('q', 'value', 0.001, rows=1, size=8)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.record('q', 'value', 0.001, rows=1, size=8)
+
+    stat = metrics.snapshot()['q']
+    assert (stat.calls, stat.rows, stat.bytes) == (401, 401, 401 * 8)
+    assert sum(stat.buckets) == 401
+
+
+def test_prometheus_output():
+    metrics = QueryMetrics(buckets=(0.01, 0.1))
+    metrics.record('get "x"', 'value', 0.005, rows=1, size=8)
+    metrics.record('get "x"', 'value', 0.05, rows=1, size=8)
+    metrics.record_error('get "x"', 'value', 1.0)
+    labels = 'query="get \\"x\\"",shape="value"'
+
+    lines = metrics.to_prometheus(prefix='app').splitlines()
+    assert lines[:2] == [
+        "# HELP app_query_duration_seconds Query execution time.",
+        "# TYPE app_query_duration_seconds histogram",
+    ]
+    # buckets are cumulative
+    assert f'app_query_duration_seconds_bucket{{{labels},le="0.01"}} 1' in lines
+    assert f'app_query_duration_seconds_bucket{{{labels},le="0.1"}} 2' in lines
+    assert f'app_query_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'app_query_duration_seconds_count{{{labels}}} 3' in lines
+    assert f'app_query_duration_seconds_sum{{{labels}}} {0.005 + 0.05 + 1.0!r}' in lines
+    assert "# TYPE app_query_calls_total counter" in lines
+    assert f'app_query_calls_total{{{labels}}} 3' in lines
+    assert f'app_query_errors_total{{{labels}}} 1' in lines
+    assert f'app_query_rows_total{{{labels}}} 2' in lines
+    assert f'app_query_result_bytes_total{{{labels}}} 16' in lines
+
+
+def test_prometheus_file_is_replaced(tmp_path):
+    metrics = QueryMetrics()
+    metrics.record('q', 'value', 0.001)
+    filename = tmp_path / 'querky.prom'
+    filename.write_text('stale')
+
+    metrics.write_prometheus(str(filename))
+    assert filename.read_text(encoding='utf-8') == metrics.to_prometheus()
+    assert [path.name for path in tmp_path.iterdir()] == ['querky.prom']
+
+
+def test_generated_queries_are_measured(generate, tmp_path):
+    qrk = use_preset(str(tmp_path), metrics=True)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    async def main():
+        assert await module.get_username(conn, 1) == 'bob'
+        assert len(await module.list_accounts(conn)) == 2
+        await module.delete_account(conn, 1)
+        assert [row['username'] async for row in module.stream_usernames(conn)] == ['bob', 'alice', 'carol']
+        # stopped early: still recorded as a call
+        async with aclosing(module.stream_usernames(conn)) as rows:
+            async for _ in rows:
+                break
+        with pytest.raises(RuntimeError):
+            await module.get_username(FailingConn(DESCRIPTIONS), 1)
+
+    asyncio.run(main())
+    stats = qrk.metrics.snapshot()
+    by_name = {name.rsplit(':', 1)[-1]: stat for name, stat in stats.items()}
+
+    username = by_name['get_username']
+    assert (username.shape, username.calls, username.errors, username.rows, username.bytes) == ('value', 2, 1, 1, 3)
+    # labelled by the kind of the shape
+    accounts = by_name['list_accounts']
+    assert (accounts.shape, accounts.calls, accounts.rows, accounts.bytes) == ('all', 1, 2, 2 * (8 + 3))
+    delete = by_name['delete_account']
+    assert (delete.shape, delete.calls, delete.rows) == ('status', 1, 0)
+    stream = by_name['stream_usernames']
+    assert (stream.shape, stream.calls, stream.errors, stream.rows, stream.bytes) == ('stream', 2, 0, 4, 3 * 3 + 3)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from querky.presets.asyncpg import use_preset
+
+
+@pytest.fixture
+def qrk():
+    return use_preset(os.path.dirname(__file__))
+
+
+def in_bind_order(query, **values) -> tuple:
+    return tuple([values[param.name] for param in query.param_mapper.params])
+
+
+def test_binder_returns_arguments_in_placeholder_order(qrk):
+    @qrk.query(shape='status')
+    def update_account(account_id, phone_number, *, note='none', flag=None):
+        return (
+            f"UPDATE account SET note = {+note}, phone_number = {+phone_number}, flag = {+flag} "
+            f"WHERE id = {+account_id}"
+        )
+
+    assert update_account.sql == "UPDATE account SET note = $3, phone_number = $2, flag = $4 WHERE id = $1"
+    bind = update_account.param_mapper.compile_binder()
+    assert bind(1, '555', flag=True) == (1, '555', 'none', True)
+    assert bind(phone_number='555', account_id=1) == (1, '555', 'none', None)
+
+
+def test_binder_matches_map_params(qrk):
+    @qrk.query(shape='status')
+    def update_account(account_id, phone_number='000', *, note=None):
+        return f"UPDATE account SET phone_number = {+phone_number}, note = {+note} WHERE id = {+account_id}"
+
+    bind = update_account.param_mapper.compile_binder()
+    mapper = update_account.param_mapper
+    for args, kwargs in [
+        ((1, ), {}),
+        ((1, '555'), {}),
+        ((1, ), {'phone_number': '555'}),
+        ((), {'account_id': 1, 'note': 'hi'}),
+    ]:
+        assert tuple(bind(*args, **kwargs)) == tuple(mapper.map_params(*args, **kwargs))
+
+
+def test_binder_fills_in_defaults(qrk):
+    @qrk.query(shape='status')
+    def update_account(account_id, limit=10, *, tags=('a', 'b')):
+        return f"UPDATE account SET tags = {+tags} WHERE id = {+account_id} AND n < {+limit}"
+
+    bind = update_account.param_mapper.compile_binder()
+    assert bind(1) == in_bind_order(update_account, account_id=1, limit=10, tags=('a', 'b'))
+    assert bind(1, 5, tags=()) == in_bind_order(update_account, account_id=1, limit=5, tags=())
+
+
+def test_parameter_used_twice_is_bound_once(qrk):
+    @qrk.query(shape='value')
+    def echo(a):
+        return f"SELECT {+a} + {+a}"
+
+    assert echo.sql == "SELECT $1 + $1"
+    assert echo.param_mapper.compile_binder()(7) == (7, )
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    ((1, ), {}),
+    ((1, '2', '3'), {}),
+    ((1, '2'), {'unknown': 3}),
+    ((1, '2'), {'account_id': 1}),
+])
+def test_binder_rejects_wrong_arguments_like_the_function(qrk, args, kwargs):
+    @qrk.query(shape='status')
+    def update_account(account_id, phone_number):
+        return f"UPDATE account SET phone_number = {+phone_number} WHERE id = {+account_id}"
+
+    bind = update_account.param_mapper.compile_binder()
+    with pytest.raises(TypeError) as bound_error:
+        bind(*args, **kwargs)
+    with pytest.raises(TypeError) as called_error:
+        update_account.query(*args, **kwargs)
+    # the function itself is named by its qualified name
+    assert str(called_error.value).endswith(str(bound_error.value))
@@ -0,0 +1,89 @@
+import pytest
+
+from querky.plan_snapshots import PlanSnapshots, PlanSummary, hash_sql, summarize_plan
+
+
+SQL = "SELECT * FROM account WHERE username = $1"
+
+
+def summary(total_cost: float = 10.0, seq_scans=(), sql: str = SQL) -> PlanSummary:
+    return PlanSummary(
+        sql=hash_sql(sql),
+        total_cost=total_cost,
+        rows=1,
+        nodes=['Index Scan on public.account'],
+        seq_scans=list(seq_scans)
+    )
+
+
+def node(node_type: str, total_cost: float, relation: str | None = None, children=()) -> dict:
+    node = {
+        'Node Type': node_type,
+        'Total Cost': total_cost,
+        'Plan Rows': 1,
+    }
+    if relation is not None:
+        node['Relation Name'] = relation
+        node['Schema'] = 'public'
+    if children:
+        node['Plans'] = list(children)
+    return node
+
+
+def test_same_plan_has_not_regressed():
+    assert PlanSnapshots().compare(summary(), summary()) == []
+
+
+def test_cost_growing_by_up_to_the_threshold_has_not_regressed():
+    snapshots = PlanSnapshots(cost_threshold=2.0)
+    assert snapshots.compare(summary(10.0), summary(20.0)) == []
+    assert snapshots.compare(summary(10.0), summary(5.0)) == []
+
+
+def test_cost_growing_beyond_the_threshold_has_regressed():
+    reasons = PlanSnapshots(cost_threshold=2.0).compare(summary(10.0), summary(20.01))
+    assert reasons[0] == "estimated cost 10.0 -> 20.01"
+    # followed by the plans themselves
+    assert len(reasons) == 2
+
+
+def test_new_sequential_scan_has_regressed():
+    reasons = PlanSnapshots().compare(summary(), summary(seq_scans=['public.account']))
+    assert reasons[0] == "sequential scan on public.account"
+
+
+def test_known_sequential_scan_has_not_regressed():
+    stored = summary(seq_scans=['public.account'])
+    assert PlanSnapshots().compare(stored, summary(seq_scans=['public.account'])) == []
+
+
+def test_changed_query_is_not_compared():
+    changed = summary(1000.0, seq_scans=['public.account'], sql=SQL + " LIMIT 1")
+    assert PlanSnapshots().compare(summary(), changed) == []
+
+
+def test_zero_cost_plan_is_not_compared_by_cost():
+    assert PlanSnapshots().compare(summary(0.0), summary(100.0)) == []
+
+
+def test_cost_threshold_must_exceed_one():
+    with pytest.raises(ValueError):
+        PlanSnapshots(cost_threshold=1)
+
+
+def test_summary_keeps_only_large_sequentially_scanned_tables():
+    explained = [{'Plan': node('Hash Join', 120.456, children=[
+        node('Seq Scan', 50.0, 'account'),
+        node('Seq Scan', 20.0, 'country'),
+    ])}]
+    result = summarize_plan(
+        SQL,
+        explained,
+        {'public.account': 50_000, 'public.country': 200},
+        max_nodes=2,
+        large_table_rows=10_000
+    )
+    assert result.total_cost == 120.46
+    assert result.seq_scans == ['public.account']
+    assert result.nodes == ['Hash Join', 'Seq Scan on public.account']
+    assert result.sql == hash_sql(SQL)
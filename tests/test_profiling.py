@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+from querky.profiling import PHASES, QueryProfiler
+from querky import profiling
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query(shape='value')
+def get_username(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query('Account', shape='many')
+def list_accounts():
+    return "SELECT id, username FROM account"
+'''
+
+DESCRIPTIONS = {
+    "SELECT username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "SELECT id, username FROM account": QueryDescription((), (('id', BIGINT), ('username', TEXT))),
+}
+
+ROWS = {
+    "SELECT username FROM account WHERE id = $1": [('bob', )],
+    "SELECT id, username FROM account": [(1, 'bob'), (2, 'alice')],
+}
+
+
+class SlowConn(Conn):
+    async def fetchval(self, sql, *args):
+        await asyncio.sleep(0.02)
+        return await super().fetchval(sql, *args)
+
+
+def sample(wait: float = 0.0, decode: float = 0.0, row_factory: float = 0.0):
+    result = profiling._Sample()
+    result.wait, result.decode, result.row_factory = wait, decode, row_factory
+    return result
+
+
+@pytest.mark.parametrize('sample_rate', [0, -0.5, 1.5])
+def test_sample_rate_is_validated(sample_rate):
+    with pytest.raises(ValueError):
+        QueryProfiler(sample_rate)
+
+
+@pytest.mark.parametrize('sample_rate, interval', [(1, 1), (0.25, 4), (0.3, 3), (0.01, 100)])
+def test_interval_is_rounded(sample_rate, interval):
+    assert QueryProfiler(sample_rate).interval == interval
+
+
+def test_every_nth_call_is_sampled(generate, tmp_path):
+    profiler = QueryProfiler(0.25)
+    qrk = use_preset(str(tmp_path), profiler=profiler)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    async def main():
+        for _ in range(9):
+            assert await module.get_username(conn, 1) == 'bob'
+        assert [account['username'] for account in await module.list_accounts(conn)] == ['bob', 'alice']
+
+    asyncio.run(main())
+    stats = {name.rsplit(':', 1)[-1]: stat for name, stat in profiler.snapshot().items()}
+    # the 4th and the 8th calls
+    assert (stats['get_username'].shape, stats['get_username'].samples) == ('value', 2)
+    assert 'list_accounts' not in stats
+    assert len(conn.log) == 10
+
+
+def test_waiting_is_told_apart_from_python(generate, tmp_path):
+    profiler = QueryProfiler(1)
+    qrk = use_preset(str(tmp_path), profiler=profiler)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    assert asyncio.run(module.get_username(SlowConn(DESCRIPTIONS, ROWS), 1)) == 'bob'
+    [stats] = profiler.report()
+    assert stats.samples == 1
+    assert stats.wait >= 0.015
+    assert stats.database == stats.wait
+    assert stats.decode < stats.wait
+    assert stats.total == pytest.approx(sum([getattr(stats, phase) for phase in PHASES]))
+    assert stats.python_share < 0.5
+
+    profiler.reset()
+    assert profiler.report() == []
+
+
+def test_queries_are_ranked():
+    profiler = QueryProfiler(1)
+    busy = profiler.profile('busy', 'all')
+    waiting = profiler.profile('waiting', 'value')
+    profiler.record(busy, 0.001, 0.010, sample(wait=0.001, decode=0.004, row_factory=0.004))
+    profiler.record(busy, 0.001, 0.010, sample(wait=0.001, decode=0.004, row_factory=0.004))
+    profiler.record(waiting, 0.0, 0.095, sample(wait=0.090, decode=0.002))
+
+    [stats] = profiler.report(limit=1)
+    assert stats.name == 'busy'
+    assert stats.samples == 2
+    # elapsed time not spent in any of the measured phases
+    assert stats.mean('other') == pytest.approx(0.001)
+    assert stats.mean('python') == pytest.approx(0.010)
+    assert [s.name for s in profiler.report('database')] == ['waiting', 'busy']
+    assert [s.name for s in profiler.report('total')] == ['waiting', 'busy']
+    assert [s.name for s in profiler.report('python_share')] == ['busy', 'waiting']
+
+    lines = profiler.format_report().splitlines()
+    assert lines[0].split() == ['query', 'samples', *PHASES, 'python', 'database', 'python', '%']
+    assert lines[1].split()[:3] == ['busy', '2', '1.000']
+    assert lines[1].split()[-1] == '90.9'
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from querky.tools.query_folder import FoldArgs, FoldedQuery, question_mark
+
+
+SQL = "INSERT INTO account (id, username) VALUES {folded}"
+
+
+async def agen(items):
+    for item in items:
+        yield item
+
+
+def tuples(n: int) -> list:
+    return [(i, str(i)) for i in range(n)]
+
+
+def test_tuples_are_folded_into_placeholders():
+    query = FoldedQuery(SQL, tuple_len=2, batch_length=6)
+    queries, args = query(tuples(4))
+    assert queries == (
+        "INSERT INTO account (id, username) VALUES ($1,$2),($3,$4),($5,$6)",
+        "INSERT INTO account (id, username) VALUES ($1,$2)",
+    )
+    assert args == [[0, '0', 1, '1', 2, '2'], [3, '3']]
+
+
+def test_placeholders_and_templates():
+    fold_args = FoldArgs(2, '({}, lower({}))', placeholder=question_mark)
+    assert fold_args.fold(2) == ("(?, lower(?)),(?, lower(?))", )
+
+
+@pytest.mark.parametrize('n, pow2_buckets, expected', [
+    (13, False, (13, )),
+    (13, True, (8, 4, 1)),
+    (16, True, (16, )),
+    (37, False, (16, 16, 5)),
+    (37, True, (16, 16, 4, 1)),
+    (0, True, ()),
+])
+def test_batch_sizes(n, pow2_buckets, expected):
+    fold_args = FoldArgs(2, '({},{})', batch_length=32, pow2_buckets=pow2_buckets)
+    assert fold_args.batch_tuples(n) == expected
+
+
+def test_pow2_buckets_bound_the_number_of_statements():
+    query = FoldedQuery(SQL, tuple_len=2, batch_length=32, pow2_buckets=True, enable_cache=True)
+    statements = set()
+    for n in range(1, 100):
+        statements.update(query(tuples(n))[0])
+    # 16 tuples per batch: 16, 8, 4, 2 and 1
+    assert len(statements) == 5
+
+
+def test_batches_are_taken_lazily():
+    fold_args = FoldArgs(2, '({},{})', batch_length=4)
+    it = iter(tuples(5))
+    batches = fold_args.iter_batches(it)
+    assert next(batches) == (2, [0, '0', 1, '1'])
+    assert next(it) == (2, '2')
+
+
+def test_async_iterables():
+    query = FoldedQuery(SQL, tuple_len=2, batch_length=6, pow2_buckets=True)
+
+    async def main():
+        return [batch async for batch in query.abatches(agen(tuples(11)))]
+
+    assert asyncio.run(main()) == list(query.batches(tuples(11)))
+
+
+def test_caches_are_bounded():
+    fold_args = FoldArgs(2, '({},{})', batch_length=64, enable_cache=True, cache_size=4)
+    for n in range(1, 40):
+        fold_args.fold(n)
+    assert fold_args.fold.cache_info().currsize == 4
+    assert fold_args._cached_values.cache_info().currsize == 4
+    # the full batch is built once and kept outside of the caches
+    full = fold_args._create_values(32)
+    assert fold_args._create_values(32) is full
+    assert fold_args._cached_values.cache_info().currsize == 4
+
+
+def test_batch_sizes_are_cached():
+    fold_args = FoldArgs(2, '({},{})', enable_cache=True)
+    fold_args.batch_tuples(10)
+    fold_args.batch_tuples(10)
+    assert fold_args.batch_tuples.cache_info().hits == 1
+
+
+def test_nothing_is_kept_without_the_cache():
+    fold_args = FoldArgs(2, '({},{})')
+    for n in range(1, 10):
+        fold_args.fold(n)
+    assert fold_args.fold.cache_info().currsize == 1
+
+
+@pytest.mark.parametrize('batch', [[(1, 'a'), (2, )], [(1, 'a', 'b')]])
+def test_tuples_of_another_length_are_rejected(batch):
+    with pytest.raises(ValueError):
+        FoldArgs(2, '({},{})').args(batch)
+
+
+def test_tuple_must_fit_into_a_batch():
+    with pytest.raises(ValueError):
+        FoldArgs(3, '({},{},{})', batch_length=2)
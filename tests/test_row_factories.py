@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+from querky.type_constructors import DataclassConstructor
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query('Account', shape='one', batch=True)
+def get_account(account_id):
+    return f"SELECT id, username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(get_account, shape='many')
+def list_accounts():
+    return "SELECT id, username FROM account"
+'''
+
+DESCRIPTIONS = {
+    "SELECT id, username FROM account WHERE id = $1": QueryDescription((BIGINT, ), (('id', BIGINT), ('username', TEXT))),
+    "SELECT id, username FROM account": QueryDescription((), (('id', BIGINT), ('username', TEXT))),
+}
+
+ROWS = {
+    "SELECT id, username FROM account WHERE id = $1": [(1, 'bob')],
+    "SELECT id, username FROM account": [(1, 'bob'), (2, 'alice')],
+}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_dataclass_converters(generate, tmp_path):
+    qrk = use_preset(str(tmp_path), type_factory='dataclass+slots')
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    # the converters generated along with the type replace the ones of the preset
+    ctor = module._q0.shape.ctor
+    assert ctor.row_factory is module._Account_from_record
+    assert ctor.rows_factory is module._Account_from_records
+    assert module._q1.shape.ctor is ctor
+
+    assert run(module.get_account(conn, 1)) == module.Account(1, 'bob')
+    assert run(module.list_accounts(conn)) == [module.Account(1, 'bob'), module.Account(2, 'alice')]
+    assert run(module.get_account_many(conn, [(1, ), (1, )])) == [module.Account(1, 'bob')] * 2
+    assert run(module.get_account(Conn(DESCRIPTIONS), 2)) is None
+
+
+def test_typed_dict_converters(generate, tmp_path):
+    qrk = use_preset(str(tmp_path), type_factory='typed_dict')
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    with open(module.__file__, encoding='utf-8') as f:
+        source = f.read()
+    assert "return {'id': __record[0], 'username': __record[1]}" in source
+    assert run(module.list_accounts(conn)) == [{'id': 1, 'username': 'bob'}, {'id': 2, 'username': 'alice'}]
+    assert run(module.get_account(conn, 1)) == {'id': 1, 'username': 'bob'}
+
+
+def test_keyword_only_dataclass_converters(generate, tmp_path):
+    def type_factory(query, typename):
+        return DataclassConstructor(query, typename, row_factory=None, generate_row_factory=True, kw_only=True)
+
+    qrk = use_preset(str(tmp_path), type_factory=type_factory)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    assert module._Account_from_record((1, 'bob')) == module.Account(id=1, username='bob')
+    assert run(module.list_accounts(Conn(DESCRIPTIONS, ROWS)))[1] == module.Account(id=2, username='alice')
+
+
+def test_records_are_returned_as_is_without_converters(generate, tmp_path):
+    qrk = use_preset(str(tmp_path), type_factory='fake_dict')
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    assert not hasattr(module, '_Account_from_record')
+    rows = run(module.list_accounts(Conn(DESCRIPTIONS, ROWS)))
+    assert [tuple(row) for row in rows] == ROWS["SELECT id, username FROM account"]
+    assert rows[0]['username'] == 'bob'
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from querky.single_flight import SingleFlight
+
+
+class FakeContract:
+    """
+    Just what `SingleFlight` needs of a contract.
+    """
+    def get_immutable_types(self) -> tuple:
+        return ()
+
+    def is_in_transaction(self, conn) -> bool:
+        return conn == 'in transaction'
+
+
+class Database:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self, conn, params):
+        self.calls += 1
+        await self.release.wait()
+        return [list(params)]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        tasks = [asyncio.create_task(flight.fetch(db.fetch, None, (1, ))) for _ in range(3)]
+        await settle()
+        db.release.set()
+        results = await asyncio.gather(*tasks)
+        return flight, db, results
+
+    flight, db, results = asyncio.run(main())
+    assert db.calls == 1
+    assert results == [[[1]]] * 3
+    # every caller gets its own copy
+    assert len({id(result) for result in results}) == 3
+    assert (flight.stats.executions, flight.stats.coalesced) == (1, 2)
+    assert len(flight) == 0
+
+
+def test_different_arguments_are_not_coalesced():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        db.release.set()
+        await asyncio.gather(flight.fetch(db.fetch, None, (1, )), flight.fetch(db.fetch, None, (2, )))
+        return db
+
+    assert asyncio.run(main()).calls == 2
+
+
+def test_calls_in_a_transaction_are_not_coalesced():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        tasks = [asyncio.create_task(flight.fetch(db.fetch, 'in transaction', (1, ))) for _ in range(2)]
+        await settle()
+        db.release.set()
+        await asyncio.gather(*tasks)
+        return db
+
+    assert asyncio.run(main()).calls == 2
+
+
+def test_leader_error_is_shared():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        release = asyncio.Event()
+
+        async def fail(conn, params):
+            await release.wait()
+            raise LookupError('gone')
+
+        tasks = [asyncio.create_task(flight.fetch(fail, None, (1, ))) for _ in range(2)]
+        await settle()
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True), flight
+
+    results, flight = asyncio.run(main())
+    assert [type(result) for result in results] == [LookupError, LookupError]
+    assert len(flight) == 0
+
+
+def test_follower_takes_over_from_cancelled_leader():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        leader = asyncio.create_task(flight.fetch(db.fetch, None, (1, )))
+        await settle()
+        followers = [asyncio.create_task(flight.fetch(db.fetch, None, (1, ))) for _ in range(2)]
+        await settle()
+
+        leader.cancel()
+        await settle()
+        db.release.set()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return flight, db, results
+
+    flight, db, results = asyncio.run(main())
+    assert results == [[[1]], [[1]]]
+    # the leader's execution and a single one taking over for both followers
+    assert db.calls == 2
+    assert len(flight) == 0
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        leader = asyncio.create_task(flight.fetch(db.fetch, None, (1, )))
+        await settle()
+        follower = asyncio.create_task(flight.fetch(db.fetch, None, (1, )))
+        await settle()
+
+        follower.cancel()
+        await settle()
+        db.release.set()
+        return await leader, follower.cancelled(), db
+
+    result, follower_cancelled, db = asyncio.run(main())
+    assert result == [[1]]
+    assert follower_cancelled
+    assert db.calls == 1
+
+
+def test_unhashable_arguments_are_not_coalesced():
+    async def main():
+        flight = SingleFlight(FakeContract())
+        db = Database()
+        db.release.set()
+        return await flight.fetch(db.fetch, None, ([1], )), db
+
+    result, db = asyncio.run(main())
+    assert result == [[[1]]]
+    assert db.calls == 1
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+from querky.slow_log import SlowQueryLog
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query(shape='value')
+def get_username(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id}"
+
+
+@qrk.query(shape='value', slow_threshold=False)
+def get_username_quietly(account_id):
+    return f"SELECT username FROM account WHERE id = {+account_id} "
+
+
+@qrk.query(shape='value', slow_threshold=10.0)
+def get_username_patiently(account_id):
+    return f"SELECT username FROM account WHERE  id = {+account_id}"
+'''
+
+SQL = "SELECT username FROM account WHERE id = $1"
+
+DESCRIPTIONS = {
+    SQL: QueryDescription((BIGINT, ), (('username', TEXT), )),
+    f"{SQL} ": QueryDescription((BIGINT, ), (('username', TEXT), )),
+    "SELECT username FROM account WHERE  id = $1": QueryDescription((BIGINT, ), (('username', TEXT), )),
+}
+
+ROWS = {
+    SQL: [('bob', )],
+    f"{SQL} ": [('bob', )],
+    "SELECT username FROM account WHERE  id = $1": [('bob', )],
+}
+
+PLAN = [{"Plan": {"Node Type": "Index Scan"}}]
+
+
+class SlowConn(Conn):
+    def __init__(self, *args, fail: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = fail
+
+    async def fetchval(self, sql, *args):
+        await asyncio.sleep(0.02)
+        if self.fail:
+            raise RuntimeError("statement timeout")
+        return await super().fetchval(sql, *args)
+
+
+class ExplainConn:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.log = []
+
+    async def fetchval(self, sql, *args):
+        self.log.append((sql, args))
+        if self.fail:
+            raise RuntimeError("permission denied")
+        # as returned without a codec for json
+        return json.dumps(PLAN)
+
+
+def short_name(entry) -> str:
+    return entry.unique_name.rsplit(':', 1)[-1]
+
+
+def test_thresholds():
+    slow_log = SlowQueryLog(0.5)
+    assert slow_log.get_threshold(None) == 0.5
+    assert slow_log.get_threshold(2.0) == 2.0
+    assert slow_log.get_threshold(False) is None
+    assert SlowQueryLog().get_threshold(None) is None
+
+
+def test_slow_queries_are_logged(generate, tmp_path, caplog):
+    qrk = use_preset(str(tmp_path), slow_query_log=0.01)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    async def main():
+        conn = SlowConn(DESCRIPTIONS, ROWS)
+        assert await module.get_username(conn, 1) == 'bob'
+        assert await module.get_username(Conn(DESCRIPTIONS, ROWS), 2) == 'bob'
+        assert await module.get_username_quietly(conn, 3) == 'bob'
+        assert await module.get_username_patiently(conn, 4) == 'bob'
+        with pytest.raises(RuntimeError):
+            await module.get_username(SlowConn(DESCRIPTIONS, ROWS, fail=True), 5)
+
+    with caplog.at_level(logging.WARNING, logger='querky'):
+        asyncio.run(main())
+    slow, failed = qrk.slow_query_log.recent
+    assert (short_name(slow), slow.sql, slow.params, slow.failed, slow.plan) == ('get_username', SQL, (1, ), False, None)
+    assert slow.seconds >= 0.01
+    assert (short_name(failed), failed.params, failed.failed) == ('get_username', (5, ), True)
+    assert "Slow query" in caplog.text
+    assert " (failed)" in caplog.text
+
+
+def test_parameters_are_redacted(generate, tmp_path, caplog):
+    def redact(query, params):
+        return ['***' for _ in params]
+
+    qrk = use_preset(str(tmp_path), slow_query_log=SlowQueryLog(0.01, redact=redact))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    with caplog.at_level(logging.WARNING, logger='querky'):
+        asyncio.run(module.get_username(SlowConn(DESCRIPTIONS, ROWS), 'secret'))
+    [entry] = qrk.slow_query_log.recent
+    assert entry.params == ['***']
+    assert 'secret' not in caplog.text
+
+
+def test_failed_redaction_hides_the_parameters(generate, tmp_path, caplog):
+    def redact(query, params):
+        raise ValueError("broken")
+
+    qrk = use_preset(str(tmp_path), slow_query_log=SlowQueryLog(0.01, redact=redact))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    with caplog.at_level(logging.WARNING, logger='querky'):
+        asyncio.run(module.get_username(SlowConn(DESCRIPTIONS, ROWS), 'secret'))
+    [entry] = qrk.slow_query_log.recent
+    assert entry.params == ('<redaction failed>', )
+    assert 'secret' not in caplog.text
+
+
+def test_plans_are_captured_at_most_once_per_interval(generate, tmp_path):
+    explain_db = ExplainConn()
+    slow_log = SlowQueryLog(0.01, explain_db=explain_db, explain_interval=60.0, redact=lambda query, params: ['***'])
+    qrk = use_preset(str(tmp_path), slow_query_log=slow_log)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    async def main():
+        conn = SlowConn(DESCRIPTIONS, ROWS)
+        await module.get_username(conn, 1)
+        await module.get_username(conn, 2)
+        await slow_log.wait()
+
+    asyncio.run(main())
+    first, second = slow_log.recent
+    # with the real parameters, not the redacted ones
+    assert explain_db.log == [(f"EXPLAIN (ANALYZE false, FORMAT JSON) {SQL}", (1, ))]
+    assert first.plan == PLAN
+    assert second.plan is None
+
+
+def test_failed_plans_are_only_logged(generate, tmp_path, caplog):
+    slow_log = SlowQueryLog(0.01, explain_db=ExplainConn(fail=True))
+    qrk = use_preset(str(tmp_path), slow_query_log=slow_log)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+
+    async def main():
+        assert await module.get_username(SlowConn(DESCRIPTIONS, ROWS), 1) == 'bob'
+        await slow_log.wait()
+
+    with caplog.at_level(logging.WARNING, logger='querky'):
+        asyncio.run(main())
+    [entry] = slow_log.recent
+    assert entry.plan is None
+    assert "Failed to capture the plan" in caplog.text
+
+
+def test_recent_entries_are_bounded():
+    class Query:
+        unique_name = 'q'
+        sql = SQL
+
+    slow_log = SlowQueryLog(0.01, keep=2)
+    for index in range(3):
+        slow_log.record(Query, (index, ), 0.5, explain=False)
+    assert [entry.params for entry in slow_log.recent] == [(1, ), (2, )]
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from asyncpg.pool import PoolConnectionProxy
+from asyncpg.prepared_stmt import PreparedStatement
+
+from querky.backends.postgresql.asyncpg import PreparedStatementCache
+from querky.backends.postgresql.asyncpg import statement_cache as statement_cache_module
+
+
+class FakeQuery:
+    def __init__(self, sql: str):
+        self.sql = sql
+
+
+class FakeState:
+    def attach(self):
+        pass
+
+    def detach(self):
+        pass
+
+
+class FakeStatement:
+    def __init__(self, conn, sql: str):
+        self.sql = sql
+        self._query = sql
+        self._state = FakeState()
+        self._con_release_ctr = conn._pool_release_ctr
+
+
+class FakeConnection:
+    def __init__(self):
+        self._pool_release_ctr = 0
+        self.prepared = []
+
+    def _set_proxy(self, proxy):
+        pass
+
+    def _maybe_gc_stmt(self, state):
+        pass
+
+    async def prepare(self, sql: str):
+        self.prepared.append(sql)
+        return FakeStatement(self, sql)
+
+
+def acquire(conn: FakeConnection) -> PoolConnectionProxy:
+    return PoolConnectionProxy(None, conn)
+
+
+def get(cache: PreparedStatementCache, conn: FakeConnection, query: FakeQuery):
+    return asyncio.run(cache.get(conn, query))
+
+
+def test_statements_are_prepared_once_per_connection():
+    cache = PreparedStatementCache(max_size=10)
+    query = FakeQuery("SELECT 1")
+    first, second = FakeConnection(), FakeConnection()
+
+    statement = get(cache, first, query)
+    assert get(cache, first, query) is statement
+    get(cache, second, query)
+
+    assert first.prepared == ["SELECT 1"]
+    assert second.prepared == ["SELECT 1"]
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (1, 2, 0)
+
+
+def test_least_recently_used_statement_is_evicted():
+    cache = PreparedStatementCache(max_size=2)
+    conn = FakeConnection()
+    a, b, c = FakeQuery("SELECT 'a'"), FakeQuery("SELECT 'b'"), FakeQuery("SELECT 'c'")
+
+    get(cache, conn, a)
+    get(cache, conn, b)
+    # `a` is now more recent than `b`
+    get(cache, conn, a)
+    get(cache, conn, c)
+
+    assert cache.size(conn) == 2
+    assert cache.stats.evictions == 1
+    get(cache, conn, a)
+    get(cache, conn, b)
+    assert conn.prepared == [a.sql, b.sql, c.sql, b.sql]
+
+
+def test_pinned_statements_are_never_evicted():
+    cache = PreparedStatementCache(max_size=1)
+    conn = FakeConnection()
+    hot, a, b = FakeQuery("SELECT 'hot'"), FakeQuery("SELECT 'a'"), FakeQuery("SELECT 'b'")
+    cache.pin(hot)
+
+    get(cache, conn, hot)
+    get(cache, conn, a)
+    get(cache, conn, b)
+    get(cache, conn, hot)
+
+    # pinned statements don't count towards `max_size`
+    assert cache.size(conn) == 2
+    assert conn.prepared.count(hot.sql) == 1
+    assert cache.stats.evictions == 1
+
+
+def test_pinning_moves_a_cached_statement():
+    cache = PreparedStatementCache(max_size=1)
+    conn = FakeConnection()
+    hot, other = FakeQuery("SELECT 'hot'"), FakeQuery("SELECT 'other'")
+
+    get(cache, conn, hot)
+    cache.pin(hot)
+    get(cache, conn, other)
+    get(cache, conn, hot)
+    assert conn.prepared == [hot.sql, other.sql]
+
+    # back into the LRU, which is already full
+    cache.unpin(hot)
+    assert cache.size(conn) == 1
+    assert cache.stats.evictions == 1
+
+
+def test_invalidated_statement_is_prepared_again():
+    cache = PreparedStatementCache()
+    conn = FakeConnection()
+    query = FakeQuery("SELECT 1")
+
+    get(cache, conn, query)
+    cache.invalidate(conn, query)
+    get(cache, conn, query)
+    assert conn.prepared == [query.sql, query.sql]
+    assert cache.stats.misses == 2
+
+
+def test_negative_max_size_is_rejected():
+    with pytest.raises(ValueError):
+        PreparedStatementCache(max_size=-1)
+
+
+def test_statements_outlive_the_acquisitions_of_a_pooled_connection():
+    cache = PreparedStatementCache()
+    conn = FakeConnection()
+    query = FakeQuery("SELECT 1")
+
+    statement = get(cache, acquire(conn), query)
+    assert get(cache, acquire(conn), query) is statement
+    # released back to the pool: the same server-side statement is wrapped for the next acquisition
+    conn._pool_release_ctr += 1
+    rewrapped = get(cache, acquire(conn), query)
+    assert isinstance(rewrapped, PreparedStatement)
+    assert rewrapped._state is statement._state
+    assert conn.prepared == [query.sql]
+    assert cache.size(acquire(conn)) == 1
+
+
+def test_pooled_connections_are_not_cached_without_the_internals(monkeypatch):
+    monkeypatch.setattr(statement_cache_module, 'CAN_REWRAP', False)
+    cache = PreparedStatementCache()
+    conn = FakeConnection()
+    query = FakeQuery("SELECT 1")
+
+    get(cache, acquire(conn), query)
+    get(cache, acquire(conn), query)
+    assert conn.prepared == [query.sql, query.sql]
+    assert cache.size(acquire(conn)) == 0
+    # plain connections don't take any internals
+    get(cache, conn, query)
+    get(cache, conn, query)
+    assert cache.size(conn) == 1
+    assert cache.stats.hits == 1
+
+
+def test_internals_are_there():
+    assert statement_cache_module.CAN_REWRAP
@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+import pytest
+
+from querky.base_types import QueryDescription
+from querky.presets.asyncpg import use_preset
+from querky.result_shape import AdaptivePrefetch, Prefetch
+from querky.runtime import RowStream
+
+from conftest import BIGINT, TEXT, Conn
+
+
+SOURCE = '''
+from querky_def import qrk
+
+
+@qrk.query('Account', shape='stream', prefetch=2)
+def export_accounts():
+    return "SELECT id, username FROM account"
+'''
+
+SQL = "SELECT id, username FROM account"
+
+DESCRIPTIONS = {
+    SQL: QueryDescription((), (('id', BIGINT), ('username', TEXT))),
+}
+
+ROWS = {
+    SQL: [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e')],
+}
+
+
+def collect(stream: RowStream, limit: int | None = None) -> list:
+    async def main():
+        rows = []
+        async with stream:
+            async for row in stream:
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        return rows
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('standalone', [False, True])
+def test_rows_are_fetched_in_chunks_inside_of_a_transaction(generate, tmp_path, standalone):
+    qrk = use_preset(str(tmp_path), standalone=standalone)
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    stream = module.export_accounts(conn)
+    assert isinstance(stream, RowStream)
+    assert collect(stream) == [{'id': i, 'username': name} for i, name in ROWS[SQL]]
+    assert conn.log == [
+        ('begin', ),
+        ('cursor', SQL, ()),
+        ('cursor.fetch', 2),
+        ('cursor.fetch', 2),
+        ('cursor.fetch', 2),
+        ('end', ),
+    ]
+
+
+def test_stream_stopped_early_is_closed_right_away(generate, tmp_path):
+    qrk = use_preset(str(tmp_path))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    assert len(collect(module.export_accounts(conn), limit=1)) == 1
+    # the transaction is over as soon as the block is left, the rest is never fetched
+    assert conn.log == [('begin', ), ('cursor', SQL, ()), ('cursor.fetch', 2), ('end', )]
+    assert not conn.is_in_transaction()
+
+
+def test_stream_takes_the_transaction_it_is_in(generate, tmp_path):
+    qrk = use_preset(str(tmp_path))
+    module = generate(qrk, SOURCE, DESCRIPTIONS)
+    conn = Conn(DESCRIPTIONS, ROWS)
+
+    async def main():
+        async with conn.transaction():
+            async with module.export_accounts(conn) as accounts:
+                return [account async for account in accounts]
+
+    assert len(asyncio.run(main())) == 5
+    assert [entry for entry in conn.log if entry[0] in ('begin', 'end')] == [('begin', ), ('end', )]
+
+
+def test_adaptive_prefetch_is_bounded():
+    prefetch = AdaptivePrefetch(10_000, initial=10, min_size=2, max_size=20)
+    iteration = prefetch.start()
+    assert iteration is not prefetch
+    assert iteration.next_size() == 10
+
+    iteration.observe([('x' * 10_000, )])
+    assert iteration.next_size() == 2
+    # row size is smoothed across the chunks
+    for _ in range(20):
+        iteration.observe([(1, )])
+    assert iteration.next_size() == 20
+    # every iteration starts over
+    assert prefetch.start().next_size() == 10
+
+
+def test_prefetch_sizes_are_validated():
+    with pytest.raises(ValueError):
+        AdaptivePrefetch(initial=5, min_size=10)
+    assert Prefetch(3).start().next_size() == 3
+
+
+@pytest.mark.parametrize('kwargs', [dict(cache=True), dict(coalesce=True), dict(batch=True)])
+def test_streams_reject_options_of_whole_results(kwargs):
+    qrk = use_preset(os.path.dirname(__file__))
+
+    with pytest.raises(ValueError):
+        @qrk.query('Account', shape='stream', **kwargs)
+        def export_accounts():
+            return "SELECT id, username FROM account"
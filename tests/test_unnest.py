@@ -0,0 +1,77 @@
+import asyncio
+import itertools
+
+import pytest
+
+from querky.tools.query_folder import UnnestArgs, UnnestQuery, question_mark
+
+
+SQL = "INSERT INTO account (id, username) SELECT * FROM {folded}"
+TUPLES = [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e')]
+
+
+async def agen(items):
+    for item in items:
+        yield item
+
+
+def test_columns_are_bound_as_arrays():
+    query = UnnestQuery(SQL, types=('int8', 'text'))
+    assert query.sql == "INSERT INTO account (id, username) SELECT * FROM unnest($1::int8[], $2::text[])"
+    assert UnnestArgs(('int8', 'text'), placeholder=question_mark).unnest == "unnest(?::int8[], ?::text[])"
+
+
+def test_tuples_are_transposed():
+    assert UnnestArgs(('int8', 'text')).args(TUPLES) == [[[1, 2, 3, 4, 5], ['a', 'b', 'c', 'd', 'e']]]
+
+
+def test_sql_is_the_same_for_any_batch():
+    query = UnnestQuery(SQL, types=('int8', 'text'), batch_size=2)
+    queries, args = query(TUPLES)
+    assert queries == (query.sql, ) * 3
+    assert args == [
+        [[1, 2], ['a', 'b']],
+        [[3, 4], ['c', 'd']],
+        [[5], ['e']],
+    ]
+
+
+def test_batches_are_taken_lazily():
+    tuples = iter(TUPLES)
+    batches = UnnestArgs(('int8', 'text'), batch_size=2).iter_batches(tuples)
+    assert next(batches) == [[1, 2], ['a', 'b']]
+    assert next(tuples) == (3, 'c')
+
+
+@pytest.mark.parametrize('batch_size', [None, 2])
+def test_async_iterables(batch_size):
+    query = UnnestQuery(SQL, types=('int8', 'text'), batch_size=batch_size)
+
+    async def main():
+        return [args async for _, args in query.abatches(agen(TUPLES))]
+
+    assert asyncio.run(main()) == query(TUPLES)[1]
+
+
+@pytest.mark.parametrize('batch_size', [None, 2])
+def test_nothing_to_bind(batch_size):
+    assert UnnestQuery(SQL, types=('int8', 'text'), batch_size=batch_size)([]) == ((), [])
+
+
+@pytest.mark.parametrize('tuples', [[(1, 'a'), (2, )], [(1, 'a', 'b')]])
+def test_tuples_of_another_length_are_rejected(tuples):
+    with pytest.raises(ValueError):
+        UnnestArgs(('int8', 'text')).args(tuples)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        UnnestArgs(())
+    with pytest.raises(ValueError):
+        UnnestArgs(('int8', ), batch_size=0)
+
+
+def test_generators_are_consumed_once():
+    counter = itertools.count()
+    tuples = ((next(counter), 'x') for _ in range(3))
+    assert UnnestArgs(('int8', 'text')).args(tuples) == [[[0, 1, 2], ['x', 'x', 'x']]]
@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from querky.backends.postgresql.asyncpg.contract import AsyncpgContract
+from querky.backends.postgresql.contract import MAX_IDENTIFIER_BYTES, STAGING_TABLE_PREFIX
+from querky.upsert import Upsert
+
+
+@pytest.fixture
+def contract():
+    return AsyncpgContract(type_mapper=None)
+
+
+class Conn:
+    def __init__(self):
+        self.log = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql):
+        self.log.append(sql)
+        return "INSERT 0 2"
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.log.append(('COPY', table, tuple(columns), list(records)))
+
+
+def test_staging_table_depends_on_the_columns(contract):
+    name = contract.get_staging_table_name('public.account', ('id', 'username'))
+    assert name.startswith(STAGING_TABLE_PREFIX + 'public_account_')
+    assert name == contract.get_staging_table_name('public.account', ('id', 'username'))
+    assert name != contract.get_staging_table_name('public.account', ('id', 'balance'))
+    assert name != contract.get_staging_table_name('account', ('id', 'username'))
+
+
+def test_staging_table_name_fits_an_identifier(contract):
+    for table in ('a' * 100, 'ю' * 100):
+        names = {contract.get_staging_table_name(table, columns) for columns in (('a', ), ('b', ))}
+        assert len(names) == 2
+        assert all(len(name.encode('utf-8')) <= MAX_IDENTIFIER_BYTES for name in names)
+
+
+def test_merge_sql(contract):
+    columns = ('id', 'username', 'balance')
+    stage = contract.get_staging_table_name('public.account', columns)
+    sql = contract.generate_merge_staging_table_sql('public.account', columns, Upsert(conflict=['id'], returning=True))
+    assert sql == (
+        f'INSERT INTO "public"."account" ("id", "username", "balance") '
+        f'SELECT DISTINCT ON ("id") "id", "username", "balance" FROM "{stage}" '
+        f'ORDER BY "id", ctid DESC '
+        f'ON CONFLICT ("id") DO UPDATE SET "username" = EXCLUDED."username", "balance" = EXCLUDED."balance" '
+        f'RETURNING "id"'
+    )
+    assert contract.generate_create_staging_table_sql('public.account', columns) == (
+        f'CREATE TEMP TABLE IF NOT EXISTS "{stage}" ON COMMIT DROP AS '
+        f'SELECT "id", "username", "balance" FROM "public"."account" WITH NO DATA'
+    )
+
+
+def test_upserts_of_other_columns_in_one_transaction_use_other_staging_tables(contract):
+    async def chunks(*rows):
+        yield list(rows)
+
+    async def main():
+        conn = Conn()
+        upsert = Upsert(conflict=['id'])
+        await contract.upsert_records(conn, None, 'account', ('id', 'username'), upsert, chunks((1, 'a')))
+        await contract.upsert_records(conn, None, 'account', ('id', 'balance'), upsert, chunks((1, 10)))
+        return conn.log
+
+    log = asyncio.run(main())
+    username = contract.get_staging_table_name('account', ('id', 'username'))
+    balance = contract.get_staging_table_name('account', ('id', 'balance'))
+    assert [entry[1] for entry in log if entry[0] == 'COPY'] == [username, balance]
+    creates = [entry for entry in log if isinstance(entry, str) and entry.startswith('CREATE')]
+    assert f'"{username}"' in creates[0] and '"username"' in creates[0]
+    assert f'"{balance}"' in creates[1] and '"balance"' in creates[1]
+    merges = [entry for entry in log if isinstance(entry, str) and entry.startswith('INSERT')]
+    assert f'FROM "{username}"' in merges[0]
+    assert f'FROM "{balance}"' in merges[1]